@@ -0,0 +1,203 @@
+"""
+Local stand-ins for the LINE Messaging API and the OpenAI chat API.
+
+Both run on ThreadingHTTPServer in a background thread and draw response
+latency and failures from a LatencyModel, so runs are reproducible under a
+fixed seed.
+"""
+import abc
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+CANNED_ANALYSIS = {
+    "food_items": [
+        {
+            "name": "雞腿便當",
+            "portion_size": "1份",
+            "calories": "750 kcal",
+            "macronutrients": {"carbs": "85g", "protein": "38g", "fat": "28g"},
+        },
+        {
+            "name": "燙青菜",
+            "portion_size": "1盤",
+            "calories": "60 kcal",
+            "macronutrients": {"carbs": "6g", "protein": "3g", "fat": "3g"},
+        },
+    ]
+}
+
+_CONTENT_RE = re.compile(r"^/v2/bot/message/([^/]+)/content$")
+
+
+@dataclass
+class LatencyModel:
+    """
+    Log-normal latency around ``median_ms`` plus a Bernoulli error rate.
+    """
+    median_ms: float = 0.0
+    sigma: float = 0.3
+    error_rate: float = 0.0
+    error_status: int = 500
+    seed: Optional[int] = None
+    _rng: random.Random = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    def draw(self) -> tuple:
+        """
+        (delay_seconds, error_status or None) for one request.
+        """
+        with self._lock:
+            delay = self._rng.lognormvariate(0, self.sigma) * self.median_ms / 1000 if self.median_ms > 0 else 0.0
+            failed = self._rng.random() < self.error_rate
+        return delay, (self.error_status if failed else None)
+
+
+def make_image_pool(count: int, size: tuple = (640, 480), seed: int = 0) -> List[bytes]:
+    """
+    Distinct noise JPEGs; distinct enough that the near-duplicate cache treats them as different photos.
+    """
+    rng = np.random.default_rng(seed)
+    pool = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, size=(size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+        image = Image.fromarray(pixels).resize(size, Image.Resampling.BILINEAR)
+        buf = BytesIO()
+        image.save(buf, format="JPEG", quality=85)
+        pool.append(buf.getvalue())
+    return pool
+
+
+class _FakeServer(abc.ABC):
+    def __init__(self, latency: LatencyModel, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = self.rfile.read(length) if length else b""
+                delay, error = fake.latency.draw()
+                if delay:
+                    time.sleep(delay)
+                if error:
+                    fake._count("errors")
+                    self._send(error, json.dumps({"error": {"message": "injected failure", "type": "server_error"}}).encode())
+                    return
+                status, body, content_type = fake.respond(method, self.path, payload)
+                self._send(status, body, content_type)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        return Handler
+
+    @abc.abstractmethod
+    def respond(self, method: str, path: str, payload: bytes) -> tuple:
+        """
+        (status, body, content_type) for a request that passed latency and failure injection.
+        """
+
+    def start(self) -> "_FakeServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeLineAPI(_FakeServer):
+    """
+    Serves message content from an image pool and records reply/push
+    arrival times, keyed by reply token or push target.
+    """
+
+    def __init__(self, images: List[bytes], latency: Optional[LatencyModel] = None, **kwargs):
+        super().__init__(latency or LatencyModel(), **kwargs)
+        self.images = images
+        self.delivered: Dict[str, float] = {}
+
+    def respond(self, method: str, path: str, payload: bytes) -> tuple:
+        match = _CONTENT_RE.match(path)
+        if method == "GET" and match:
+            self._count("content")
+            image = self.images[zlib.crc32(match.group(1).encode()) % len(self.images)]
+            return 200, image, "image/jpeg"
+        if method == "POST" and path in ("/v2/bot/message/reply", "/v2/bot/message/push"):
+            kind = path.rsplit("/", 1)[-1]
+            self._count(kind)
+            body = json.loads(payload or b"{}")
+            key = body.get("replyToken") or body.get("to") or ""
+            with self._lock:
+                self.delivered.setdefault(key, time.perf_counter())
+            return 200, b"{}", "application/json"
+        return 404, b'{"message": "not found"}', "application/json"
+
+
+class FakeOpenAI(_FakeServer):
+    """
+    Chat completions endpoint returning canned NutritionAnalysis JSON with usage.
+    """
+
+    def __init__(self, analysis: Optional[dict] = None, latency: Optional[LatencyModel] = None, **kwargs):
+        super().__init__(latency or LatencyModel(), **kwargs)
+        self.content = json.dumps(analysis or CANNED_ANALYSIS, ensure_ascii=False)
+
+    def respond(self, method: str, path: str, payload: bytes) -> tuple:
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return 404, b'{"error": {"message": "not found"}}', "application/json"
+        self._count("completions")
+        request = json.loads(payload or b"{}")
+        body = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": self.content}}
+            ],
+            "usage": {"prompt_tokens": 900, "completion_tokens": 120, "total_tokens": 1020},
+        }
+        return 200, json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json"
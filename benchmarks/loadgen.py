@@ -0,0 +1,109 @@
+"""
+Open-loop webhook load generator.
+
+Batches are scheduled at a fixed rate regardless of how fast the server
+answers, so a slow server shows up as latency instead of silently lowering
+the offered load.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+
+def sign(channel_secret: str, body: bytes) -> str:
+    """
+    X-Line-Signature value: base64 HMAC-SHA256 of the raw body.
+    """
+    digest = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def image_event(user_id: str, message_id: str, reply_token: str, timestamp_ms: Optional[int] = None) -> dict:
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": timestamp_ms if timestamp_ms is not None else int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex,
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": reply_token,
+        "message": {"type": "image", "id": message_id, "contentProvider": {"type": "line"}},
+    }
+
+
+def webhook_body(events: List[dict], destination: str = "Ubench") -> bytes:
+    return json.dumps({"destination": destination, "events": events}, separators=(",", ":")).encode("utf-8")
+
+
+@dataclass
+class LoadResult:
+    sent_events: int = 0
+    failed_batches: int = 0
+    duration: float = 0.0
+    ack_latencies: List[float] = field(default_factory=list)
+    # reply token -> perf_counter() when its batch was sent
+    sent_at: Dict[str, float] = field(default_factory=dict)
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+
+async def _post(client: httpx.AsyncClient, url: str, secret: str, events: List[dict], result: LoadResult) -> None:
+    body = webhook_body(events)
+    started = time.perf_counter()
+    for event in events:
+        result.sent_at[event["replyToken"]] = started
+    try:
+        response = await client.post(
+            url, content=body, headers={"Content-Type": "application/json", "X-Line-Signature": sign(secret, body)}
+        )
+        status = response.status_code
+    except httpx.HTTPError:
+        status = 0
+    result.ack_latencies.append(time.perf_counter() - started)
+    result.statuses[status] = result.statuses.get(status, 0) + 1
+    if status != 200:
+        result.failed_batches += 1
+        for event in events:
+            result.sent_at.pop(event["replyToken"], None)
+    else:
+        result.sent_events += len(events)
+
+
+async def run_load(
+    url: str,
+    channel_secret: str,
+    rate: float,
+    duration: float,
+    batch_size: int = 1,
+    users: int = 100,
+    timeout: float = 30.0,
+) -> LoadResult:
+    """
+    POST signed image-event batches to ``url`` at ``rate`` events per second for ``duration`` seconds.
+    """
+    result = LoadResult()
+    interval = batch_size / rate
+    total_batches = max(1, int(duration * rate / batch_size))
+    limits = httpx.Limits(max_connections=256, max_keepalive_connections=256)
+    tasks = []
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        for n in range(total_batches):
+            delay = start + n * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            events = []
+            for i in range(batch_size):
+                seq = n * batch_size + i
+                events.append(image_event(f"U{seq % users:032x}", f"bench{seq:09d}", f"rt{seq:09d}"))
+            tasks.append(asyncio.create_task(_post(client, url, channel_secret, events, result)))
+        await asyncio.gather(*tasks)
+        result.duration = time.perf_counter() - start
+    return result
@@ -0,0 +1,266 @@
+"""
+End-to-end webhook benchmark.
+
+Starts the fake LINE and OpenAI servers, runs ``linebot_app.webhook:app``
+under uvicorn in a child process pointed at them, drives it with signed
+image events at a fixed rate and reports latency percentiles, throughput
+and the server's peak memory. Results are compared with a stored baseline;
+any metric worse than the tolerance fails the run with exit status 1.
+
+    python -m benchmarks.run                      # compare with benchmarks/baseline.json
+    python -m benchmarks.run --update-baseline    # record a new baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+import numpy as np
+
+from .fakes import FakeLineAPI, FakeOpenAI, LatencyModel, make_image_pool
+from .loadgen import LoadResult, run_load
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+CHANNEL_SECRET = "bench-channel-secret"
+
+# Metric name -> True when larger is better.
+HIGHER_IS_BETTER = {
+    "events_per_sec": True,
+    "delivered_ratio": True,
+    "ack_p50_ms": False,
+    "ack_p95_ms": False,
+    "ack_p99_ms": False,
+    "e2e_p50_ms": False,
+    "e2e_p95_ms": False,
+    "e2e_p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _peak_rss_mb(pid: int) -> Optional[float]:
+    """
+    VmHWM (peak resident set) of ``pid`` in MiB; None where /proc is unavailable.
+    """
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _percentiles(values, prefix: str) -> Dict[str, float]:
+    if not len(values):
+        return {f"{prefix}_p{q}_ms": float("nan") for q in (50, 95, 99)}
+    ms = np.asarray(values) * 1000
+    return {f"{prefix}_p{q}_ms": round(float(np.percentile(ms, q)), 2) for q in (50, 95, 99)}
+
+
+def start_server(port: int, line: FakeLineAPI, openai: FakeOpenAI, workdir: Path, log, args) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(
+        {
+            "LINE_CHANNEL_ACCESS_TOKEN": "bench-token",
+            "LINE_CHANNEL_SECRET": CHANNEL_SECRET,
+            "SNAPBITE_LINE_API_ENDPOINT": line.url,
+            "SNAPBITE_LINE_DATA_ENDPOINT": line.url,
+            "OPENAI_API_KEY": "bench-key",
+            "OPENAI_BASE_URL": openai.url + "/v1",
+            "SNAPBITE_DB_PATH": str(workdir / "bench.db"),
+            "SNAPBITE_CACHE_DB_PATH": str(workdir / "analysis_cache.db"),
+            "SNAPBITE_CHART_DIR": str(workdir / "charts"),
+            # Measure the pipeline, not the rate limiter.
+            "SNAPBITE_USER_RATE_PER_MIN": "100000",
+            "SNAPBITE_USER_BURST": "1000",
+            "SNAPBITE_GLOBAL_RATE_PER_MIN": "1000000",
+            "SNAPBITE_GLOBAL_BURST": "10000",
+        }
+    )
+    env.update(dict(item.split("=", 1) for item in args.server_env))
+    command = [
+        sys.executable, "-m", "uvicorn", "linebot_app.webhook:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+    ]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_healthy(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"webhook server exited with status {process.returncode}")
+        try:
+            if httpx.get(url + "/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("webhook server did not become healthy in time")
+
+
+def wait_delivered(line: FakeLineAPI, load: LoadResult, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(token in line.delivered for token in load.sent_at):
+            return
+        time.sleep(0.1)
+
+
+def summarize(load: LoadResult, line: FakeLineAPI, rss_mb: Optional[float]) -> Dict[str, float]:
+    e2e = [line.delivered[t] - sent for t, sent in load.sent_at.items() if t in line.delivered]
+    offered = load.sent_events + load.failed_batches
+    metrics = {
+        "events_sent": load.sent_events,
+        "events_delivered": len(e2e),
+        "delivered_ratio": round(len(e2e) / offered, 4) if offered else 0.0,
+        "status_counts": {str(k): v for k, v in sorted(load.statuses.items())},
+    }
+    if e2e:
+        first = min(load.sent_at.values())
+        last = max(line.delivered[t] for t in load.sent_at if t in line.delivered)
+        metrics["events_per_sec"] = round(len(e2e) / max(last - first, 1e-9), 2)
+    else:
+        metrics["events_per_sec"] = 0.0
+    metrics.update(_percentiles(load.ack_latencies, "ack"))
+    metrics.update(_percentiles(e2e, "e2e"))
+    metrics["peak_rss_mb"] = round(rss_mb, 1) if rss_mb is not None else None
+    return metrics
+
+
+def compare(metrics: Dict[str, float], baseline: Dict[str, float], tolerance: float, slack_ms: float = 0.0) -> list:
+    """
+    Human-readable regressions: metrics worse than ``baseline`` by more than
+    ``tolerance`` (a fraction). Latencies also get ``slack_ms`` of absolute
+    headroom so scheduler noise on millisecond values does not fail the run.
+    """
+    regressions = []
+    for name, higher_better in HIGHER_IS_BETTER.items():
+        current, reference = metrics.get(name), baseline.get(name)
+        if current is None or reference is None or current != current:
+            continue
+        if higher_better:
+            limit = reference * (1 - tolerance)
+            worse = current < limit
+        else:
+            limit = reference * (1 + tolerance) + (slack_ms if name.endswith("_ms") else 0.0)
+            worse = current > limit
+        if worse:
+            regressions.append(f"{name}: {current} vs baseline {reference} (limit {limit:.2f})")
+    return regressions
+
+
+def scenario(args) -> dict:
+    return {
+        "rate": args.rate,
+        "duration": args.duration,
+        "batch_size": args.batch_size,
+        "users": args.users,
+        "image_pool": args.image_pool,
+        "line_latency_ms": args.line_latency_ms,
+        "line_error_rate": args.line_error_rate,
+        "openai_latency_ms": args.openai_latency_ms,
+        "openai_error_rate": args.openai_error_rate,
+        "seed": args.seed,
+    }
+
+
+def run(args) -> Dict[str, float]:
+    images = make_image_pool(args.image_pool, seed=args.seed)
+    line = FakeLineAPI(
+        images, LatencyModel(args.line_latency_ms, error_rate=args.line_error_rate, seed=args.seed)
+    ).start()
+    openai = FakeOpenAI(
+        latency=LatencyModel(args.openai_latency_ms, error_rate=args.openai_error_rate, seed=args.seed + 1)
+    ).start()
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="snapbite-bench-") as workdir:
+        log_path = Path(workdir) / "server.log"
+        log = open(log_path, "wb")
+        process = start_server(port, line, openai, Path(workdir), log, args)
+        try:
+            wait_healthy(url, process)
+            load = asyncio.run(
+                run_load(url + "/callback", CHANNEL_SECRET, args.rate, args.duration, args.batch_size, args.users)
+            )
+            wait_delivered(line, load, args.drain_timeout)
+            rss_mb = _peak_rss_mb(process.pid)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+            if process.returncode not in (0, -15):
+                sys.stderr.write(log_path.read_text(errors="replace")[-4000:])
+            line.close()
+            openai.close()
+    metrics = summarize(load, line, rss_mb)
+    metrics["fake_counts"] = {"line": dict(line.counts), "openai": dict(openai.counts)}
+    return metrics
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the LINE webhook against local fakes.")
+    parser.add_argument("--rate", type=float, default=8.0, help="events per second")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load")
+    parser.add_argument("--batch-size", type=int, default=1, help="events per webhook request")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--image-pool", type=int, default=64, help="distinct images served by the fake LINE API")
+    parser.add_argument("--line-latency-ms", type=float, default=20.0)
+    parser.add_argument("--line-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-latency-ms", type=float, default=300.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="seconds to wait for outstanding replies")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE", help="extra env for the server")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional regression")
+    parser.add_argument("--slack-ms", type=float, default=50.0, help="absolute latency headroom in ms")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", type=Path, help="also write the results JSON here")
+    args = parser.parse_args(argv)
+
+    metrics = run(args)
+    report = {"scenario": scenario(args), "metrics": metrics}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("scenario") != report["scenario"]:
+        print("Scenario differs from the baseline; not comparing.", file=sys.stderr)
+        return 2
+    regressions = compare(metrics, baseline["metrics"], args.tolerance, args.slack_ms)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+# Image analyses per user: sustained rate and burst size.
+USER_RATE_PER_MIN = float(os.getenv("SNAPBITE_USER_RATE_PER_MIN", "6"))
+USER_BURST = float(os.getenv("SNAPBITE_USER_BURST", "3"))
+# Image analyses across all users, sized to the OpenAI quota.
+GLOBAL_RATE_PER_MIN = float(os.getenv("SNAPBITE_GLOBAL_RATE_PER_MIN", "300"))
+GLOBAL_BURST = float(os.getenv("SNAPBITE_GLOBAL_BURST", "30"))
+MAX_TRACKED_USERS = int(os.getenv("SNAPBITE_MAX_TRACKED_USERS", "10000"))
+USER_IDLE_TTL = float(os.getenv("SNAPBITE_USER_IDLE_TTL", "600"))
+# Queue fill ratio above which low-priority events are shed.
+SHED_LOW_PRIORITY_AT = float(os.getenv("SNAPBITE_SHED_LOW_PRIORITY_AT", "0.5"))
+# Minimum seconds between "try again" notices to the same user.
+NOTICE_INTERVAL = float(os.getenv("SNAPBITE_ADMISSION_NOTICE_INTERVAL", "30"))
+
+PRIORITY_HIGH = 0  # image analysis
+PRIORITY_LOW = 1  # help text, reports, suggestions
+
+USER_LIMITED_TEXT = "你傳得有點快，請稍候片刻再傳下一張照片。"
+BUSY_TEXT = "目前使用人數較多，請稍後再試一次。"
+
+
+class TokenBucket:
+    """
+    Classic token bucket: ``rate`` tokens per second up to ``burst``.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float, cost: float = 1.0) -> bool:
+        self.refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    def wait_time(self, cost: float = 1.0) -> float:
+        missing = cost - self.tokens
+        return missing / self.rate if missing > 0 and self.rate > 0 else 0.0
+
+
+class _UserState:
+    __slots__ = ("bucket", "last_seen", "last_notice")
+
+    def __init__(self, bucket: TokenBucket, now: float):
+        self.bucket = bucket
+        self.last_seen = now
+        self.last_notice = float("-inf")
+
+
+@dataclass
+class Decision:
+    admitted: bool
+    reason: str = "ok"  # ok | user_limited | global_limited | shed
+    notify: bool = False  # send the "try again" reply (rate-limited per user)
+    retry_after: float = 0.0
+
+    @property
+    def reply_text(self) -> str:
+        return USER_LIMITED_TEXT if self.reason == "user_limited" else BUSY_TEXT
+
+
+class AdmissionController:
+    """
+    Per-user and global token buckets plus priority-based load shedding.
+
+    Every call is O(1): user state lives in an OrderedDict kept in
+    last-seen order, and at most a couple of idle entries are evicted per
+    call, with a hard cap of ``max_users`` entries.
+    """
+
+    def __init__(
+        self,
+        user_rate_per_min: float = USER_RATE_PER_MIN,
+        user_burst: float = USER_BURST,
+        global_rate_per_min: float = GLOBAL_RATE_PER_MIN,
+        global_burst: float = GLOBAL_BURST,
+        max_users: int = MAX_TRACKED_USERS,
+        idle_ttl: float = USER_IDLE_TTL,
+        shed_low_at: float = SHED_LOW_PRIORITY_AT,
+        notice_interval: float = NOTICE_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.user_rate = user_rate_per_min / 60.0
+        self.user_burst = user_burst
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.shed_low_at = shed_low_at
+        self.notice_interval = notice_interval
+        self._clock = clock
+        self._global = TokenBucket(global_rate_per_min / 60.0, global_burst, clock())
+        self._users: "OrderedDict[str, _UserState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _evict(self, now: float) -> None:
+        for _ in range(2):
+            if not self._users:
+                return
+            oldest = next(iter(self._users.values()))
+            if now - oldest.last_seen <= self.idle_ttl and len(self._users) <= self.max_users:
+                return
+            self._users.popitem(last=False)
+
+    def _user(self, user_id: str, now: float) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(TokenBucket(self.user_rate, self.user_burst, now), now)
+        else:
+            self._users.move_to_end(user_id)
+            state.last_seen = now
+        return state
+
+    def _notify(self, state: Optional[_UserState], now: float) -> bool:
+        if state is None:
+            return True
+        if now - state.last_notice < self.notice_interval:
+            return False
+        state.last_notice = now
+        return True
+
+    def admit(self, user_id: str, priority: int = PRIORITY_HIGH, cost: float = 1.0, load: float = 0.0) -> Decision:
+        """
+        Decide whether an event may be queued. ``load`` is the job queue's fill ratio (0-1).
+        """
+        now = self._clock()
+        with self._lock:
+            state = self._user(user_id, now) if user_id else None
+            self._evict(now)
+
+            if priority != PRIORITY_HIGH and load >= self.shed_low_at:
+                decision = Decision(False, "shed", self._notify(state, now))
+            elif cost <= 0:
+                decision = Decision(True)
+            elif state is not None and not state.bucket.take(now, cost):
+                decision = Decision(False, "user_limited", self._notify(state, now), state.bucket.wait_time(cost))
+            elif not self._global.take(now, cost):
+                if state is not None:
+                    # Refund the user's token: the rejection was not their doing.
+                    state.bucket.tokens = min(state.bucket.burst, state.bucket.tokens + cost)
+                decision = Decision(False, "global_limited", self._notify(state, now), self._global.wait_time(cost))
+            else:
+                decision = Decision(True)
+            self._counts[decision.reason] = self._counts.get(decision.reason, 0) + 1
+        return decision
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._counts)
+            counts["tracked_users"] = len(self._users)
+        return counts
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from source.image_analysis import FULL_BUDGET, ResponseBudget
+from source.metrics import STAGE_SECONDS, Histogram
+
+# p95 target (seconds) for analyzing one photo event; best set to a bucket
+# bound of snapbite_stage_seconds (5, 10, 30 ...) since p95 is read from it.
+LATENCY_SLO = float(os.getenv("SNAPBITE_LATENCY_SLO", "10"))
+# Seconds of recent latency the p95 is computed over.
+BUDGET_WINDOW = float(os.getenv("SNAPBITE_BUDGET_WINDOW", "60"))
+# Seconds a level is held before load may step it back towards full.
+BUDGET_HOLD = float(os.getenv("SNAPBITE_BUDGET_HOLD", "15"))
+# Users who keep one level more than everyone else under load.
+PREMIUM_USERS = frozenset(u.strip() for u in os.getenv("SNAPBITE_PREMIUM_USERS", "").split(",") if u.strip())
+
+_REDUCED = ResponseBudget(concise=True, max_completion_tokens=400)
+LEVELS: Tuple[Tuple[str, ResponseBudget], ...] = (
+    ("full", FULL_BUDGET),
+    ("reduced", _REDUCED),
+    # Enough for a typical plate; meals with many items are retried at "reduced".
+    ("minimal", ResponseBudget(concise=True, detail="low", max_completion_tokens=250, fallback=_REDUCED)),
+)
+# Queue fill ratio and p95/SLO ratio at which each level is entered...
+DEGRADE_AT = ((0.0, 0.0), (0.5, 1.0), (0.8, 1.5))
+# ...and below which it is left again (lower, so the level does not flap).
+RECOVER_BELOW = ((0.0, 0.0), (0.25, 0.7), (0.5, 1.0))
+
+
+class BudgetPolicy:
+    """
+    Picks a ResponseBudget per photo from queue depth, recent p95 latency
+    against the SLO and the user's tier.
+
+    Degrades one or two levels as soon as either signal crosses a threshold
+    and steps back one level at a time once both stay under the (lower)
+    recovery thresholds for ``hold`` seconds.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], float],
+        slo: float = LATENCY_SLO,
+        window: float = BUDGET_WINDOW,
+        hold: float = BUDGET_HOLD,
+        premium_users=PREMIUM_USERS,
+        histogram: Histogram = STAGE_SECONDS,
+        stage: str = "image_event",
+        clock: Callable[[], float] = time.monotonic,
+        interval: float = 1.0,
+    ):
+        self.load = load
+        self.slo = slo
+        self.window = window
+        self.hold = hold
+        self.premium_users = frozenset(premium_users)
+        self.histogram = histogram
+        self.stage = stage
+        self.clock = clock
+        self.interval = interval
+        self.level = 0
+        self.p95: Optional[float] = None
+        self._changed = float("-inf")
+        self._checked = float("-inf")
+        self._samples: Deque[Tuple[float, List[float]]] = deque()
+        self._lock = threading.Lock()
+
+    def tier(self, user_id: str) -> str:
+        return "premium" if user_id in self.premium_users else "standard"
+
+    def _recent_p95(self, now: float) -> Optional[float]:
+        counts = self.histogram.counts(self.stage)
+        self._samples.append((now, counts))
+        while len(self._samples) > 1 and self._samples[1][0] <= now - self.window:
+            self._samples.popleft()
+        oldest = self._samples[0][1]
+        window_counts = [new - old for new, old in zip(counts, oldest)]
+        return self.histogram.quantile(0.95, counts=window_counts)
+
+    def _target(self, load: float, p95_ratio: float) -> int:
+        target = 0
+        for level, (at_load, at_ratio) in enumerate(DEGRADE_AT):
+            if level and (load >= at_load or p95_ratio > at_ratio):
+                target = level
+        return target
+
+    def update(self) -> int:
+        """
+        Re-read load and latency (at most once per ``interval``) and return
+        the current level index.
+        """
+        now = self.clock()
+        with self._lock:
+            if now - self._checked < self.interval:
+                return self.level
+            self._checked = now
+            load = self.load()
+            self.p95 = self._recent_p95(now)
+            ratio = self.p95 / self.slo if self.p95 is not None and self.slo > 0 else 0.0
+
+            target = self._target(load, ratio)
+            if target > self.level:
+                self.level, self._changed = target, now
+            elif self.level and now - self._changed >= self.hold:
+                recover_load, recover_ratio = RECOVER_BELOW[self.level]
+                if load < recover_load and ratio < recover_ratio:
+                    self.level, self._changed = self.level - 1, now
+            return self.level
+
+    def for_user(self, user_id: str) -> ResponseBudget:
+        level = self.update()
+        if self.tier(user_id) == "premium":
+            level = max(0, level - 1)
+        return LEVELS[level][1]
+
+    def stats(self) -> Dict[str, object]:
+        return {"level": LEVELS[self.level][0], "p95_seconds": self.p95, "slo_seconds": self.slo}
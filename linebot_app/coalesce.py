@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from linebot.models import MessageEvent
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for more photos from the same sender before analyzing; 0 disables.
+COALESCE_WINDOW = float(os.getenv("SNAPBITE_COALESCE_WINDOW", "1.0"))
+# Photos per combined vision request; a full group is analyzed right away.
+COALESCE_MAX_IMAGES = int(os.getenv("SNAPBITE_COALESCE_MAX_IMAGES", "4"))
+
+
+@dataclass
+class ImageBatch:
+    """
+    Photo events from one sender in one chat, analyzed together as one meal.
+    """
+    events: List[MessageEvent]
+
+    @property
+    def last(self) -> MessageEvent:
+        # Newest event: its reply token has the most time left.
+        return self.events[-1]
+
+    @property
+    def message_ids(self) -> List[str]:
+        return [event.message.id for event in self.events]
+
+
+@dataclass
+class _Group:
+    timer: Optional[asyncio.TimerHandle] = None
+    events: List[MessageEvent] = field(default_factory=list)
+
+
+def group_key(event: MessageEvent) -> str:
+    """
+    Chat and sender the photo came from, plus LINE's image-set id when it
+    has one. Members of a group or room chat each get their own groups, so
+    one person's meal is never merged into another's.
+    """
+    source = event.source
+    chat = getattr(source, "group_id", None) or getattr(source, "room_id", None)
+    user = getattr(source, "user_id", None) or ""
+    key = f"{chat}/{user}" if chat else user
+    image_set = getattr(event.message, "image_set", None)
+    set_id = getattr(image_set, "id", None)
+    return f"{key}/{set_id}" if set_id else key
+
+
+class Coalescer:
+    """
+    Holds photo events per chat and sender for a short window and hands
+    each group to ``flush`` as one list. A group is flushed early once it
+    reaches ``max_images`` or LINE's image-set total.
+
+    Not thread-safe: call ``add`` from the event loop (the webhook handler).
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[MessageEvent]], None],
+        window: float = COALESCE_WINDOW,
+        max_images: int = COALESCE_MAX_IMAGES,
+    ):
+        self.flush = flush
+        self.window = window
+        self.max_images = max(1, max_images)
+        self._groups: Dict[str, _Group] = {}
+
+    def __len__(self) -> int:
+        return sum(len(group.events) for group in self._groups.values())
+
+    def add(self, event: MessageEvent) -> None:
+        if self.window <= 0 or self.max_images == 1:
+            self.flush([event])
+            return
+        key = group_key(event)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group()
+            group.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        group.events.append(event)
+
+        total = getattr(getattr(event.message, "image_set", None), "total", 0) or 0
+        if len(group.events) >= self.max_images or (total and len(group.events) >= total):
+            self._flush(key)
+
+    def _flush(self, key: str) -> None:
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        if group.timer is not None:
+            group.timer.cancel()
+        try:
+            self.flush(group.events)
+        except Exception:
+            logger.exception("Failed to hand off %d coalesced photo(s)", len(group.events))
+
+    def flush_all(self) -> None:
+        """
+        Hand off every waiting group now (used on shutdown).
+        """
+        for key in list(self._groups):
+            self._flush(key)
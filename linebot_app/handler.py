@@ -1,29 +1,69 @@
 import logging
 import os
-import tempfile
-from typing import List
+import time
+from pathlib import Path
+from typing import List, Optional
 
-from linebot import LineBotApi
-from linebot.models import ImageMessage, MessageEvent, TextSendMessage
+from linebot.exceptions import LineBotApiError
+from linebot.models import ImageMessage, MessageEvent, SendMessage, TextMessage, TextSendMessage
 
-from source.image_analysis import Analyst
+from source.analysis_cache import AnalysisCache
+from source.chart_render import get_renderer
+from source.food_crop import NoFoodError, get_cropper
+from source.food_db import FoodDatabase
+from source.image_analysis import Analyst, ResponseBudget, merge_analyses
+from source.llm_gateway import CircuitOpenError
+from source.metrics import stage
+from .admission import PRIORITY_HIGH, PRIORITY_LOW, Decision
+from .budget import BudgetPolicy
+from .coalesce import ImageBatch
+from .idempotency import SingleFlight
+from .line_client import LineClient, chunk_messages
 from .reply_format import format_analysis_message
-from .storage import save_analysis_log
+from .report import build_daily_report, report_messages, save_charts
+from .storage import (
+    claim_message,
+    fetch_analysis_by_message,
+    flush as flush_storage,
+    release_messages,
+    save_analysis_log,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-analyst = Analyst(language="zh-TW")
+# Directory built by `python -m source.food_db`; when set, macros come from it.
+FOOD_DB_DIR = os.getenv("SNAPBITE_FOOD_DB_DIR")
+# Shared by every worker process; a separate file keeps cache writes off the meal writer's lock.
+CACHE_DB_PATH = Path(os.getenv("SNAPBITE_CACHE_DB_PATH", "data/analysis_cache.db"))
+
+analyst = Analyst(
+    language="zh-TW",
+    cache=AnalysisCache(db_path=CACHE_DB_PATH),
+    food_db=FoodDatabase(FOOD_DB_DIR) if FOOD_DB_DIR else None,
+    cropper=get_cropper(),
+)
+
+# Concurrent deliveries of the same LINE message share one analysis.
+in_flight = SingleFlight()
+
+# LINE reply tokens expire shortly after the event; past this age we push instead.
+REPLY_TOKEN_TTL = float(os.getenv("SNAPBITE_REPLY_TOKEN_TTL", "50"))
+# When set, every downloaded image is also written here for debugging.
+DEBUG_CAPTURE_DIR = os.getenv("SNAPBITE_DEBUG_CAPTURE_DIR")
 
 HELP_TEXT = (
     "傳送餐點照片，我會回覆營養摘要。\n"
     "指令：\n"
     "- help：查看說明\n"
+    "- 報告：今日飲食圖表\n"
     "- 任何文字：回覆操作提示"
 )
 
+REPORT_COMMANDS = ("report", "報告", "今日報告")
+
 
-def handle_text_message(event: MessageEvent, unsupported: bool = False) -> List[TextSendMessage]:
+def handle_text_message(event: MessageEvent, unsupported: bool = False) -> List[SendMessage]:
     if unsupported:
         return [TextSendMessage(text="目前僅支援文字或照片訊息。")]
 
@@ -32,6 +72,9 @@ def handle_text_message(event: MessageEvent, unsupported: bool = False) -> List[
     if user_text in ("help", "說明", "?"):
         return [TextSendMessage(text=HELP_TEXT)]
 
+    if user_text in REPORT_COMMANDS:
+        return handle_report_request(event)
+
     return [
         TextSendMessage(
             text="請直接傳餐點照片，我會分析營養並以文字回覆。\n需要指令清單請輸入 help。"
@@ -39,35 +82,261 @@ def handle_text_message(event: MessageEvent, unsupported: bool = False) -> List[
     ]
 
 
-async def handle_image_message(event: MessageEvent, line_bot_api: LineBotApi) -> List[TextSendMessage]:
-    message_id = event.message.id
+def handle_report_request(event: MessageEvent) -> List[SendMessage]:
     user_id = getattr(event.source, "user_id", "") or ""
+    try:
+        flush_storage()  # include meals still waiting in the write-behind queue
+        renderer = get_renderer()
+        report = build_daily_report(user_id, renderer=renderer)
+        # The render cache is per process and bounded; LINE may fetch the
+        # chart URLs from another worker or later, so /charts reads them from disk.
+        save_charts(report, renderer)
+        return report_messages(report)
+    except Exception:
+        logger.exception("Failed to build daily report for %s", user_id)
+        return [TextSendMessage(text="報告產生失敗，請稍後再試。")]
+
+
+def download_message_content(line_bot_api: LineClient, message_id: str) -> memoryview:
+    """
+    Stream LINE message content into one buffer sized from Content-Length.
+    """
+    return line_bot_api.get_message_content(message_id)
 
-    tmp_path = None
+
+def _capture_debug_image(message_id: str, image_bytes: memoryview) -> None:
+    if not DEBUG_CAPTURE_DIR:
+        return
     try:
-        message_content = line_bot_api.get_message_content(message_id)
+        capture_dir = Path(DEBUG_CAPTURE_DIR)
+        capture_dir.mkdir(parents=True, exist_ok=True)
+        (capture_dir / f"{message_id}.jpg").write_bytes(image_bytes)
+    except OSError:
+        logger.warning("Failed to capture debug image for message %s", message_id)
+
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-            for chunk in message_content.iter_content():
-                tmp_file.write(chunk)
-            tmp_path = tmp_file.name
+def _process_images(
+    line_bot_api: LineClient, message_ids: List[str], user_id: str, budget: Optional[ResponseBudget] = None
+) -> str:
+    """
+    Download and analyze one meal's photos, store the result under the
+    first message id and return the reply text.
+    """
+    try:
+        images = []
+        for message_id in message_ids:
+            with stage("download"):
+                image_bytes = download_message_content(line_bot_api, message_id)
+            _capture_debug_image(message_id, image_bytes)
+            images.append(image_bytes)
 
-        analysis = analyst.analyze_image(tmp_path)
+        analysis = analyst.analyze_images(images, budget=budget, scope=user_id)
         reply_text = format_analysis_message(analysis)
 
         try:
-            save_analysis_log(user_id=user_id, message_id=message_id, analysis=analysis)
+            with stage("storage_enqueue"):
+                save_analysis_log(
+                    user_id=user_id, message_id=message_ids[0], analysis=analysis, extra_message_ids=message_ids[1:]
+                )
         except Exception:
-            logger.exception("Failed to persist analysis for message %s", message_id)
+            logger.exception("Failed to persist analysis for messages %s", message_ids)
+            _release(message_ids)
 
+    except NoFoodError as exc:
+        logger.info("No food in messages %s (%s); skipped analysis", message_ids, exc.reason)
+        reply_text = "照片中似乎沒有餐點，請對準食物再拍一張。"
+        _release(message_ids)
+    except CircuitOpenError:
+        logger.warning("Analysis provider unavailable; skipped messages %s", message_ids)
+        reply_text = "分析服務暫時忙碌，請過幾分鐘再傳一次照片。"
+        _release(message_ids)
     except Exception:
-        logger.exception("Failed to handle image message %s", message_id)
+        logger.exception("Failed to handle image messages %s", message_ids)
         reply_text = "圖片處理失敗，請稍後再試。"
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except OSError:
-                logger.warning("Failed to remove temp file %s", tmp_path)
+        _release(message_ids)
+    return reply_text
+
 
+def _claim(message_ids: List[str]) -> List[str]:
+    """
+    The ids this worker may analyze; the rest are done or being analyzed
+    by another worker process. A failed claim is treated as granted, so a
+    storage problem costs a duplicate analysis rather than a lost photo.
+    """
+    claimed = []
+    for message_id in message_ids:
+        try:
+            if not claim_message(message_id):
+                logger.info("Message %s is already claimed by another worker", message_id)
+                continue
+        except Exception:
+            logger.exception("Claim failed for message %s", message_id)
+        claimed.append(message_id)
+    return claimed
+
+
+def _release(message_ids: List[str]) -> None:
+    try:
+        release_messages(message_ids)
+    except Exception:
+        logger.exception("Failed to release claims for messages %s", message_ids)
+
+
+def _claimed_process(line_bot_api: LineClient, message_ids: List[str], user_id: str, budget: Optional[ResponseBudget]):
+    claimed = _claim(message_ids)
+    if not claimed:
+        return None
+    return _process_images(line_bot_api, claimed, user_id, budget)
+
+
+def _stored_analysis(message_id: str) -> Optional[dict]:
+    try:
+        return fetch_analysis_by_message(message_id)
+    except Exception:
+        logger.exception("Idempotency lookup failed for message %s", message_id)
+        return None
+
+
+def handle_image_message(
+    event: MessageEvent, line_bot_api: LineClient, budget: Optional[ResponseBudget] = None
+) -> List[TextSendMessage]:
+    """
+    Analyze an image once per LINE message id. Redeliveries of a finished
+    message reply from the stored analysis; deliveries that arrive while the
+    first is still running, in this process or another, send nothing.
+    """
+    message_id = event.message.id
+    user_id = getattr(event.source, "user_id", "") or ""
+
+    stored = _stored_analysis(message_id)
+    if stored:
+        logger.info("Message %s already analyzed, replying from the stored result", message_id)
+        return [TextSendMessage(text=format_analysis_message(stored))]
+
+    reply_text, leader = in_flight.run(message_id, lambda: _claimed_process(line_bot_api, [message_id], user_id, budget))
+    if not leader or reply_text is None:
+        return []
+    return [TextSendMessage(text=reply_text)]
+
+
+def handle_image_batch(
+    batch: ImageBatch, line_bot_api: LineClient, budget: Optional[ResponseBudget] = None
+) -> List[TextSendMessage]:
+    """
+    Analyze photos sent together as one meal: one vision request, one reply.
+    Photos already analyzed (redeliveries) are left out of the request.
+    """
+    if len(batch.events) == 1:
+        return handle_image_message(batch.last, line_bot_api, budget)
+    user_id = getattr(batch.last.source, "user_id", "") or ""
+
+    stored = {message_id: _stored_analysis(message_id) for message_id in batch.message_ids}
+    fresh = [message_id for message_id, analysis in stored.items() if not analysis]
+    if not fresh:
+        logger.info("Messages %s already analyzed, replying from the stored result", batch.message_ids)
+        return [TextSendMessage(text=format_analysis_message(merge_analyses(stored.values())))]
+
+    key = ",".join(fresh)
+    reply_text, leader = in_flight.run(key, lambda: _claimed_process(line_bot_api, fresh, user_id, budget))
+    if not leader or reply_text is None:
+        return []
     return [TextSendMessage(text=reply_text)]
+
+
+def _push_target(event: MessageEvent) -> Optional[str]:
+    source = event.source
+    for attr in ("group_id", "room_id", "user_id"):
+        target = getattr(source, attr, None)
+        if target:
+            return target
+    return None
+
+
+def _reply_token_fresh(event: MessageEvent, now: Optional[float] = None) -> bool:
+    if not event.reply_token:
+        return False
+    if not event.timestamp:
+        return True
+    now = time.time() if now is None else now
+    return now - event.timestamp / 1000.0 < REPLY_TOKEN_TTL
+
+
+def send_replies(event: MessageEvent, replies: List[SendMessage], line_bot_api: LineClient) -> None:
+    """
+    Reply with the event's token while it is still valid, otherwise push.
+    A reply carries up to five messages; any beyond that are pushed.
+    """
+    if not replies:
+        return
+
+    if _reply_token_fresh(event):
+        first, *rest = chunk_messages(replies)
+        try:
+            with stage("reply"):
+                line_bot_api.reply_message(event.reply_token, first)
+            replies = [message for group in rest for message in group]
+        except LineBotApiError:
+            logger.warning("Reply token rejected for event %s, falling back to push", event.message.id)
+        if not replies:
+            return
+
+    target = _push_target(event)
+    if not target:
+        logger.error("No push target for event %s, dropping reply", event.message.id)
+        return
+    with stage("push"):
+        line_bot_api.push_message(target, replies)
+
+
+def event_priority(event: MessageEvent) -> tuple:
+    """
+    (priority, cost) used for admission control: images are the work we
+    protect and charge against the rate limits; reports cost a token but are
+    shed first; help and other text is free but also sheddable.
+    """
+    if isinstance(event.message, ImageMessage):
+        return PRIORITY_HIGH, 1.0
+    if isinstance(event.message, TextMessage) and (event.message.text or "").strip().lower() in REPORT_COMMANDS:
+        return PRIORITY_LOW, 1.0
+    return PRIORITY_LOW, 0.0
+
+
+def send_rejection(event: MessageEvent, decision: Decision, line_bot_api: LineClient) -> None:
+    """
+    Tell the user right away that their message was not processed.
+    """
+    try:
+        send_replies(event, [TextSendMessage(text=decision.reply_text)], line_bot_api)
+    except Exception:
+        logger.exception("Failed to send admission notice for event %s", event.message.id)
+
+
+def _budget_for(event: MessageEvent, budgets: Optional[BudgetPolicy]) -> Optional[ResponseBudget]:
+    if budgets is None:
+        return None
+    return budgets.for_user(getattr(event.source, "user_id", "") or "")
+
+
+def process_event(event: MessageEvent, line_bot_api: LineClient, budgets: Optional[BudgetPolicy] = None) -> None:
+    """
+    Handle one webhook event (or coalesced photo batch) end to end. Runs on
+    a job worker thread. ``budgets`` sizes each photo analysis to the load.
+    """
+    if isinstance(event, ImageBatch):
+        with stage("image_event"):
+            replies = handle_image_batch(event, line_bot_api, _budget_for(event.last, budgets))
+        send_replies(event.last, replies, line_bot_api)
+        return
+
+    if not isinstance(event, MessageEvent):
+        return
+
+    if isinstance(event.message, TextMessage):
+        replies = handle_text_message(event)
+    elif isinstance(event.message, ImageMessage):
+        with stage("image_event"):
+            replies = handle_image_message(event, line_bot_api, _budget_for(event, budgets))
+    else:
+        replies = handle_text_message(event, unsupported=True)
+
+    send_replies(event, replies, line_bot_api)
@@ -0,0 +1,53 @@
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) runs ``fn``; callers arriving
+    while it is still running wait on the same future and receive its result
+    or exception. Keys are forgotten as soon as the call finishes, so
+    completed work must be recorded elsewhere (see
+    storage.fetch_analysis_by_message). Only calls in this process are
+    collapsed; storage.claim_message keeps other workers out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def run(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Return ``(result, leader)``; ``leader`` is False for callers that shared another call's result.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            logger.info("Joining in-flight call for %s", key)
+            return future.result(), False
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("SNAPBITE_WORKER_CONCURRENCY", "4"))
+QUEUE_MAXSIZE = int(os.getenv("SNAPBITE_QUEUE_MAXSIZE", "100"))
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobQueue:
+    """
+    Bounded queue drained by a fixed pool of workers.
+
+    Jobs are handed to ``handler`` on a dedicated thread pool so blocking I/O
+    (LINE downloads, OpenAI calls, SQLite) never runs on the event loop.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        concurrency: int = WORKER_CONCURRENCY,
+        maxsize: int = QUEUE_MAXSIZE,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.handler = handler
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def load(self) -> float:
+        """
+        Fill ratio of the queue, 0.0 when unbounded.
+        """
+        return self.depth / self.maxsize if self.maxsize > 0 else 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="snapbite-job"
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"snapbite-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    def submit(self, job: Any) -> None:
+        """
+        Enqueue a job without waiting. Raises QueueFullError when saturated.
+        """
+        if self._queue is None:
+            raise RuntimeError("JobQueue has not been started")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull as exc:
+            raise QueueFullError(f"job queue is full ({self.maxsize} pending)") from exc
+
+    async def join(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self, drain: bool = True, timeout: Optional[float] = None) -> None:
+        """
+        Stop the workers, optionally waiting for queued jobs to finish first.
+        """
+        if not self.running:
+            return
+        if drain:
+            try:
+                await asyncio.wait_for(self.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Timed out draining job queue with %d jobs left", self.depth)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Jobs still running may be waiting on this loop (LineClient calls),
+        # so wait for the pool off the loop instead of blocking it.
+        executor, self._executor = self._executor, None
+        await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    async def _worker(self, index: int) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                await loop.run_in_executor(self._executor, self.handler, job)
+            except Exception:
+                logger.exception("Worker %d failed to process job", index)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,186 @@
+"""
+Pooled, non-blocking client for the LINE Messaging API.
+
+AsyncLineClient runs every call on one httpx.AsyncClient, so content
+downloads, replies and pushes share keep-alive connections (HTTP/2 when the
+``h2`` package is installed) instead of paying a TLS handshake per event.
+
+Job workers are plain threads, so they use LineClient: a blocking facade
+with the LineBotApi method names that schedules each call on the webhook's
+event loop and waits for it. The loop never blocks on LINE; only the worker
+thread that asked does.
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+from linebot.exceptions import LineBotApiError
+from linebot.models import Error
+
+LINE_API_ENDPOINT = os.getenv("SNAPBITE_LINE_API_ENDPOINT", "https://api.line.me")
+LINE_DATA_ENDPOINT = os.getenv("SNAPBITE_LINE_DATA_ENDPOINT", "https://api-data.line.me")
+# Seconds per reply/push call, and per content download (images can be several MB).
+LINE_TIMEOUT = float(os.getenv("SNAPBITE_LINE_TIMEOUT", "10"))
+LINE_CONTENT_TIMEOUT = float(os.getenv("SNAPBITE_LINE_CONTENT_TIMEOUT", "30"))
+LINE_CONNECT_TIMEOUT = float(os.getenv("SNAPBITE_LINE_CONNECT_TIMEOUT", "5"))
+LINE_MAX_CONNECTIONS = int(os.getenv("SNAPBITE_LINE_MAX_CONNECTIONS", "20"))
+# Idle pooled connections are kept this long (seconds) for the next burst.
+LINE_KEEPALIVE_EXPIRY = float(os.getenv("SNAPBITE_LINE_KEEPALIVE_EXPIRY", "60"))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("SNAPBITE_DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+# LINE accepts at most five message objects per reply or push request.
+MAX_MESSAGES = 5
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def chunk_messages(messages: Sequence[Any], size: int = MAX_MESSAGES) -> List[List[Any]]:
+    """
+    Split messages into request-sized groups, keeping their order.
+    """
+    messages = list(messages)
+    return [messages[start:start + size] for start in range(0, len(messages), size)]
+
+
+def _as_json(message: Any) -> Dict[str, Any]:
+    return message.as_json_dict() if hasattr(message, "as_json_dict") else message
+
+
+def _api_error(response: httpx.Response) -> LineBotApiError:
+    try:
+        error = Error.new_from_json_dict(response.json())
+    except ValueError:
+        error = Error(message=response.text or response.reason_phrase)
+    return LineBotApiError(
+        status_code=response.status_code,
+        headers=dict(response.headers),
+        request_id=response.headers.get("x-line-request-id"),
+        error=error,
+    )
+
+
+class AsyncLineClient:
+    """
+    Messaging API calls on a shared connection pool.
+
+    Non-2xx responses raise linebot's LineBotApiError, as LineBotApi does,
+    so callers keep their existing error handling.
+    """
+
+    def __init__(
+        self,
+        channel_access_token: str,
+        endpoint: str = LINE_API_ENDPOINT,
+        data_endpoint: str = LINE_DATA_ENDPOINT,
+        timeout: float = LINE_TIMEOUT,
+        content_timeout: float = LINE_CONTENT_TIMEOUT,
+        max_connections: int = LINE_MAX_CONNECTIONS,
+        http2: Optional[bool] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.data_endpoint = data_endpoint.rstrip("/")
+        self.timeout = timeout
+        self.content_timeout = content_timeout
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self._client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {channel_access_token}"},
+            timeout=httpx.Timeout(timeout, connect=LINE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=LINE_KEEPALIVE_EXPIRY,
+            ),
+            http2=self.http2,
+            transport=transport,
+        )
+
+    async def get_message_content(self, message_id: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> memoryview:
+        """
+        Stream a message's content into one buffer sized from Content-Length.
+        """
+        url = f"{self.data_endpoint}/v2/bot/message/{message_id}/content"
+        async with self._client.stream("GET", url, timeout=self.content_timeout) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise _api_error(response)
+            length = response.headers.get("content-length")
+            buffer = bytearray(int(length) if length and length.isdigit() else 0)
+            written = 0
+            async for chunk in response.aiter_bytes(chunk_size):
+                end = written + len(chunk)
+                buffer[written:end] = chunk  # grows the buffer if the length was short
+                written = end
+        return memoryview(buffer)[:written]
+
+    async def _post(self, path: str, payload: Dict[str, Any], timeout: Optional[float]) -> None:
+        response = await self._client.post(
+            f"{self.endpoint}{path}", json=payload, timeout=self.timeout if timeout is None else timeout
+        )
+        if response.status_code >= 400:
+            raise _api_error(response)
+
+    async def reply_message(self, reply_token: str, messages: Sequence[Any], timeout: Optional[float] = None) -> None:
+        """
+        Send up to MAX_MESSAGES messages in one reply; a token can be used once.
+        """
+        messages = list(messages)
+        if len(messages) > MAX_MESSAGES:
+            raise ValueError(f"a reply carries at most {MAX_MESSAGES} messages, got {len(messages)}")
+        payload = {"replyToken": reply_token, "messages": [_as_json(m) for m in messages]}
+        await self._post("/v2/bot/message/reply", payload, timeout)
+
+    async def push_message(self, to: str, messages: Sequence[Any], timeout: Optional[float] = None) -> None:
+        """
+        Push messages to a chat, MAX_MESSAGES per request.
+        """
+        for group in chunk_messages(messages):
+            await self._post("/v2/bot/message/push", {"to": to, "messages": [_as_json(m) for m in group]}, timeout)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class LineClient:
+    """
+    Blocking facade over AsyncLineClient for job worker threads.
+
+    ``bind`` it to the running loop at startup; calls made from the loop's
+    own thread are refused because waiting there would deadlock it.
+    """
+
+    def __init__(self, client: AsyncLineClient, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.client = client
+        self._loop = loop
+        self._loop_thread: Optional[int] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Route calls to ``loop``; call this from the loop's own thread.
+        """
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+
+    def _run(self, coro, timeout: float) -> Any:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            coro.close()
+            raise RuntimeError("LineClient is not bound to a running event loop")
+        if self._loop_thread == threading.get_ident():
+            coro.close()
+            raise RuntimeError("LineClient blocks; await the AsyncLineClient from the event loop instead")
+        # A little beyond the httpx timeout so its own error surfaces first.
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout + LINE_CONNECT_TIMEOUT)
+
+    def get_message_content(self, message_id: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> memoryview:
+        return self._run(self.client.get_message_content(message_id, chunk_size), self.client.content_timeout)
+
+    def reply_message(self, reply_token: str, messages: Sequence[Any]) -> None:
+        self._run(self.client.reply_message(reply_token, messages), self.client.timeout)
+
+    def push_message(self, to: str, messages: Sequence[Any]) -> None:
+        groups = max(1, len(chunk_messages(messages)))
+        self._run(self.client.push_message(to, messages), self.client.timeout * groups)
@@ -0,0 +1,93 @@
+"""
+Backfill meal_item rows and daily_totals from legacy meal_analysis JSON.
+
+Usage:
+    python -m linebot_app.migrate [--db data/snapbite.db] [--batch-size 1000]
+
+Rows that have already been normalized (item_count IS NOT NULL) are skipped,
+so the tool can be re-run safely or interrupted and resumed. Legacy message
+ids are also recorded in processed_message, so redeliveries of old messages
+are recognised as duplicates.
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Union
+
+from .storage import DB_PATH, add_meal_items, create_schema, local_day, meal_items_from_analysis, open_connection
+
+logger = logging.getLogger(__name__)
+
+
+def backfill(db_path: Union[str, Path] = DB_PATH, batch_size: int = 1000) -> int:
+    """
+    Normalize every legacy row in batches of ``batch_size``. Returns rows converted.
+    """
+    conn = open_connection(db_path)
+    try:
+        create_schema(conn)
+        converted = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, user_id, analysis_json, created_at FROM meal_analysis "
+                "WHERE item_count IS NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            with conn:
+                for meal_id, user_id, analysis_json, created_at in rows:
+                    _convert_row(conn, meal_id, user_id or "", analysis_json, created_at)
+            converted += len(rows)
+            last_id = rows[-1][0]
+            logger.info("Backfilled %d rows (last id %d)", converted, last_id)
+        seeded = seed_processed_messages(conn)
+        if seeded:
+            logger.info("Recorded %d legacy message ids", seeded)
+        return converted
+    finally:
+        conn.close()
+
+
+def seed_processed_messages(conn: sqlite3.Connection) -> int:
+    """
+    Record the earliest meal for every message id not yet in processed_message.
+    """
+    with conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO processed_message (message_id, meal_id, created_at) "
+            "SELECT message_id, MIN(id), MIN(created_at) FROM meal_analysis "
+            "WHERE message_id IS NOT NULL AND message_id != '' GROUP BY message_id"
+        )
+    return cur.rowcount
+
+
+def _convert_row(conn: sqlite3.Connection, meal_id: int, user_id: str, analysis_json: str, created_at: str) -> None:
+    try:
+        analysis = json.loads(analysis_json) if analysis_json else {}
+    except ValueError:
+        logger.warning("Row %d has unparseable analysis_json, recording it with no items", meal_id)
+        analysis = {}
+    created_at = str(created_at)
+    add_meal_items(conn, meal_id, user_id, created_at, local_day(created_at), meal_items_from_analysis(analysis))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill meal_item and daily_totals from meal_analysis JSON.")
+    parser.add_argument("--db", default=str(DB_PATH), help="SQLite database path")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows converted per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    converted = backfill(args.db, args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"Backfilled {converted} rows in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Nightly batch: render and push every active user's daily report.
+
+Usage:
+    python -m linebot_app.nightly [--day YYYY-MM-DD] [--workers N] [--rate 20]
+
+Charts are rendered across a process pool and written to SNAPBITE_CHART_DIR,
+where the webhook's /charts route serves them. Pushes are paced to stay
+under the LINE rate limit, and each user is checkpointed as soon as the
+push succeeds, so re-running after an interruption only processes the
+remaining users.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Protocol, Set, TextIO
+
+from linebot.exceptions import LineBotApiError
+
+from .report import CHART_DIR, DailyReport, build_daily_report, report_messages, save_charts, today
+from .storage import fetch_active_users
+
+logger = logging.getLogger(__name__)
+
+PUSH_RATE = float(os.getenv("SNAPBITE_PUSH_RATE", "20"))  # pushes per second
+PUSH_MAX_RETRIES = int(os.getenv("SNAPBITE_PUSH_MAX_RETRIES", "5"))
+# Delivered users between fsyncs of the checkpoint; every user is still
+# written out right after its push, so only an OS crash can lose them.
+CHECKPOINT_SYNC_EVERY = 20
+
+
+class Pusher(Protocol):
+    def push_message(self, to: str, messages: list) -> None:
+        ...
+
+
+@dataclass
+class BatchStats:
+    users: int = 0
+    skipped: int = 0
+    sent: int = 0
+    failed: int = 0
+    render_seconds: float = 0.0
+    elapsed: float = 0.0
+
+    def summary(self) -> str:
+        rate = self.sent / self.elapsed if self.elapsed else 0.0
+        return (
+            f"users={self.users} skipped={self.skipped} sent={self.sent} failed={self.failed} "
+            f"elapsed={self.elapsed:.2f}s render_cpu={self.render_seconds:.2f}s throughput={rate:.1f} users/s"
+        )
+
+
+class Pacer:
+    """
+    Spaces calls at least 1/rate seconds apart and honours Retry-After pauses.
+    """
+
+    def __init__(self, rate: float, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._next = clock()
+
+    def wait(self) -> None:
+        now = self._clock()
+        if now < self._next:
+            self._sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+    def pause(self, seconds: float) -> None:
+        self._next = max(self._next, self._clock() + seconds)
+
+
+class Checkpoint:
+    """
+    Append-only file of users already delivered for a given day, one per line.
+    """
+
+    def __init__(self, path: Path, sync_every: int = CHECKPOINT_SYNC_EVERY):
+        self.path = Path(path)
+        self.sync_every = max(1, sync_every)
+        self.done: Set[str] = set()
+        if self.path.exists():
+            self.done = {line for line in self.path.read_text(encoding="utf-8").splitlines() if line}
+        self._file: Optional[TextIO] = None
+        self._unsynced = 0
+
+    def mark(self, user_id: str) -> None:
+        """
+        Record ``user_id`` as delivered; the line reaches the OS before this returns.
+        """
+        self.done.add(user_id)
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(user_id + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+def _render_user(user_id: str, day: str, chart_dir: str) -> tuple:
+    # Runs in a worker process; each process keeps its own renderer and figures.
+    from source.chart_render import get_renderer
+
+    start = time.process_time()
+    renderer = get_renderer()
+    report = build_daily_report(user_id, day=day, renderer=renderer)
+    save_charts(report, renderer, Path(chart_dir))
+    return report, time.process_time() - start
+
+
+def _push_with_retry(pusher: Pusher, pacer: Pacer, report: DailyReport, max_retries: int) -> bool:
+    messages = report_messages(report)
+    for attempt in range(max_retries + 1):
+        pacer.wait()
+        try:
+            pusher.push_message(report.user_id, messages)
+            return True
+        except LineBotApiError as exc:
+            if exc.status_code != 429 or attempt == max_retries:
+                logger.error("Push to %s failed: %s", report.user_id, exc)
+                return False
+            retry_after = float((exc.headers or {}).get("Retry-After", 2 ** attempt))
+            logger.warning("Rate limited pushing to %s, pausing %.1fs", report.user_id, retry_after)
+            pacer.pause(retry_after)
+    return False
+
+
+def run_batch(
+    pusher: Pusher,
+    day: Optional[str] = None,
+    users: Optional[Iterable[str]] = None,
+    workers: Optional[int] = None,
+    rate: float = PUSH_RATE,
+    checkpoint_path: Optional[Path] = None,
+    chart_dir: Path = CHART_DIR,
+    pacer: Optional[Pacer] = None,
+) -> BatchStats:
+    """
+    Render every user's report in parallel and push them as they complete.
+    """
+    day = day or today()
+    started = time.perf_counter()
+    user_ids = list(users) if users is not None else fetch_active_users(day)
+    checkpoint = Checkpoint(checkpoint_path or Path(chart_dir) / f"nightly-{day}.done")
+    pending = [u for u in user_ids if u not in checkpoint.done]
+    stats = BatchStats(users=len(user_ids), skipped=len(user_ids) - len(pending))
+    pacer = pacer or Pacer(rate)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = {pool.submit(_render_user, user_id, day, str(chart_dir)): user_id for user_id in pending}
+            for future in as_completed(futures):
+                user_id = futures[future]
+                try:
+                    report, cpu_seconds = future.result()
+                except Exception:
+                    logger.exception("Rendering report for %s failed", user_id)
+                    stats.failed += 1
+                    continue
+                stats.render_seconds += cpu_seconds
+                if _push_with_retry(pusher, pacer, report, PUSH_MAX_RETRIES):
+                    stats.sent += 1
+                    checkpoint.mark(user_id)
+                else:
+                    stats.failed += 1
+    finally:
+        checkpoint.close()
+
+    stats.elapsed = time.perf_counter() - started
+    logger.info("Nightly report batch for %s: %s", day, stats.summary())
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Render and push daily reports to all active users.")
+    parser.add_argument("--day", default=None, help="local day to report (YYYY-MM-DD), default today")
+    parser.add_argument("--workers", type=int, default=None, help="render processes, default CPU count")
+    parser.add_argument("--rate", type=float, default=PUSH_RATE, help="max LINE pushes per second")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from linebot import LineBotApi
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
+    if not token:
+        raise SystemExit("LINE_CHANNEL_ACCESS_TOKEN is not set")
+
+    stats = run_batch(LineBotApi(token), day=args.day, workers=args.workers, rate=args.rate)
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
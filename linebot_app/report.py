@@ -0,0 +1,163 @@
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from linebot.models import ImageSendMessage, TextSendMessage
+
+from source.chart_render import ChartRenderer, get_renderer
+from source.nutrient_table import group_sum
+from .storage import LOCAL_TZ, fetch_daily_totals, fetch_meal_items, local_day_bounds
+
+# Public https base URL of this service; LINE fetches chart images from it.
+PUBLIC_BASE_URL = os.getenv("SNAPBITE_PUBLIC_BASE_URL", "").rstrip("/")
+TREND_DAYS = int(os.getenv("SNAPBITE_REPORT_TREND_DAYS", "7"))
+CHART_FORMAT = "png"  # LINE image messages accept JPEG and PNG only
+# Charts rendered outside the web process (e.g. the nightly batch) are written here.
+CHART_DIR = Path(os.getenv("SNAPBITE_CHART_DIR", "data/charts"))
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+@dataclass
+class DailyReport:
+    """
+    Chart inputs and rendered chart digests for one user's day.
+    """
+    user_id: str
+    day: str
+    calories: float
+    carbs: float
+    protein: float
+    fat: float
+    meal_count: int
+    charts: Dict[str, str] = field(default_factory=dict)
+
+    def summary_text(self) -> str:
+        if not self.meal_count:
+            return f"{self.day} 尚無餐點紀錄，傳張餐點照片開始記錄吧！"
+        return (
+            f"{self.day} 飲食摘要（{self.meal_count} 餐）：\n"
+            f"熱量 {self.calories:.0f} kcal\n"
+            f"碳水 {self.carbs:.0f} g、蛋白質 {self.protein:.0f} g、脂肪 {self.fat:.0f} g"
+        )
+
+
+def today() -> str:
+    return datetime.now(LOCAL_TZ).date().isoformat()
+
+
+def _meal_label(created_at: str) -> str:
+    moment = datetime.strptime(created_at[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return moment.astimezone(LOCAL_TZ).strftime("%H:%M")
+
+
+def chart_inputs(items: List[dict], trend: List[dict]) -> Dict[str, dict]:
+    """
+    Turn stored meal_item and daily_totals rows into render_cached arguments.
+    """
+    inputs: Dict[str, dict] = {}
+    if items:
+        meal_ids = np.array([item["meal_id"] for item in items], dtype=np.int64)
+        values = np.nan_to_num(
+            np.array(
+                [[item["calories"], item["carbs"], item["protein"], item["fat"]] for item in items],
+                dtype=np.float64,
+            )
+        )
+        meals, sums = group_sum(meal_ids, values)
+        first_seen = {item["meal_id"]: item["created_at"] for item in reversed(items)}
+        inputs["calories"] = {
+            "labels": [_meal_label(first_seen[int(m)]) for m in meals],
+            "calories": [float(v) for v in sums[:, 0]],
+        }
+        _, carbs, protein, fat = sums.sum(axis=0)
+        inputs["macros"] = {"protein": float(protein), "carbs": float(carbs), "fat": float(fat)}
+    if trend:
+        inputs["trend"] = {
+            "dates": [row["day"] for row in trend],
+            "totals": [float(row["calories"]) for row in trend],
+        }
+    return inputs
+
+
+def build_daily_report(
+    user_id: str,
+    day: Optional[str] = None,
+    renderer: Optional[ChartRenderer] = None,
+    fmt: str = CHART_FORMAT,
+) -> DailyReport:
+    """
+    Read the user's day from SQLite and render its charts through the render cache.
+    """
+    day = day or today()
+    renderer = renderer or get_renderer()
+    first_day = (date.fromisoformat(day) - timedelta(days=TREND_DAYS - 1)).isoformat()
+    trend = fetch_daily_totals(user_id, first_day, day)
+    items = fetch_meal_items(user_id, *local_day_bounds(day))
+
+    totals = next((row for row in trend if row["day"] == day), None) or {}
+    report = DailyReport(
+        user_id=user_id,
+        day=day,
+        calories=totals.get("calories", 0.0),
+        carbs=totals.get("carbs", 0.0),
+        protein=totals.get("protein", 0.0),
+        fat=totals.get("fat", 0.0),
+        meal_count=totals.get("meal_count", 0),
+    )
+    for chart, data in chart_inputs(items, trend).items():
+        digest, _ = renderer.render_cached(chart, data, user_id=user_id, date_range=(first_day, day), fmt=fmt)
+        report.charts[chart] = digest
+    return report
+
+
+def chart_url(digest: str, fmt: str = CHART_FORMAT) -> str:
+    return f"{PUBLIC_BASE_URL}/charts/{digest}.{fmt}"
+
+
+def report_messages(report: DailyReport) -> List:
+    """
+    LINE messages for a report: the text summary plus one image per chart
+    when PUBLIC_BASE_URL is configured (at most 4, under LINE's 5-message cap).
+    """
+    messages: List = [TextSendMessage(text=report.summary_text())]
+    if not PUBLIC_BASE_URL:
+        return messages
+    for chart in ("calories", "macros", "trend"):
+        digest = report.charts.get(chart)
+        if digest:
+            url = chart_url(digest)
+            messages.append(ImageSendMessage(original_content_url=url, preview_image_url=url))
+    return messages
+
+
+def save_charts(report: DailyReport, renderer: ChartRenderer, directory: Optional[Path] = None, fmt: str = CHART_FORMAT) -> None:
+    """
+    Write a report's rendered charts to ``directory`` (default CHART_DIR) for /charts to serve.
+    """
+    directory = directory or CHART_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    for digest in report.charts.values():
+        path = directory / f"{digest}.{fmt}"
+        blob = renderer.get_blob(digest)
+        if blob is not None and not path.exists():
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, path)
+
+
+def load_chart(digest: str, fmt: str = CHART_FORMAT, directory: Optional[Path] = None) -> Optional[bytes]:
+    """
+    Read a chart saved by save_charts. Digests are validated before touching the filesystem.
+    """
+    if not _DIGEST_RE.match(digest):
+        return None
+    path = (directory or CHART_DIR) / f"{digest}.{fmt}"
+    try:
+        return path.read_bytes()
+    except OSError:
+        return None
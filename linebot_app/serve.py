@@ -0,0 +1,80 @@
+"""
+Multi-process launcher: one storage writer plus N uvicorn webhook workers.
+
+    python -m linebot_app.serve --workers 4 --port 8000
+
+Each worker keeps its own job queue and in-memory cache tier; the SQLite
+analysis cache is shared, and every meal write goes through the single
+writer process (see linebot_app.writer). On SIGTERM/SIGINT uvicorn drains
+the workers first (each finishes its queued jobs and flushes its saves),
+then the writer commits whatever is left and exits. The writer ignores
+signals sent to the process group so it outlives the draining workers.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import secrets
+import shutil
+import tempfile
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+WRITER_START_TIMEOUT = 30.0
+WRITER_STOP_TIMEOUT = 60.0
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the LINE webhook on several worker processes.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--socket", help="unix socket for the storage writer (default: private temp dir)")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0, help="seconds to wait for open requests on shutdown")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    import uvicorn
+
+    from .storage import DB_PATH
+    from .writer import run_writer
+
+    socket_dir = tempfile.mkdtemp(prefix="snapbite-")
+    address = args.socket or os.path.join(socket_dir, "writer.sock")
+    authkey = secrets.token_bytes(32)
+
+    context = multiprocessing.get_context("spawn")
+    ready, stop = context.Event(), context.Event()
+    writer = context.Process(
+        target=run_writer, args=(address, authkey, str(DB_PATH), ready, stop), name="snapbite-storage-writer"
+    )
+    writer.start()
+    try:
+        if not ready.wait(WRITER_START_TIMEOUT):
+            raise SystemExit("storage writer did not start")
+        # Inherited by the uvicorn workers, which route saves to the writer.
+        os.environ["SNAPBITE_STORAGE_WRITER"] = address
+        os.environ["SNAPBITE_STORAGE_WRITER_AUTHKEY"] = authkey.hex()
+        uvicorn.run(
+            "linebot_app.webhook:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            timeout_graceful_shutdown=args.graceful_timeout,
+        )
+    finally:
+        # Workers have exited; the writer commits its queue and stops.
+        stop.set()
+        writer.join(WRITER_STOP_TIMEOUT)
+        if writer.is_alive():
+            logger.error("Storage writer did not stop in time, killing it")
+            writer.kill()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
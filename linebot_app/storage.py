@@ -1,11 +1,38 @@
+import atexit
 import json
+import logging
+import math
 import os
+import queue
 import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+from zoneinfo import ZoneInfo
 
-DB_PATH = Path(os.getenv("SNAPBITE_DB_PATH", "data/snapbite.db"))
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+import numpy as np
+
+from source.metrics import stage
+from source.nutrient_table import table_from_analyses
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = Path(os.getenv("SNAPBITE_DB_PATH", "data/snapbite.db"))  # parent is created on first connect
+
+WRITE_QUEUE_SIZE = int(os.getenv("SNAPBITE_WRITE_QUEUE_SIZE", "1000"))
+WRITE_BATCH_SIZE = int(os.getenv("SNAPBITE_WRITE_BATCH_SIZE", "50"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("SNAPBITE_WRITE_FLUSH_INTERVAL", "0.5"))
+WRITE_ENQUEUE_TIMEOUT = float(os.getenv("SNAPBITE_WRITE_ENQUEUE_TIMEOUT", "2"))
+# Unix socket of the shared writer process (set by linebot_app.serve); when
+# set, saves go there instead of to an in-process writer thread.
+STORAGE_WRITER_ADDRESS = os.getenv("SNAPBITE_STORAGE_WRITER")
+# A message claimed for analysis (see claim_message) that has not produced a
+# meal after this many seconds is assumed abandoned and may be claimed again.
+CLAIM_TIMEOUT = float(os.getenv("SNAPBITE_MESSAGE_CLAIM_TIMEOUT", "300"))
+# Daily rollups are bucketed by the users' local calendar day.
+LOCAL_TZ = ZoneInfo(os.getenv("SNAPBITE_TIMEZONE", "Asia/Taipei"))
 
 _CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS meal_analysis (
@@ -17,27 +44,590 @@ CREATE TABLE IF NOT EXISTS meal_analysis (
 );
 """
 
+_SCHEMA_SQL = (
+    """
+    CREATE TABLE IF NOT EXISTS meal_item (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        meal_id INTEGER NOT NULL REFERENCES meal_analysis (id),
+        user_id TEXT,
+        created_at TIMESTAMP,
+        name TEXT,
+        portion_size TEXT,
+        calories REAL,
+        carbs REAL,
+        protein REAL,
+        fat REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_totals (
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        calories REAL NOT NULL DEFAULT 0,
+        carbs REAL NOT NULL DEFAULT 0,
+        protein REAL NOT NULL DEFAULT 0,
+        fat REAL NOT NULL DEFAULT 0,
+        meal_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    )
+    """,
+    # Durable idempotency record: one row per LINE message that produced a meal,
+    # or with a NULL meal_id, one that a worker has claimed and is analyzing.
+    """
+    CREATE TABLE IF NOT EXISTS processed_message (
+        message_id TEXT PRIMARY KEY,
+        meal_id INTEGER REFERENCES meal_analysis (id),
+        created_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_meal_analysis_user_created ON meal_analysis (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_meal_item_user_created ON meal_item (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_meal_item_meal ON meal_item (meal_id)",
+    "CREATE INDEX IF NOT EXISTS idx_daily_totals_day ON daily_totals (day)",
+)
 
-def _init_db() -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(_CREATE_TABLE_SQL)
+_UPSERT_DAILY_SQL = """
+INSERT INTO daily_totals (user_id, day, calories, carbs, protein, fat, meal_count)
+VALUES (?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT (user_id, day) DO UPDATE SET
+    calories = calories + excluded.calories,
+    carbs = carbs + excluded.carbs,
+    protein = protein + excluded.protein,
+    fat = fat + excluded.fat,
+    meal_count = meal_count + 1
+"""
+
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+_STOP = object()
+
+# (name, portion_size, calories, carbs, protein, fat)
+ItemRow = Tuple[str, str, Optional[float], Optional[float], Optional[float], Optional[float]]
+
+
+class MealRecord(NamedTuple):
+    user_id: str
+    message_id: str
+    analysis_json: str
+    created_at: str
+    day: str
+    items: List[ItemRow]
+    # Other photos analyzed together with message_id; they get receipts for the same meal.
+    extra_message_ids: Tuple[str, ...] = ()
+
+    @property
+    def message_ids(self) -> Tuple[str, ...]:
+        return tuple(m for m in (self.message_id, *self.extra_message_ids) if m)
+
+
+class StorageFullError(RuntimeError):
+    """Raised when the write-behind queue stays full past the enqueue timeout."""
 
 
-def save_analysis_log(user_id: str, message_id: str, analysis: Any) -> None:
+def _utc_timestamp(now: Optional[datetime] = None) -> str:
+    # Same layout as SQLite's CURRENT_TIMESTAMP.
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def local_day(created_at: str) -> str:
+    """
+    Map a UTC ``created_at`` timestamp to the local calendar day (YYYY-MM-DD).
     """
-    Save analysis data for a message into SQLite.
+    moment = datetime.strptime(created_at[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return moment.astimezone(LOCAL_TZ).date().isoformat()
+
+
+def local_day_bounds(day: str) -> Tuple[str, str]:
     """
-    _init_db()
+    UTC ``created_at`` bounds [start, end) covering local calendar ``day``.
+    """
+    start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=LOCAL_TZ)
+    end = start + timedelta(days=1)
+    return _utc_timestamp(start), _utc_timestamp(end)
+
+
+def _as_dict(analysis: Any) -> Dict[str, Any]:
+    if hasattr(analysis, "model_dump"):
+        return analysis.model_dump()
+    return analysis if isinstance(analysis, dict) else {}
+
+
+def meal_items_from_analysis(analysis: Any) -> List[ItemRow]:
+    """
+    Flatten a NutritionAnalysis (model or dict) into numeric item rows.
+    Amounts go through nutrient_table's bulk parser; unparseable ones are
+    None (stored as NULL).
+    """
+    items = [item for item in _as_dict(analysis).get("food_items") or [] if isinstance(item, dict)]
+    if not items:
+        return []
+    table = table_from_analyses([{"food_items": items}])
+    amounts = np.column_stack([table.calories, table.carbs, table.protein, table.fat]).tolist()
+    return [
+        (str(item.get("name", "")), str(item.get("portion_size", "")), *(None if math.isnan(v) else v for v in row))
+        for item, row in zip(items, amounts)
+    ]
+
+
+def _item_totals(items: Iterable[ItemRow]) -> Tuple[float, float, float, float]:
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for item in items:
+        for i, value in enumerate(item[2:]):
+            totals[i] += value or 0.0
+    return tuple(totals)
+
+
+def _serialize_analysis(analysis: Any) -> str:
     if analysis is None:
-        analysis_json = ""
-    elif hasattr(analysis, "model_dump_json"):
-        analysis_json = analysis.model_dump_json()
-    else:
-        analysis_json = json.dumps(analysis, ensure_ascii=False)
+        return ""
+    if hasattr(analysis, "model_dump_json"):
+        return analysis.model_dump_json()
+    return json.dumps(analysis, ensure_ascii=False)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT INTO meal_analysis (user_id, message_id, analysis_json) VALUES (?, ?, ?)",
-            (user_id, message_id, analysis_json),
+
+def open_connection(db_path: Union[str, Path] = DB_PATH, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Open a connection with the WAL and cache pragmas used across SnapBite.
+    """
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class StorageEngine:
+    """
+    Owns the SQLite schema and a single writer thread.
+
+    Saves are queued and written in batched transactions once ``batch_size``
+    rows are waiting or ``flush_interval`` seconds have passed. When the
+    queue is full, callers block for up to ``enqueue_timeout`` seconds and
+    then get StorageFullError.
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, Path] = DB_PATH,
+        batch_size: int = WRITE_BATCH_SIZE,
+        flush_interval: float = WRITE_FLUSH_INTERVAL,
+        max_queue: int = WRITE_QUEUE_SIZE,
+        enqueue_timeout: float = WRITE_ENQUEUE_TIMEOUT,
+    ):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        # Serializes the writer connection between batch writes and claims.
+        self._conn_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._closed = False
+        # Queued but not yet committed records, so lookups see them before the write lands.
+        self._unwritten: Dict[str, MealRecord] = {}
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def pending_record(self, message_id: str) -> Optional[MealRecord]:
+        with self._lock:
+            return self._unwritten.get(message_id)
+
+    def start(self) -> "StorageEngine":
+        with self._lock:
+            if self._thread is not None:
+                return self
+            conn = open_connection(self.db_path, check_same_thread=False)
+            self._create_schema(conn)
+            self._conn = conn
+            self._thread = threading.Thread(
+                target=self._run, args=(conn,), name="snapbite-storage-writer", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        create_schema(conn)
+
+    def save_analysis(self, user_id: str, message_id: str, analysis: Any, extra_message_ids: Sequence[str] = ()) -> None:
+        if self._closed:
+            raise RuntimeError("StorageEngine is closed")
+        created_at = _utc_timestamp()
+        record = MealRecord(
+            user_id=user_id,
+            message_id=message_id,
+            analysis_json=_serialize_analysis(analysis),
+            created_at=created_at,
+            day=local_day(created_at),
+            items=meal_items_from_analysis(analysis),
+            extra_message_ids=tuple(extra_message_ids),
         )
-        conn.commit()
+        if message_id:
+            with self._lock:
+                if message_id in self._unwritten:
+                    logger.info("Message %s already queued, skipping duplicate save", message_id)
+                    return
+                for key in record.message_ids:
+                    self._unwritten[key] = record
+        try:
+            self._queue.put(record, timeout=self.enqueue_timeout)
+        except queue.Full as exc:
+            self._forget([record])
+            raise StorageFullError(f"write queue full ({self._queue.maxsize} rows pending)") from exc
+
+    def claim_message(self, message_id: str, timeout: float) -> bool:
+        """
+        Claim a message on the writer connection; commits before returning.
+        """
+        with self._conn_lock:
+            if self._conn is None:
+                raise RuntimeError("StorageEngine is closed")
+            with self._conn:
+                return claim_row(self._conn, message_id, timeout)
+
+    def release_messages(self, message_ids: Sequence[str]) -> None:
+        with self._conn_lock:
+            if self._conn is None:
+                raise RuntimeError("StorageEngine is closed")
+            with self._conn:
+                release_rows(self._conn, message_ids)
+
+    def _forget(self, records: List[MealRecord]) -> None:
+        with self._lock:
+            for record in records:
+                for key in record.message_ids:
+                    if self._unwritten.get(key) is record:
+                        del self._unwritten[key]
+
+    def flush(self) -> None:
+        """
+        Block until every row queued so far has been committed.
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """
+        Flush outstanding writes and stop the writer thread.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+
+    def _run(self, conn: sqlite3.Connection) -> None:
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    with stage("sqlite_write"):
+                        self._write_batch(conn, batch)
+                    self._forget(batch)
+                    for _ in batch:
+                        self._queue.task_done()
+                if stop:
+                    self._queue.task_done()
+                    return
+        finally:
+            with self._conn_lock:
+                self._conn = None
+                conn.close()
+
+    def _next_batch(self) -> Tuple[List[MealRecord], bool]:
+        batch: List[MealRecord] = []
+        item = self._queue.get()
+        if item is _STOP:
+            return batch, True
+        batch.append(item)
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[MealRecord]) -> None:
+        with self._conn_lock:
+            self._write_records(conn, batch)
+
+    def _write_records(self, conn: sqlite3.Connection, batch: List[MealRecord]) -> None:
+        try:
+            with conn:
+                for record in batch:
+                    insert_meal(conn, record)
+        except sqlite3.Error:
+            logger.exception("Batch write of %d rows failed, retrying row by row", len(batch))
+            for record in batch:
+                try:
+                    with conn:
+                        insert_meal(conn, record)
+                except sqlite3.Error:
+                    logger.exception("Dropping analysis row for message %s", record.message_id)
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    """
+    Create or upgrade every table and index. Safe to run repeatedly.
+    """
+    with conn:
+        conn.execute(_CREATE_TABLE_SQL)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(meal_analysis)")}
+        if "item_count" not in columns:
+            # NULL marks legacy rows that the backfill has not normalized yet.
+            conn.execute("ALTER TABLE meal_analysis ADD COLUMN item_count INTEGER")
+        for statement in _SCHEMA_SQL:
+            conn.execute(statement)
+
+
+def add_meal_items(conn: sqlite3.Connection, meal_id: int, user_id: str, created_at: str, day: str, items: List[ItemRow]) -> None:
+    """
+    Insert a meal's item rows and fold them into the daily rollup.
+    Must run inside the caller's transaction.
+    """
+    conn.executemany(
+        "INSERT INTO meal_item (meal_id, user_id, created_at, name, portion_size, calories, carbs, protein, fat) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(meal_id, user_id, created_at, *item) for item in items],
+    )
+    if items:
+        conn.execute(_UPSERT_DAILY_SQL, (user_id, day, *_item_totals(items)))
+    conn.execute("UPDATE meal_analysis SET item_count = ? WHERE id = ?", (len(items), meal_id))
+
+
+def insert_meal(conn: sqlite3.Connection, record: MealRecord) -> Optional[int]:
+    """
+    Insert a meal with its items and rollup. Returns None, writing nothing,
+    when the message was already recorded (e.g. a LINE redelivery).
+    """
+    if record.message_id:
+        # Takes over this message's claim row, if any; fails only when a meal exists.
+        cur = conn.execute(
+            "INSERT INTO processed_message (message_id, created_at) VALUES (?, ?) "
+            "ON CONFLICT (message_id) DO UPDATE SET created_at = excluded.created_at WHERE meal_id IS NULL",
+            (record.message_id, record.created_at),
+        )
+        if cur.rowcount == 0:
+            logger.info("Message %s already recorded, skipping duplicate", record.message_id)
+            return None
+    cur = conn.execute(
+        "INSERT INTO meal_analysis (user_id, message_id, analysis_json, created_at) VALUES (?, ?, ?, ?)",
+        (record.user_id, record.message_id, record.analysis_json, record.created_at),
+    )
+    meal_id = cur.lastrowid
+    if record.message_id:
+        conn.execute("UPDATE processed_message SET meal_id = ? WHERE message_id = ?", (meal_id, record.message_id))
+        conn.executemany(
+            "INSERT INTO processed_message (message_id, meal_id, created_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (message_id) DO UPDATE SET meal_id = excluded.meal_id WHERE meal_id IS NULL",
+            [(extra, meal_id, record.created_at) for extra in record.extra_message_ids if extra],
+        )
+    add_meal_items(conn, meal_id, record.user_id, record.created_at, record.day, record.items)
+    return meal_id
+
+
+def claim_row(conn: sqlite3.Connection, message_id: str, timeout: float) -> bool:
+    """
+    Insert a claim row for ``message_id``, or take over one older than
+    ``timeout`` seconds. False when it has a meal or a live claim. Must run
+    inside the caller's transaction.
+    """
+    now = datetime.now(timezone.utc)
+    stale = _utc_timestamp(now - timedelta(seconds=timeout))
+    cur = conn.execute(
+        "INSERT INTO processed_message (message_id, created_at) VALUES (?, ?) "
+        "ON CONFLICT (message_id) DO UPDATE SET created_at = excluded.created_at "
+        "WHERE meal_id IS NULL AND created_at < ?",
+        (message_id, _utc_timestamp(now), stale),
+    )
+    return cur.rowcount == 1
+
+
+def release_rows(conn: sqlite3.Connection, message_ids: Sequence[str]) -> None:
+    """
+    Delete claim rows that have no meal. Must run inside the caller's transaction.
+    """
+    conn.executemany(
+        "DELETE FROM processed_message WHERE message_id = ? AND meal_id IS NULL",
+        [(message_id,) for message_id in message_ids],
+    )
+
+
+_engine: Optional[StorageEngine] = None
+_engine_lock = threading.Lock()
+_readers = threading.local()
+
+
+def _reset_after_fork() -> None:
+    # SQLite connections and the writer thread must not be shared with a forked child.
+    global _engine, _readers
+    _engine = None
+    _readers = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _reader() -> sqlite3.Connection:
+    conn = getattr(_readers, "conn", None)
+    if conn is None or getattr(_readers, "path", None) != DB_PATH:
+        conn = open_connection(DB_PATH)
+        create_schema(conn)
+        _readers.conn, _readers.path = conn, DB_PATH
+    return conn
+
+
+def get_engine() -> StorageEngine:
+    """
+    Return the process-wide storage engine, starting it on first use.
+    With a shared writer configured this is a RemoteStorageEngine.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            if STORAGE_WRITER_ADDRESS:
+                from .writer import RemoteStorageEngine
+
+                _engine = RemoteStorageEngine(STORAGE_WRITER_ADDRESS)
+            else:
+                _engine = StorageEngine(DB_PATH).start()
+            atexit.register(_engine.close)
+        return _engine
+
+
+def save_analysis_log(user_id: str, message_id: str, analysis: Any, extra_message_ids: Sequence[str] = ()) -> None:
+    """
+    Queue analysis data for a message to be written into SQLite.
+    ``extra_message_ids`` are other photos of the same meal, recorded as
+    processed without adding a second meal.
+    """
+    get_engine().save_analysis(
+        user_id=user_id, message_id=message_id, analysis=analysis, extra_message_ids=extra_message_ids
+    )
+
+
+def claim_message(message_id: str, timeout: Optional[float] = None) -> bool:
+    """
+    Mark a message as being analyzed, across every worker sharing DB_PATH.
+    False when it already has a meal or another live claim. The claim turns
+    into the meal's receipt when the analysis is saved; release_messages
+    drops it when there is nothing to save.
+    """
+    # Goes to the writer synchronously, bypassing the write-behind queue:
+    # the claim has to commit before the analysis starts.
+    return get_engine().claim_message(message_id, CLAIM_TIMEOUT if timeout is None else timeout)
+
+
+def release_messages(message_ids: Sequence[str]) -> None:
+    """
+    Drop claims that did not produce a meal, so a redelivery can retry them.
+    """
+    get_engine().release_messages(tuple(message_ids))
+
+
+def fetch_analysis_by_message(message_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Stored analysis for a LINE message, including saves still queued for
+    writing. None when the message has not been processed.
+    """
+    engine = _engine
+    record = engine.pending_record(message_id) if engine is not None else None
+    if record is not None:
+        analysis_json = record.analysis_json
+    else:
+        row = _reader().execute(
+            "SELECT a.analysis_json FROM processed_message p JOIN meal_analysis a ON a.id = p.meal_id "
+            "WHERE p.message_id = ?",
+            (message_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        analysis_json = row[0]
+    try:
+        return json.loads(analysis_json) if analysis_json else {}
+    except ValueError:
+        return {}
+
+
+def fetch_daily_totals(user_id: str, start_day: str, end_day: str) -> List[Dict[str, Any]]:
+    """
+    Rollup rows for ``user_id`` with start_day <= day <= end_day (YYYY-MM-DD).
+    """
+    rows = _reader().execute(
+        "SELECT day, calories, carbs, protein, fat, meal_count FROM daily_totals "
+        "WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+        (user_id, start_day, end_day),
+    ).fetchall()
+    keys = ("day", "calories", "carbs", "protein", "fat", "meal_count")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def fetch_active_users(day: str) -> List[str]:
+    """
+    Users with at least one recorded meal on local ``day``.
+    """
+    rows = _reader().execute(
+        "SELECT user_id FROM daily_totals WHERE day = ? AND meal_count > 0 ORDER BY user_id", (day,)
+    ).fetchall()
+    return [row[0] for row in rows if row[0]]
+
+
+def fetch_meal_items(user_id: str, since: str, until: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Item rows for ``user_id`` created in [since, until) (UTC timestamps), via the user/time index.
+    """
+    until = until or "9999-12-31 23:59:59"
+    rows = _reader().execute(
+        "SELECT meal_id, created_at, name, portion_size, calories, carbs, protein, fat FROM meal_item "
+        "WHERE user_id = ? AND created_at >= ? AND created_at < ? ORDER BY created_at, id",
+        (user_id, since, until),
+    ).fetchall()
+    keys = ("meal_id", "created_at", "name", "portion_size", "calories", "carbs", "protein", "fat")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def pending_writes() -> int:
+    """
+    Rows queued for the writer; 0 when the engine has not been started.
+    With a shared writer this asks the writer process, so it may block.
+    """
+    engine = _engine
+    return engine.pending if engine is not None else 0
+
+
+def flush() -> None:
+    """
+    Wait for queued analysis rows to reach the database.
+    """
+    if _engine is not None:
+        _engine.flush()
+
+
+def close() -> None:
+    """
+    Flush and stop the process-wide storage engine, if it was started.
+    """
+    if _engine is not None:
+        _engine.close()
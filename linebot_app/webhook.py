@@ -1,34 +1,125 @@
+import asyncio
+import logging
 import os
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import PlainTextResponse
-from dotenv import load_dotenv
-from linebot import LineBotApi, WebhookParser
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import ImageMessage, MessageEvent, TextMessage
+from contextlib import asynccontextmanager
+from functools import partial
 
-from .handler import handle_image_message, handle_text_message
+from dotenv import load_dotenv
 
+# Before the imports below: they read their SNAPBITE_* settings at import time.
 load_dotenv()
 
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request  # noqa: E402
+from fastapi.responses import PlainTextResponse, Response  # noqa: E402
+from linebot import WebhookParser  # noqa: E402
+from linebot.exceptions import InvalidSignatureError  # noqa: E402
+from linebot.models import ImageMessage, MessageEvent  # noqa: E402
+
+from source.chart_render import get_renderer, mime_type  # noqa: E402
+from source.metrics import REGISTRY  # noqa: E402
+from . import storage  # noqa: E402
+from .admission import AdmissionController, Decision  # noqa: E402
+from .budget import BudgetPolicy  # noqa: E402
+from .coalesce import Coalescer, ImageBatch  # noqa: E402
+from .handler import analyst, event_priority, process_event, send_rejection  # noqa: E402
+from .jobs import JobQueue, QueueFullError  # noqa: E402
+from .line_client import AsyncLineClient, LineClient  # noqa: E402
+from .report import load_chart  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
 CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SNAPBITE_SHUTDOWN_DRAIN_TIMEOUT", "25"))
 
 if not CHANNEL_ACCESS_TOKEN or not CHANNEL_SECRET:
     raise RuntimeError("LINE credentials missing. Please set LINE_CHANNEL_ACCESS_TOKEN and LINE_CHANNEL_SECRET.")
 
-line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN)
+# One pooled client for the process; workers reach it through the blocking
+# facade, which runs each call on the event loop bound in lifespan.
+line_client = AsyncLineClient(CHANNEL_ACCESS_TOKEN)
+line_bot_api = LineClient(line_client)
 parser = WebhookParser(CHANNEL_SECRET)
 
-app = FastAPI(title="SnapBite LINE Webhook")
+# Cheaper analyses while the queue is deep or replies run past the latency SLO.
+budgets = BudgetPolicy(lambda: job_queue.load)
+job_queue = JobQueue(partial(process_event, line_bot_api=line_bot_api, budgets=budgets))
+admission = AdmissionController()
+
+
+def submit_photos(events) -> None:
+    """
+    Queue a coalesced photo group. Runs after the webhook has answered, so a
+    full queue can only be reported to the user, not to LINE.
+    """
+    try:
+        job_queue.submit(ImageBatch(events) if len(events) > 1 else events[0])
+    except QueueFullError:
+        logger.warning("Job queue full, dropping %d coalesced photo(s)", len(events))
+        notice = Decision(False, "shed", notify=True)
+        asyncio.get_running_loop().run_in_executor(None, send_rejection, events[-1], notice, line_bot_api)
+
+
+coalescer = Coalescer(submit_photos)
+
+WEBHOOK_EVENTS = REGISTRY.counter(
+    "snapbite_webhook_events_total", "Message events by admission outcome.", labelnames=("decision",)
+)
+REGISTRY.gauge("snapbite_job_queue_depth", "Events waiting for a worker.", lambda: job_queue.depth)
+REGISTRY.gauge("snapbite_storage_pending_writes", "Analysis rows waiting for the SQLite writer.", storage.pending_writes)
+REGISTRY.gauge("snapbite_llm_in_flight", "OpenAI calls currently running.", lambda: analyst.gateway.in_flight)
+REGISTRY.gauge("snapbite_response_budget_level", "Analysis budget level (0 full, 1 reduced, 2 minimal).", lambda: budgets.level)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    line_bot_api.bind(asyncio.get_running_loop())
+    await job_queue.start()
+    try:
+        yield
+    finally:
+        coalescer.flush_all()
+        await job_queue.stop(drain=True, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        storage.close()
+        analyst.gateway.close()
+        await line_client.aclose()
+
+
+app = FastAPI(title="SnapBite LINE Webhook", lifespan=lifespan)
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "queue_depth": job_queue.depth,
+        "coalescing_photos": len(coalescer),
+        "analysis_cache": analyst.cache.stats() if analyst.cache else {},
+        "llm": analyst.gateway.stats(),
+        "admission": admission.stats(),
+        "response_budget": budgets.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Off the loop: some gauges (e.g. the shared writer's queue) are read over IPC.
+    body = await asyncio.get_running_loop().run_in_executor(None, REGISTRY.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/charts/{digest}.{fmt}")
+async def chart_image(digest: str, fmt: str):
+    if fmt not in ("png", "webp"):
+        raise HTTPException(status_code=404, detail="Chart not found")
+    blob = get_renderer().get_blob(digest) or load_chart(digest, fmt)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Chart not found")
+    return Response(content=blob, media_type=mime_type(fmt), headers={"Cache-Control": "public, max-age=86400"})
 
 
 @app.post("/callback", response_class=PlainTextResponse)
-async def callback(request: Request):
+async def callback(request: Request, background_tasks: BackgroundTasks):
     signature = request.headers.get("X-Line-Signature", "")
     body = (await request.body()).decode("utf-8")
 
@@ -37,18 +128,39 @@ async def callback(request: Request):
     except InvalidSignatureError as exc:
         raise HTTPException(status_code=400, detail="Invalid signature") from exc
 
+    accepted = False
     for event in events:
         if not isinstance(event, MessageEvent):
             continue
 
-        if isinstance(event.message, TextMessage):
-            replies = handle_text_message(event)
-        elif isinstance(event.message, ImageMessage):
-            replies = await handle_image_message(event, line_bot_api)
-        else:
-            replies = handle_text_message(event, unsupported=True)
+        priority, cost = event_priority(event)
+        user_id = getattr(event.source, "user_id", "") or ""
+        decision = admission.admit(user_id, priority, cost, load=job_queue.load)
+        WEBHOOK_EVENTS.inc(1, decision.reason)
+        if not decision.admitted:
+            logger.info("Not admitting event %s: %s", event.message.id, decision.reason)
+            if decision.notify:
+                # Sent after the response, on the threadpool, so the webhook still answers fast.
+                background_tasks.add_task(send_rejection, event, decision, line_bot_api)
+            continue
 
-        if replies:
-            line_bot_api.reply_message(event.reply_token, replies)
+        try:
+            if isinstance(event.message, ImageMessage):
+                if job_queue.load >= 1.0:
+                    raise QueueFullError("job queue is full")
+                coalescer.add(event)
+            else:
+                job_queue.submit(event)
+            accepted = True
+        except QueueFullError as exc:
+            if not accepted:
+                # Nothing from this body is queued yet, so a non-2xx response
+                # safely makes LINE redeliver the whole batch later.
+                logger.warning("Rejecting webhook: %s", exc)
+                raise HTTPException(status_code=503, detail="Server busy") from exc
+            # Earlier events are already queued and would run twice on a
+            # redelivery; acknowledge and tell this sender to retry instead.
+            logger.warning("Job queue full, dropping event %s: %s", event.message.id, exc)
+            background_tasks.add_task(send_rejection, event, Decision(False, "shed", notify=True), line_bot_api)
 
     return PlainTextResponse("OK")
@@ -0,0 +1,251 @@
+"""
+Single-writer storage process for multi-worker deployments.
+
+One process owns the StorageEngine (and so the only SQLite write
+connection); webhook workers hand it saves and message claims over a local
+unix socket through RemoteStorageEngine, which mirrors the StorageEngine
+methods that ``storage`` calls. Reads still go straight to SQLite from each worker —
+WAL lets them run alongside the writer.
+
+Requests are small pickled tuples on a multiprocessing Connection:
+
+    ("save", user_id, message_id, analysis, extra_message_ids) -> ("ok", None)
+    ("pending", message_id)                 -> ("ok", MealRecord | None)
+    ("flush",)                              -> ("ok", None)
+    ("stats",)                              -> ("ok", queued row count)
+    ("claim", message_id, timeout)          -> ("ok", bool)
+    ("release", message_ids)                -> ("ok", None)
+
+Claims and releases are committed before the response is sent.
+
+Failures come back as ("error", exception) and are re-raised in the caller.
+"""
+import logging
+import os
+import signal
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Union
+
+from .storage import DB_PATH, MealRecord, StorageEngine
+
+logger = logging.getLogger(__name__)
+
+WRITER_CONNECT_TIMEOUT = float(os.getenv("SNAPBITE_WRITER_CONNECT_TIMEOUT", "10"))
+
+
+def _authkey_from_env() -> bytes:
+    return bytes.fromhex(os.getenv("SNAPBITE_STORAGE_WRITER_AUTHKEY", ""))
+
+
+class WriterServer:
+    """
+    Serves StorageEngine calls from other processes, one thread per connection.
+    """
+
+    def __init__(self, engine: StorageEngine, address: str, authkey: bytes):
+        self.engine = engine
+        self.address = address
+        self.authkey = authkey
+        self._listener: Optional[Listener] = None
+        self._connections: List[Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self) -> "WriterServer":
+        if os.path.exists(self.address):
+            os.unlink(self.address)  # stale socket from a crashed writer
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        threading.Thread(target=self._accept_loop, name="snapbite-writer-accept", daemon=True).start()
+        return self
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._closed:
+                    return
+                logger.exception("Rejected storage writer connection")
+                continue
+            with self._lock:
+                self._connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), name="snapbite-writer-conn", daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    response = ("ok", self._dispatch(request))
+                except Exception as exc:
+                    response = ("error", exc)
+                conn.send(response)
+        finally:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def _dispatch(self, request: tuple) -> Any:
+        op, *args = request
+        if op == "save":
+            user_id, message_id, analysis, extra_message_ids = args
+            return self.engine.save_analysis(
+                user_id=user_id, message_id=message_id, analysis=analysis, extra_message_ids=extra_message_ids
+            )
+        if op == "pending":
+            return self.engine.pending_record(args[0])
+        if op == "flush":
+            return self.engine.flush()
+        if op == "stats":
+            return self.engine.pending
+        if op == "claim":
+            return self.engine.claim_message(*args)
+        if op == "release":
+            return self.engine.release_messages(args[0])
+        raise ValueError(f"unknown storage writer request: {op!r}")
+
+    def close(self) -> None:
+        """
+        Stop accepting connections, then commit everything already queued.
+        """
+        self._closed = True
+        if self._listener is not None:
+            self._listener.close()
+        self.engine.close()
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+def run_writer(address: str, authkey: bytes, db_path: Union[str, Path] = DB_PATH, ready=None, stop=None) -> None:
+    """
+    Process entry point: serve until ``stop`` is set (or SIGTERM when no
+    ``stop`` event is given) or the parent dies, then drain the write queue.
+    """
+    logging.basicConfig(level=logging.INFO)
+    # Signals sent to the whole process group (Ctrl-C, some supervisors) must
+    # not stop the writer while workers are still draining into it; the
+    # launcher sets ``stop`` once they have exited.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if stop is None:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    else:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    parent = os.getppid()
+
+    server = WriterServer(StorageEngine(db_path).start(), address, authkey).start()
+    logger.info("Storage writer for %s listening on %s", db_path, address)
+    if ready is not None:
+        ready.set()
+    while not stop.wait(1.0):
+        if os.getppid() != parent:
+            logger.warning("Launcher exited; stopping storage writer")
+            break
+    logger.info("Storage writer draining %d queued rows", server.engine.pending)
+    server.close()
+
+
+class RemoteStorageEngine:
+    """
+    StorageEngine stand-in that forwards to a WriterServer.
+
+    Connections are not thread-safe, so each worker thread gets its own.
+    """
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None, connect_timeout: float = WRITER_CONNECT_TIMEOUT):
+        self.address = address
+        self.authkey = authkey if authkey is not None else _authkey_from_env()
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+        self._connections: List[Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self) -> "RemoteStorageEngine":
+        return self
+
+    def _connect(self) -> Connection:
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The writer may still be starting (or restarting).
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+        with self._lock:
+            self._connections.append(conn)
+        self._local.conn = conn
+        return conn
+
+    def _drop(self, conn: Connection) -> None:
+        self._local.conn = None
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+
+    def _call(self, *request) -> Any:
+        if self._closed:
+            raise RuntimeError("RemoteStorageEngine is closed")
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None) or self._connect()
+            try:
+                conn.send(request)
+                status, value = conn.recv()
+                break
+            except (EOFError, OSError):
+                self._drop(conn)
+                if attempt:
+                    raise
+        if status == "error":
+            raise value
+        return value
+
+    @property
+    def pending(self) -> int:
+        return self._call("stats")
+
+    def pending_record(self, message_id: str) -> Optional[MealRecord]:
+        return self._call("pending", message_id)
+
+    def save_analysis(self, user_id: str, message_id: str, analysis: Any, extra_message_ids: Sequence[str] = ()) -> None:
+        self._call("save", user_id, message_id, analysis, tuple(extra_message_ids))
+
+    def claim_message(self, message_id: str, timeout: float) -> bool:
+        return self._call("claim", message_id, timeout)
+
+    def release_messages(self, message_ids: Sequence[str]) -> None:
+        self._call("release", tuple(message_ids))
+
+    def flush(self) -> None:
+        self._call("flush")
+
+    def close(self) -> None:
+        """
+        Wait for this worker's saves to be committed, then disconnect.
+        """
+        if self._closed:
+            return
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush the storage writer before closing")
+        self._closed = True
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
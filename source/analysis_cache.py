@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image
+
+from .cache import LRUCache, SQLiteCache, TieredCache
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("SNAPBITE_ANALYSIS_CACHE_SIZE", "512"))
+ANALYSIS_CACHE_TTL = float(os.getenv("SNAPBITE_ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("SNAPBITE_NEAR_DUPLICATE_DISTANCE", "3"))
+
+# Bump when the vision prompt or output schema changes so old entries stop matching.
+ANALYSIS_CACHE_VERSION = 1
+
+
+def image_digest(data: bytes) -> str:
+    """
+    Exact content hash of the raw image bytes.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(data: Union[bytes, Image.Image]) -> Optional[str]:
+    """
+    64-bit difference hash (dHash) that survives re-encoding and resizing.
+
+    Pass the already-decoded (downscaled) image when there is one; raw bytes
+    are decoded here. Returns None when the bytes cannot be decoded.
+    """
+    try:
+        if isinstance(data, Image.Image):
+            small = data.convert("L").resize((9, 8), Image.LANCZOS)
+        else:
+            with Image.open(BytesIO(data)) as img:
+                img.draft("L", (64, 64))  # JPEG decodes at 1/8 scale; the hash needs 9x8
+                small = img.convert("L").resize((9, 8), Image.LANCZOS)
+    except Exception:
+        return None
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:016x}"
+
+
+def config_fingerprint(vision_model: str, reference_object: dict, language: str, mode: str = "full") -> str:
+    """
+    Hash of every setting that changes what the vision model would return.
+    """
+    config = {
+        "v": ANALYSIS_CACHE_VERSION,
+        "model": vision_model,
+        "reference": reference_object,
+        "language": language,
+    }
+    if mode != "full":
+        # Only added for non-default modes so existing cache entries stay valid.
+        config["mode"] = mode
+    payload = json.dumps(
+        config,
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class ImageKey(NamedTuple):
+    exact: str
+    phash: Optional[str]
+    bands: Tuple[str, ...]
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of vision analysis results keyed on image content.
+
+    Exact copies match on the SHA-256 of the bytes. Re-encoded or resized
+    copies match when their perceptual hashes are within
+    ``max_distance`` bits; the hash is split into 16-bit bands so candidates
+    are found by indexed lookups instead of a scan. Near-duplicates only
+    match within one ``scope`` (the sender): two users' similar-looking
+    plates can hold different meals.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Union[str, Path]] = None,
+        max_entries: int = ANALYSIS_CACHE_SIZE,
+        ttl: Optional[float] = ANALYSIS_CACHE_TTL,
+        max_distance: int = NEAR_DUPLICATE_DISTANCE,
+        table: str = "analysis_cache",
+    ):
+        if max_distance > 3:
+            # Four bands only guarantee a shared band for distances up to 3.
+            raise ValueError("max_distance must be at most 3")
+        persistent = SQLiteCache(db_path, table, ttl=ttl) if db_path else None
+        self._cache = TieredCache(LRUCache(max_entries=max_entries, ttl=ttl), persistent)
+        self.max_distance = max_distance
+
+    @staticmethod
+    def keys_for(data: bytes, config_key: str, scope: str = "", image: Optional[Image.Image] = None) -> ImageKey:
+        """
+        Cache keys for ``data``. Without a ``scope`` only exact copies match.
+        ``image`` is the decoded picture, when available, to hash instead of
+        decoding ``data`` again.
+        """
+        phash = perceptual_hash(image if image is not None else data) if scope else None
+        bands: Tuple[str, ...] = ()
+        if phash:
+            bands = tuple(f"{config_key}:{scope}:dhash{i}:{phash[i * 4:(i + 1) * 4]}" for i in range(4))
+        return ImageKey(f"{config_key}:sha256:{image_digest(data)}", phash, bands)
+
+    def get(self, key: ImageKey) -> Optional[Dict[str, Any]]:
+        def close_enough(entry: Dict[str, Any]) -> bool:
+            stored = entry.get("phash")
+            return bool(stored) and hamming_distance(stored, key.phash) <= self.max_distance
+
+        try:
+            entry = self._cache.get(key.exact, key.bands, accept=close_enough)
+        except Exception:
+            logging.exception("Analysis cache lookup failed")
+            return None
+        return entry["analysis"] if entry else None
+
+    def set(self, key: ImageKey, analysis: Dict[str, Any]) -> None:
+        if not analysis:
+            return
+        try:
+            self._cache.set(key.exact, {"phash": key.phash, "analysis": analysis}, key.bands)
+        except Exception:
+            logging.exception("Analysis cache store failed")
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.snapshot()
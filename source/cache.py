@@ -0,0 +1,289 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Union
+
+# Seconds between sweeps of expired rows from a SQLiteCache (one also runs on open).
+PURGE_INTERVAL = 3600.0
+
+
+class CacheStats:
+    """
+    Simple hit/miss counters shared by the cache tiers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU with a size bound and per-entry TTL.
+
+    Entries can also be registered under secondary ``aliases`` (e.g. bands
+    of a perceptual hash) so callers can look up approximate matches.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._aliases: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, stored_at, _ = entry
+            if self._expired(stored_at, now):
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def candidates(self, aliases: Sequence[str]) -> List[Any]:
+        """
+        Return the live values registered under any of ``aliases``.
+        """
+        with self._lock:
+            keys = set()
+            for alias in aliases:
+                keys.update(self._aliases.get(alias, ()))
+        values = []
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values.append(value)
+        return values
+
+    def set(self, key: str, value: Any, aliases: Sequence[str] = ()) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic(), tuple(aliases))
+            for alias in aliases:
+                self._aliases.setdefault(alias, set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._aliases.clear()
+
+    def _remove(self, key: str) -> None:
+        _, _, aliases = self._data.pop(key)
+        for alias in aliases:
+            keys = self._aliases.get(alias)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._aliases[alias]
+
+
+class SQLiteCache:
+    """
+    Persistent key/value tier stored as JSON in a SQLite table.
+
+    With a ``ttl``, expired entries and their aliases are deleted when the
+    table is opened and then at most every ``purge_interval`` seconds, on
+    the next write.
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, Path],
+        table: str,
+        ttl: Optional[float] = None,
+        purge_interval: float = PURGE_INTERVAL,
+    ):
+        if not table.isidentifier():
+            raise ValueError(f"invalid table name: {table!r}")
+        self.db_path = Path(db_path)
+        self.table = table
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._next_purge = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # Shares the DB file with the storage writer, so match its WAL setup.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "cache_key TEXT PRIMARY KEY, value_json TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table}_alias ("
+                "alias TEXT NOT NULL, cache_key TEXT NOT NULL, PRIMARY KEY (alias, cache_key))"
+            )
+            # Lets purges find an entry's aliases without scanning the table.
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_alias_key ON {self.table}_alias (cache_key)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._purge(conn)
+        return self._conn
+
+    def _purge(self, conn: sqlite3.Connection) -> int:
+        # Caller holds self._lock.
+        self._next_purge = time.monotonic() + self.purge_interval
+        if self.ttl is None:
+            return 0
+        cutoff = self._min_created_at()
+        with conn:
+            conn.execute(
+                f"DELETE FROM {self.table}_alias WHERE cache_key IN "
+                f"(SELECT cache_key FROM {self.table} WHERE created_at < ?)",
+                (cutoff,),
+            )
+            cur = conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (cutoff,))
+        return cur.rowcount
+
+    def _min_created_at(self) -> float:
+        return 0.0 if self.ttl is None else time.time() - self.ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT value_json FROM {self.table} WHERE cache_key = ? AND created_at >= ?",
+                (key, self._min_created_at()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def candidates(self, aliases: Sequence[str]) -> List[Any]:
+        if not aliases:
+            return []
+        placeholders = ", ".join("?" for _ in aliases)
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT DISTINCT c.value_json FROM {self.table}_alias a "
+                f"JOIN {self.table} c ON c.cache_key = a.cache_key "
+                f"WHERE a.alias IN ({placeholders}) AND c.created_at >= ?",
+                (*aliases, self._min_created_at()),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def set(self, key: str, value: Any, aliases: Sequence[str] = ()) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (cache_key, value_json, created_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, payload, time.time()),
+                )
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {self.table}_alias (alias, cache_key) VALUES (?, ?)",
+                    [(alias, key) for alias in aliases],
+                )
+            if time.monotonic() >= self._next_purge:
+                self._purge(conn)
+
+    def purge_expired(self) -> int:
+        """
+        Delete expired entries and their aliases now; returns the entries removed.
+        """
+        with self._lock:
+            return self._purge(self._connect())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class TieredCache:
+    """
+    In-process LRU in front of an optional persistent SQLite tier.
+    """
+
+    def __init__(self, memory: LRUCache, persistent: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.persistent = persistent
+        self.stats = CacheStats()
+
+    def get(
+        self,
+        key: str,
+        aliases: Sequence[str] = (),
+        accept: Optional[Callable[[Any], bool]] = None,
+    ) -> Optional[Any]:
+        """
+        Look up ``key`` exactly, then fall back to alias candidates that pass ``accept``.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats.incr("memory_hits")
+            return value
+
+        if self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.stats.incr("persistent_hits")
+                self.memory.set(key, value, aliases)
+                return value
+
+        if aliases:
+            value = self._first_accepted(self.memory.candidates(aliases), accept)
+            if value is None and self.persistent is not None:
+                value = self._first_accepted(self.persistent.candidates(aliases), accept)
+            if value is not None:
+                self.stats.incr("alias_hits")
+                self.memory.set(key, value, aliases)
+                return value
+
+        self.stats.incr("misses")
+        return None
+
+    @staticmethod
+    def _first_accepted(values: List[Any], accept: Optional[Callable[[Any], bool]]) -> Optional[Any]:
+        for value in values:
+            if accept is None or accept(value):
+                return value
+        return None
+
+    def set(self, key: str, value: Any, aliases: Sequence[str] = ()) -> None:
+        self.memory.set(key, value, aliases)
+        if self.persistent is not None:
+            self.persistent.set(key, value, aliases)
+        self.stats.incr("stores")
+
+    def snapshot(self) -> Dict[str, int]:
+        counts = self.stats.snapshot()
+        counts["memory_entries"] = len(self.memory)
+        counts["memory_evictions"] = self.memory.evictions
+        return counts
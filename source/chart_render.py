@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence, Tuple
+
+from .cache import CacheStats, LRUCache
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+RENDER_CACHE_SIZE = int(os.getenv("SNAPBITE_RENDER_CACHE_SIZE", "256"))
+RENDER_CACHE_TTL = float(os.getenv("SNAPBITE_RENDER_CACHE_TTL", "3600"))
+
+FIGSIZE = (6.4, 4.0)
+DPI = 100
+_FORMATS = {"png": "image/png", "webp": "image/webp"}
+
+
+def data_fingerprint(data: Any) -> str:
+    """
+    Stable hash of the chart input, so changed data never hits a stale render.
+    """
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=float)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def mime_type(fmt: str) -> str:
+    return _FORMATS[fmt]
+
+
+class ChartRenderer:
+    """
+    Renders the Visualizer charts to in-memory PNG/WebP bytes on the Agg
+    backend, without pyplot's global figure registry.
+
+    Each thread reuses one Figure (cleared between renders), and finished
+    images are cached twice: by request (user, range, chart, data
+    fingerprint) and by content digest for serving over HTTP.
+    """
+
+    def __init__(self, max_entries: int = RENDER_CACHE_SIZE, ttl: Optional[float] = RENDER_CACHE_TTL):
+        self._local = threading.local()
+        self._requests = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._blobs = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.stats = CacheStats()
+
+    def _figure(self) -> "Figure":
+        fig = getattr(self._local, "figure", None)
+        if fig is None:
+            # matplotlib takes ~0.5 s to import; only pay for it once a chart is drawn.
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+
+            fig = Figure(figsize=FIGSIZE, dpi=DPI)
+            FigureCanvasAgg(fig)
+            self._local.figure = fig
+        fig.clear()
+        return fig
+
+    def _encode(self, fig: "Figure", fmt: str) -> bytes:
+        if fmt not in _FORMATS:
+            raise ValueError(f"unsupported chart format: {fmt}")
+        buf = BytesIO()
+        fig.tight_layout()
+        fig.savefig(buf, format=fmt, dpi=DPI)
+        return buf.getvalue()
+
+    def render_calories(self, labels: Sequence[str], calories: Sequence[float], fmt: str = "png") -> bytes:
+        """
+        Bar chart of calories per meal.
+        """
+        fig = self._figure()
+        ax = fig.add_subplot()
+        ax.bar(list(labels), list(calories))
+        ax.set_title("Calories per Meal")
+        ax.set_xlabel("Meal")
+        ax.set_ylabel("Calories")
+        return self._encode(fig, fmt)
+
+    def render_macros(self, protein: float, carbs: float, fat: float, fmt: str = "png") -> bytes:
+        """
+        Pie chart of macronutrient distribution.
+        """
+        fig = self._figure()
+        ax = fig.add_subplot()
+        sizes = [protein, carbs, fat]
+        if sum(sizes) > 0:
+            ax.pie(sizes, labels=["Protein", "Carbs", "Fat"], autopct="%1.1f%%")
+        else:
+            ax.text(0.5, 0.5, "No macro data", ha="center", va="center")
+            ax.set_axis_off()
+        ax.set_title("Daily Macronutrient Distribution")
+        return self._encode(fig, fmt)
+
+    def render_trend(self, dates: Sequence[str], totals: Sequence[float], fmt: str = "png") -> bytes:
+        """
+        Line chart of total daily calories across days.
+        """
+        fig = self._figure()
+        ax = fig.add_subplot()
+        ax.plot(list(dates), list(totals), marker="o")
+        ax.set_title("Total Daily Calories Over Days")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Calories")
+        fig.autofmt_xdate()
+        return self._encode(fig, fmt)
+
+    def render_cached(
+        self,
+        chart: str,
+        data: Dict[str, Any],
+        user_id: str = "",
+        date_range: Tuple[str, str] = ("", ""),
+        fmt: str = "png",
+    ) -> Tuple[str, bytes]:
+        """
+        Render ``chart`` ("calories", "macros" or "trend") from ``data`` keyword
+        arguments, reusing a previous render when nothing changed.
+        Returns (content digest, image bytes).
+        """
+        request_key = "|".join((user_id, *date_range, chart, fmt, data_fingerprint(data)))
+        digest = self._requests.get(request_key)
+        if digest is not None:
+            blob = self._blobs.get(digest)
+            if blob is not None:
+                self.stats.incr("hits")
+                return digest, blob
+
+        self.stats.incr("misses")
+        renderers = {
+            "calories": self.render_calories,
+            "macros": self.render_macros,
+            "trend": self.render_trend,
+        }
+        if chart not in renderers:
+            raise ValueError(f"unknown chart: {chart}")
+        blob = renderers[chart](fmt=fmt, **data)
+        digest = hashlib.sha256(blob).hexdigest()[:32]
+        self._blobs.set(digest, blob)
+        self._requests.set(request_key, digest)
+        return digest, blob
+
+    def get_blob(self, digest: str) -> Optional[bytes]:
+        """
+        Look up a rendered image by the digest returned from render_cached.
+        """
+        return self._blobs.get(digest)
+
+
+_renderer: Optional[ChartRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> ChartRenderer:
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ChartRenderer()
+        return _renderer
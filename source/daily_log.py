@@ -0,0 +1,214 @@
+"""
+Streaming readers for the daily nutrition log and a compact binary format.
+
+The JSON layout (see Visualizer.load_daily_log) is a top-level array of day
+records. ``iter_daily_log`` decodes one day at a time from a fixed-size
+read buffer instead of loading the whole file.
+
+The binary format is a 16-byte header followed by fixed-width little-endian
+records, one per meal, that ``open_meal_log`` maps with ``np.memmap``:
+
+    day        int32    days since 1970-01-01
+    meal_type  uint8    index into MEAL_TYPES (255 = other)
+    calories   float32
+    protein    float32
+    carbs      float32
+    fat        float32
+
+Records are written in log order, so with a chronological log the ``day``
+column is sorted and date ranges are found with a binary search.
+"""
+import json
+from datetime import date
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from .nutrient_table import parse_quantity
+
+MAGIC = b"SBMEAL01"
+HEADER = np.dtype([("magic", "S8"), ("count", "<u8")])
+MEAL_RECORD = np.dtype(
+    [
+        ("day", "<i4"),
+        ("meal_type", "u1"),
+        ("calories", "<f4"),
+        ("protein", "<f4"),
+        ("carbs", "<f4"),
+        ("fat", "<f4"),
+    ]
+)
+MEAL_TYPES = ("breakfast", "lunch", "dinner", "snack")
+OTHER_MEAL_TYPE = 255
+
+READ_SIZE = 64 * 1024
+
+PathLike = Union[str, Path]
+
+
+def _in_range(day: str, start: Optional[str], end: Optional[str]) -> bool:
+    # ISO dates compare correctly as strings.
+    return (start is None or day >= start) and (end is None or day <= end)
+
+
+def iter_daily_log(
+    filename: PathLike,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    read_size: int = READ_SIZE,
+) -> Iterator[dict]:
+    """
+    Yield day records from a JSON log one at a time, keeping only days
+    with start <= date <= end. Memory use is bounded by the largest
+    single day record plus ``read_size``. The log is assumed to be
+    chronological, so reading stops at the first day past ``end``.
+
+    A file holding a single object instead of an array yields that object.
+    """
+    decoder = json.JSONDecoder()
+    with open(filename, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            chunk = f.read(read_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_whitespace() -> None:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return
+
+        skip_whitespace()
+        if pos >= len(buffer):
+            return
+        if buffer[pos] != "[":
+            # Legacy single-record file: small by definition, decode it whole.
+            while fill():
+                pass
+            record = json.loads(buffer[pos:])
+            if _in_range(record.get("date", ""), start, end):
+                yield record
+            return
+        pos += 1
+
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ValueError("unterminated daily log array")
+            if buffer[pos] == "]":
+                return
+            while True:
+                try:
+                    record, next_pos = decoder.raw_decode(buffer, pos)
+                    break
+                except json.JSONDecodeError:
+                    if eof or not fill():
+                        raise
+            pos = next_pos
+            if _in_range(record.get("date", ""), start, end):
+                yield record
+            elif end is not None and record.get("date", "") > end:
+                # Logs are chronological, so nothing later can match.
+                return
+
+
+def _day_number(day: str) -> int:
+    return (date.fromisoformat(day) - date(1970, 1, 1)).days
+
+
+def _meal_type_code(meal_type: str) -> int:
+    try:
+        return MEAL_TYPES.index(meal_type)
+    except ValueError:
+        return OTHER_MEAL_TYPE
+
+
+def convert_json_to_binary(source: PathLike, target: PathLike, batch_size: int = 4096) -> int:
+    """
+    Stream a JSON daily log into the binary meal format. Returns meals written.
+    """
+    count = 0
+    batch = np.zeros(batch_size, dtype=MEAL_RECORD)
+    filled = 0
+    with open(target, "wb") as out:
+        out.write(np.zeros(1, dtype=HEADER).tobytes())  # patched with the count below
+        for record in iter_daily_log(source):
+            day = _day_number(record["date"])
+            for meal in record.get("meals", []):
+                macros = meal.get("macros", {})
+                batch[filled] = (
+                    day,
+                    _meal_type_code(meal.get("meal_type", "")),
+                    parse_quantity(meal.get("calories"), "energy"),
+                    parse_quantity(macros.get("protein"), "mass"),
+                    parse_quantity(macros.get("carbs"), "mass"),
+                    parse_quantity(macros.get("fat"), "mass"),
+                )
+                filled += 1
+                if filled == batch_size:
+                    out.write(batch.tobytes())
+                    count += filled
+                    filled = 0
+        out.write(batch[:filled].tobytes())
+        count += filled
+        out.seek(0)
+        header = np.zeros(1, dtype=HEADER)
+        header["magic"] = MAGIC
+        header["count"] = count
+        out.write(header.tobytes())
+    return count
+
+
+def open_meal_log(filename: PathLike) -> np.memmap:
+    """
+    Memory-map a binary meal log as a structured array (no copy, no parsing).
+    """
+    header = np.fromfile(filename, dtype=HEADER, count=1)
+    if len(header) != 1 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{filename} is not a SnapBite binary meal log")
+    count = int(header["count"][0])
+    if count == 0:
+        return np.zeros(0, dtype=MEAL_RECORD)
+    return np.memmap(filename, dtype=MEAL_RECORD, mode="r", offset=HEADER.itemsize, shape=(count,))
+
+
+def slice_days(records: np.ndarray, start: Optional[str] = None, end: Optional[str] = None) -> np.ndarray:
+    """
+    Records with start <= day <= end, via binary search on the sorted day column.
+    """
+    days = records["day"]
+    lo = 0 if start is None else int(np.searchsorted(days, _day_number(start), side="left"))
+    hi = len(records) if end is None else int(np.searchsorted(days, _day_number(end), side="right"))
+    return records[lo:hi]
+
+
+def daily_calorie_totals(records: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (datetime64[D] days, total calories) from binary records, fully vectorized.
+    """
+    if len(records) == 0:
+        return np.empty(0, dtype="datetime64[D]"), np.empty(0)
+    days, inverse = np.unique(records["day"], return_inverse=True)
+    totals = np.bincount(inverse, weights=np.nan_to_num(records["calories"].astype(np.float64)))
+    return days.astype("datetime64[D]"), totals
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        raise SystemExit("usage: python -m source.daily_log <daily_log.json> <meals.bin>")
+    written = convert_json_to_binary(sys.argv[1], sys.argv[2])
+    print(f"Wrote {written} meal records to {sys.argv[2]}")
@@ -0,0 +1,303 @@
+"""
+On-CPU pre-analysis: find the meal in a photo before it is uploaded.
+
+A cropper looks at the decoded frame and returns the region worth sending
+(the plate plus the reference object) or decides the image clearly shows no
+food, so the vision call is skipped. The model sizes portions against the
+reference object, so a crop is only made when the reference was found and
+is inside it; otherwise the full frame is sent. Two backends:
+
+- ``saliency`` (default): NumPy edge-energy and colour-contrast map. It
+  cannot tell a plate from a reference object, so on its own it only
+  rejects photos without food. Given a ``reference_locator`` it crops to the
+  box holding most of the salient mass joined with the reference box.
+- ``onnx``: a local YOLOv8-style detector, used when its weights exist and
+  ``onnxruntime`` is installed. The crop is the union of food and
+  reference-object boxes. A stock detector knows few dishes, so no food
+  box only means the full frame is sent, never that the photo is rejected.
+"""
+import ast
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom in pixels
+# Finds the reference object in a frame; None when it is not visible.
+ReferenceLocator = Callable[[Image.Image], Optional[Box]]
+
+CROP_BACKEND = os.getenv("SNAPBITE_CROP_BACKEND", "saliency").lower()  # saliency | onnx | off
+CROP_ONNX_MODEL = os.getenv("SNAPBITE_CROP_ONNX_MODEL", "models/food_detector.onnx")
+CROP_SCORE_THRESHOLD = float(os.getenv("SNAPBITE_CROP_SCORE_THRESHOLD", "0.35"))
+# COCO classes a stock YOLOv8 export can see on a dinner table.
+CROP_FOOD_LABELS = os.getenv(
+    "SNAPBITE_CROP_FOOD_LABELS", "banana,apple,sandwich,orange,broccoli,carrot,hot dog,pizza,donut,cake,bowl"
+)
+CROP_REFERENCE_LABELS = os.getenv("SNAPBITE_CROP_REFERENCE_LABELS", "airpods pro 2,airpods")
+
+# Long side of the map the saliency backend works on.
+SALIENCY_SIDE = 160
+# Share of salient mass the crop must keep, and padding around it.
+CROP_MASS = 0.94
+CROP_PADDING = 0.08
+# Crops that remove less than this share of the frame are not worth the loss of context.
+MIN_AREA_SAVED = 0.2
+
+
+class NoFoodError(ValueError):
+    """Raised when a cropper decides an image clearly contains no food."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"no food in image: {reason}")
+        self.reason = reason
+
+
+@dataclass
+class CropResult:
+    """
+    Where the meal is. ``box`` is None when the full frame should be sent.
+    """
+    box: Optional[Box] = None
+    food: bool = True
+    reason: str = ""
+    regions: Dict[str, List[Box]] = field(default_factory=dict)
+
+
+def _labels(value: str) -> List[str]:
+    return [label.strip().lower() for label in value.split(",") if label.strip()]
+
+
+def _pad_box(box: Box, size: Tuple[int, int], padding: float = CROP_PADDING) -> Optional[Box]:
+    """
+    Pad ``box`` and clamp it to the image; None when cropping would barely
+    shrink the frame.
+    """
+    width, height = size
+    left, top, right, bottom = box
+    pad_x, pad_y = (right - left) * padding, (bottom - top) * padding
+    left, top = max(0, int(left - pad_x)), max(0, int(top - pad_y))
+    right, bottom = min(width, int(np.ceil(right + pad_x))), min(height, int(np.ceil(bottom + pad_y)))
+    if right <= left or bottom <= top:
+        return None
+    if (right - left) * (bottom - top) > (1.0 - MIN_AREA_SAVED) * width * height:
+        return None
+    return left, top, right, bottom
+
+
+def _union(boxes: Iterable[Box]) -> Box:
+    boxes = list(boxes)
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _box_blur(values: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Mean filter with a (2r+1)^2 window, via an integral image.
+    """
+    if radius < 1:
+        return values
+    padded = np.pad(values, radius + 1, mode="edge").cumsum(0).cumsum(1)
+    k = 2 * radius + 1
+    total = padded[k:, k:] - padded[:-k, k:] - padded[k:, :-k] + padded[:-k, :-k]
+    return total[: values.shape[0], : values.shape[1]] / (k * k)
+
+
+def _mass_range(profile: np.ndarray, mass: float) -> Tuple[int, int]:
+    cumulative = np.cumsum(profile)
+    cumulative /= cumulative[-1]
+    tail = (1.0 - mass) / 2
+    return int(np.searchsorted(cumulative, tail)), int(np.searchsorted(cumulative, 1.0 - tail)) + 1
+
+
+class SaliencyCropper:
+    """
+    Crop to the edge-dense, colourful region that stands out from the
+    frame's border colour; reject blank frames and flat graphics. Crops
+    need a ``reference_locator``; without one the full frame is sent.
+    """
+    name = "saliency-v1"
+
+    def __init__(self, side: int = SALIENCY_SIDE, mass: float = CROP_MASS, reference_locator: Optional[ReferenceLocator] = None):
+        self.side = side
+        self.mass = mass
+        self.reference_locator = reference_locator
+
+    def _no_food_reason(self, image: Image.Image) -> Optional[str]:
+        # Nearest-neighbour samples keep camera noise, which box-averaging
+        # would smooth into the flat areas this check looks for.
+        if min(image.size) < 32:
+            return None
+        scale = min(1.0, self.side / max(image.size))
+        sample = np.asarray(
+            image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.NEAREST)
+        )
+        luma = sample @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        if luma.std() < 3.0:
+            return "blank"
+        packed = (sample[..., 0].astype(np.uint32) << 16) | (sample[..., 1].astype(np.uint32) << 8) | sample[..., 2]
+        flat = np.mean(packed[:, 1:] == packed[:, :-1])
+        if flat > 0.6 and len(np.unique(packed)) < 0.05 * packed.size:
+            return "screenshot or graphic"
+        return None
+
+    def saliency(self, image: Image.Image) -> np.ndarray:
+        scale = min(1.0, self.side / max(image.size))
+        small = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BOX)
+        rgb = np.asarray(small, dtype=np.float32)
+        height, width = rgb.shape[:2]
+
+        luma = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        edges = np.zeros_like(luma)
+        edges[:, 1:] += np.abs(np.diff(luma, axis=1))
+        edges[1:, :] += np.abs(np.diff(luma, axis=0))
+
+        border = max(1, min(height, width) // 10)
+        frame = np.concatenate(
+            [rgb[:border].reshape(-1, 3), rgb[-border:].reshape(-1, 3), rgb[:, :border].reshape(-1, 3), rgb[:, -border:].reshape(-1, 3)]
+        )
+        contrast = np.linalg.norm(rgb - np.median(frame, axis=0), axis=2)
+        saturation = rgb.max(axis=2) - rgb.min(axis=2)
+
+        def normalized(values: np.ndarray) -> np.ndarray:
+            return np.clip(values / (np.percentile(values, 99) + 1e-6), 0.0, 1.0)
+
+        radius = max(1, round(min(height, width) * 0.03))
+        saliency = normalized(_box_blur(edges, radius)) + normalized(contrast) + 0.5 * normalized(saturation)
+        # Mild centre prior: meals are framed near the middle more often than not.
+        ys = np.linspace(-1.0, 1.0, height)[:, None]
+        xs = np.linspace(-1.0, 1.0, width)[None, :]
+        return saliency * (1.0 - 0.25 * (xs ** 2 + ys ** 2) / 2)
+
+    def locate(self, image: Image.Image) -> CropResult:
+        reason = self._no_food_reason(image)
+        if reason:
+            return CropResult(food=False, reason=reason)
+        # Salient mass alone may leave the reference object out of the box.
+        reference = self.reference_locator(image) if self.reference_locator is not None else None
+        if reference is None:
+            return CropResult()
+
+        saliency = self.saliency(image)
+        # Drop the background floor so flat table texture does not stretch the box.
+        weights = np.clip(saliency - np.mean(saliency), 0.0, None)
+        if not weights.any():
+            return CropResult(regions={"reference": [reference]})
+        top, bottom = _mass_range(weights.sum(axis=1), self.mass)
+        left, right = _mass_range(weights.sum(axis=0), self.mass)
+
+        scale_x = image.width / saliency.shape[1]
+        scale_y = image.height / saliency.shape[0]
+        region = (int(left * scale_x), int(top * scale_y), int(right * scale_x), int(bottom * scale_y))
+        return CropResult(
+            box=_pad_box(_union([region, reference]), image.size), regions={"food": [region], "reference": [reference]}
+        )
+
+
+def decode_yolo(
+    output: np.ndarray, labels: Sequence[str], score_threshold: float, scale: Tuple[float, float]
+) -> List[Tuple[str, float, Box]]:
+    """
+    Turn a YOLOv8 head output of shape (1, 4 + classes, anchors) into
+    (label, score, box) detections in image pixels. Overlaps are kept: the
+    crop only needs the union.
+    """
+    predictions = output[0].T
+    scores = predictions[:, 4:]
+    classes = scores.argmax(axis=1)
+    confidence = scores[np.arange(len(classes)), classes]
+    detections = []
+    for row in np.flatnonzero(confidence >= score_threshold):
+        cx, cy, w, h = predictions[row, :4]
+        box = (
+            int((cx - w / 2) * scale[0]),
+            int((cy - h / 2) * scale[1]),
+            int(np.ceil((cx + w / 2) * scale[0])),
+            int(np.ceil((cy + h / 2) * scale[1])),
+        )
+        label = labels[classes[row]] if classes[row] < len(labels) else str(classes[row])
+        detections.append((label.lower(), float(confidence[row]), box))
+    return detections
+
+
+class OnnxCropper:
+    """
+    Crop with a local ONNX object detector (YOLOv8 export layout).
+
+    Class names come from the model's ``names`` metadata (Ultralytics
+    exports carry it) or a ``.txt`` file beside the weights, one per line.
+    """
+
+    def __init__(
+        self,
+        model_path: str = CROP_ONNX_MODEL,
+        food_labels: Iterable[str] = _labels(CROP_FOOD_LABELS),
+        reference_labels: Iterable[str] = _labels(CROP_REFERENCE_LABELS),
+        score_threshold: float = CROP_SCORE_THRESHOLD,
+    ):
+        import onnxruntime  # optional dependency
+
+        self.model_path = Path(model_path)
+        self.session = onnxruntime.InferenceSession(str(self.model_path), providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else 640
+        self.labels = self._load_labels()
+        self.food_labels = set(food_labels)
+        self.reference_labels = set(reference_labels)
+        self.score_threshold = score_threshold
+        self.name = f"onnx:{self.model_path.stem}"
+
+    def _load_labels(self) -> List[str]:
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if names:
+            parsed = ast.literal_eval(names)
+            return [parsed[i] for i in sorted(parsed)] if isinstance(parsed, dict) else list(parsed)
+        label_file = self.model_path.with_suffix(".txt")
+        if label_file.exists():
+            return [line.strip() for line in label_file.read_text(encoding="utf-8").splitlines() if line.strip()]
+        raise ValueError(f"no class names for {self.model_path}: add 'names' metadata or {label_file.name}")
+
+    def locate(self, image: Image.Image) -> CropResult:
+        size = self.input_size
+        pixels = np.asarray(image.resize((size, size), Image.BILINEAR), dtype=np.float32) / 255.0
+        output = self.session.run(None, {self.input_name: pixels.transpose(2, 0, 1)[None]})[0]
+        detections = decode_yolo(output, self.labels, self.score_threshold, (image.width / size, image.height / size))
+
+        food = [box for label, _, box in detections if label in self.food_labels]
+        reference = [box for label, _, box in detections if label in self.reference_labels]
+        if not food or not reference:
+            # Missing a dish the detector has no class for is not evidence of no
+            # food, and a crop without the reference would lose the portion scale.
+            return CropResult(regions={"food": food, "reference": reference})
+        return CropResult(box=_pad_box(_union(food + reference), image.size), regions={"food": food, "reference": reference})
+
+
+def get_cropper(backend: str = CROP_BACKEND, model_path: str = CROP_ONNX_MODEL):
+    """
+    Build the configured cropper, or None when cropping is off. ``onnx``
+    falls back to saliency when the weights or onnxruntime are missing.
+    """
+    if backend in ("", "off", "none"):
+        return None
+    if backend == "onnx":
+        if Path(model_path).exists():
+            try:
+                return OnnxCropper(model_path)
+            except ImportError:
+                logging.warning("onnxruntime is not installed; using saliency cropping")
+            except Exception:
+                logging.exception("Could not load ONNX detector %s; using saliency cropping", model_path)
+        else:
+            logging.warning("ONNX detector %s not found; using saliency cropping", model_path)
+        return SaliencyCropper()
+    if backend != "saliency":
+        raise ValueError(f"unknown crop backend: {backend}")
+    return SaliencyCropper()
@@ -0,0 +1,411 @@
+"""
+Local food-composition database with fuzzy zh-TW / English name search.
+
+Build once from local dataset files, then memory-map at runtime:
+
+    python -m source.food_db --out data/food_db \\
+        --usda-dir FoodData_Central_sr_legacy_food_csv/ \\
+        --tfda-csv 食品營養成分資料庫.csv \\
+        --custom-csv my_foods.csv
+
+Supported inputs:
+  * USDA FoodData Central CSV export (``food.csv`` + ``food_nutrient.csv``).
+  * Taiwan FDA nutrient database CSV in its long layout (one row per
+    analysis item: 整合編號, 樣品名稱, 俗名, 英文名稱, 分析項, 每100克含量).
+  * A custom wide CSV with columns name_zh, name_en, aliases (``|``
+    separated), kcal, carbs, protein, fat, all per 100 g.
+
+The store is a directory of ``.npy`` arrays opened with ``mmap_mode="r"``:
+per-100 g nutrients per food, a sorted normalized-name table for exact and
+prefix lookups, and a CSR n-gram index (sorted gram hashes, offsets,
+postings) for fuzzy matches. Latin names are indexed as character
+trigrams and CJK names as bigrams, since most Chinese food names are only
+two to four characters long.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+FORMAT_VERSION = 1
+NUTRIENT_DTYPE = np.dtype([("kcal", "<f4"), ("carbs", "<f4"), ("protein", "<f4"), ("fat", "<f4")])
+NAME_WIDTH = 64
+MIN_FUZZY_SCORE = 0.45
+# Short CJK names share most of their few bigrams with unrelated dishes
+# (雞肉飯 vs 雞肉, 牛肉麵 vs 牛肉湯), so they need a much closer match...
+SHORT_CJK_NAME = 4
+MIN_SHORT_CJK_SCORE = 0.8
+
+# USDA FoodData Central nutrient ids.
+_USDA_NUTRIENTS = {
+    "1008": "kcal",
+    "2047": "kcal_atwater",
+    "2048": "kcal_atwater",
+    "1005": "carbs",
+    "1003": "protein",
+    "1004": "fat",
+}
+# Taiwan FDA 分析項 names; 修正熱量 is preferred over 熱量 when both exist.
+_TFDA_NUTRIENTS = {
+    "修正熱量": "kcal",
+    "熱量": "kcal_raw",
+    "總碳水化合物": "carbs",
+    "粗蛋白": "protein",
+    "粗脂肪": "fat",
+}
+
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+_STRIP_RE = re.compile(r"[\s\-_,.()（）、，/·]+")
+
+PathLike = Union[str, Path]
+
+
+def normalize_name(name: str) -> str:
+    text = unicodedata.normalize("NFKC", name or "").lower()
+    return _STRIP_RE.sub("", text)[:NAME_WIDTH]
+
+
+def name_grams(normalized: str) -> List[str]:
+    """
+    Padded character n-grams: bigrams for CJK names, trigrams otherwise.
+    """
+    if not normalized:
+        return []
+    q = 2 if _CJK_RE.search(normalized) else 3
+    padded = "^" + normalized + "$"
+    if len(padded) <= q:
+        return [padded]
+    return sorted({padded[i:i + q] for i in range(len(padded) - q + 1)})
+
+
+def _gram_hash(gram: str) -> int:
+    return int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+@dataclass
+class FoodRecord:
+    names: List[str]
+    kcal: float
+    carbs: float
+    protein: float
+    fat: float
+
+
+@dataclass
+class FoodMatch:
+    food_id: int
+    name: str
+    score: float
+
+
+def _float(value: Optional[str]) -> float:
+    try:
+        return float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _read_csv(path: PathLike) -> Iterator[Dict[str, str]]:
+    # utf-8-sig strips the BOM that government CSV exports often carry.
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def load_usda(directory: PathLike) -> List[FoodRecord]:
+    directory = Path(directory)
+    values: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for row in _read_csv(directory / "food_nutrient.csv"):
+        field = _USDA_NUTRIENTS.get(row.get("nutrient_id", ""))
+        if field:
+            values[row["fdc_id"]][field] = _float(row.get("amount"))
+
+    records = []
+    for row in _read_csv(directory / "food.csv"):
+        nutrients = values.get(row["fdc_id"])
+        if not nutrients:
+            continue
+        kcal = nutrients.get("kcal", nutrients.get("kcal_atwater", float("nan")))
+        records.append(
+            FoodRecord(
+                names=[row["description"]],
+                kcal=kcal,
+                carbs=nutrients.get("carbs", float("nan")),
+                protein=nutrients.get("protein", float("nan")),
+                fat=nutrients.get("fat", float("nan")),
+            )
+        )
+    return records
+
+
+def load_tfda(path: PathLike) -> List[FoodRecord]:
+    foods: Dict[str, Dict[str, object]] = {}
+    for row in _read_csv(path):
+        key = row.get("整合編號") or row.get("樣品名稱", "")
+        food = foods.setdefault(key, {"names": [], "nutrients": {}})
+        if not food["names"]:
+            names = [row.get("樣品名稱", ""), row.get("英文名稱", "")]
+            names += re.split(r"[,，、]", row.get("俗名", "") or "")
+            food["names"] = [n.strip() for n in names if n and n.strip()]
+        field = _TFDA_NUTRIENTS.get((row.get("分析項") or "").strip())
+        if field:
+            food["nutrients"][field] = _float(row.get("每100克含量"))
+
+    records = []
+    for food in foods.values():
+        nutrients = food["nutrients"]
+        if not food["names"] or not nutrients:
+            continue
+        records.append(
+            FoodRecord(
+                names=food["names"],
+                kcal=nutrients.get("kcal", nutrients.get("kcal_raw", float("nan"))),
+                carbs=nutrients.get("carbs", float("nan")),
+                protein=nutrients.get("protein", float("nan")),
+                fat=nutrients.get("fat", float("nan")),
+            )
+        )
+    return records
+
+
+def load_custom(path: PathLike) -> List[FoodRecord]:
+    records = []
+    for row in _read_csv(path):
+        names = [row.get("name_zh", ""), row.get("name_en", "")] + (row.get("aliases") or "").split("|")
+        names = [n.strip() for n in names if n and n.strip()]
+        if names:
+            records.append(
+                FoodRecord(
+                    names=names,
+                    kcal=_float(row.get("kcal")),
+                    carbs=_float(row.get("carbs")),
+                    protein=_float(row.get("protein")),
+                    fat=_float(row.get("fat")),
+                )
+            )
+    return records
+
+
+def build_food_db(records: Sequence[FoodRecord], out_dir: PathLike) -> int:
+    """
+    Write the memory-mappable store for ``records``. Returns the number of names indexed.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    nutrients = np.array([(r.kcal, r.carbs, r.protein, r.fat) for r in records], dtype=NUTRIENT_DTYPE)
+
+    entries: Dict[str, Tuple[int, str]] = {}
+    for food_id, record in enumerate(records):
+        for name in record.names:
+            key = normalize_name(name)
+            # First source wins for duplicate names, so put preferred datasets first.
+            if key and key not in entries:
+                entries[key] = (food_id, name[:NAME_WIDTH])
+    keys = sorted(entries)
+    name_keys = np.array(keys, dtype=f"<U{NAME_WIDTH}")
+    name_labels = np.array([entries[k][1] for k in keys], dtype=f"<U{NAME_WIDTH}")
+    name_food = np.array([entries[k][0] for k in keys], dtype="<i4")
+
+    postings: Dict[int, List[int]] = defaultdict(list)
+    gram_counts = np.zeros(len(keys), dtype="<u2")
+    for name_id, key in enumerate(keys):
+        grams = name_grams(key)
+        gram_counts[name_id] = len(grams)
+        for gram in grams:
+            postings[_gram_hash(gram)].append(name_id)
+    gram_keys = np.array(sorted(postings), dtype="<u8")
+    offsets = np.zeros(len(gram_keys) + 1, dtype="<i8")
+    offsets[1:] = np.cumsum([len(postings[int(k)]) for k in gram_keys])
+    flat = np.fromiter(
+        (name_id for k in gram_keys for name_id in postings[int(k)]), dtype="<i4", count=int(offsets[-1])
+    )
+
+    arrays = {
+        "nutrients": nutrients,
+        "name_keys": name_keys,
+        "name_labels": name_labels,
+        "name_food": name_food,
+        "name_gram_counts": gram_counts,
+        "gram_keys": gram_keys,
+        "gram_offsets": offsets,
+        "gram_postings": flat,
+    }
+    for name, array in arrays.items():
+        np.save(out_dir / f"{name}.npy", array)
+    (out_dir / "meta.json").write_text(
+        json.dumps({"version": FORMAT_VERSION, "foods": len(records), "names": len(keys)}), encoding="utf-8"
+    )
+    return len(keys)
+
+
+class FoodDatabase:
+    """
+    Read-only, memory-mapped view over a store written by build_food_db.
+    """
+
+    def __init__(self, directory: PathLike):
+        directory = Path(directory)
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported food DB version in {directory}: {meta.get('version')}")
+
+        def load(name: str) -> np.ndarray:
+            return np.load(directory / f"{name}.npy", mmap_mode="r")
+
+        self.nutrients = load("nutrients")
+        self._name_keys = load("name_keys")
+        self._name_labels = load("name_labels")
+        self._name_food = load("name_food")
+        self._gram_counts = load("name_gram_counts")
+        self._gram_keys = load("gram_keys")
+        self._gram_offsets = load("gram_offsets")
+        self._gram_postings = load("gram_postings")
+
+    def __len__(self) -> int:
+        return len(self.nutrients)
+
+    def _match(self, name_id: int, score: float) -> FoodMatch:
+        return FoodMatch(int(self._name_food[name_id]), str(self._name_labels[name_id]), score)
+
+    def exact(self, name: str) -> Optional[FoodMatch]:
+        key = normalize_name(name)
+        i = int(np.searchsorted(self._name_keys, key))
+        if i < len(self._name_keys) and self._name_keys[i] == key:
+            return self._match(i, 1.0)
+        return None
+
+    def prefix(self, prefix: str, limit: int = 10) -> List[FoodMatch]:
+        """
+        Names starting with ``prefix``, shortest first.
+        """
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        lo = int(np.searchsorted(self._name_keys, key, side="left"))
+        hi = int(np.searchsorted(self._name_keys, key + "\U0010ffff", side="left"))
+        ids = sorted(range(lo, hi), key=lambda i: len(self._name_keys[i]))[:limit]
+        return [self._match(i, len(key) / max(len(self._name_keys[i]), 1)) for i in ids]
+
+    def _same_dish(self, key: str, name_id: int) -> bool:
+        # ...unless one name extends the other at the front: 雞胸 -> 雞胸肉 and
+        # 烤雞胸肉 -> 雞胸肉 keep the dish (the head noun comes last in CJK names);
+        # 雞肉飯 -> 雞肉 does not.
+        other = str(self._name_keys[name_id])
+        return other.startswith(key) or key.endswith(other)
+
+    def search(self, name: str, limit: int = 5, min_score: float = MIN_FUZZY_SCORE) -> List[FoodMatch]:
+        """
+        Exact match if present, otherwise n-gram Dice similarity ranking.
+        Names of up to SHORT_CJK_NAME CJK characters only match fuzzily at
+        MIN_SHORT_CJK_SCORE or when one name extends the other at the front.
+        """
+        hit = self.exact(name)
+        if hit is not None:
+            return [hit]
+
+        key = normalize_name(name)
+        grams = name_grams(key)
+        if not grams:
+            return []
+        hashes = np.array(sorted(_gram_hash(g) for g in grams), dtype="<u8")
+        pos = np.searchsorted(self._gram_keys, hashes)
+        inside = pos < len(self._gram_keys)
+        pos, hashes = pos[inside], hashes[inside]
+        pos = pos[self._gram_keys[pos] == hashes]
+        if len(pos) == 0:
+            return []
+        postings = np.concatenate([self._gram_postings[self._gram_offsets[p]:self._gram_offsets[p + 1]] for p in pos])
+        candidates, shared = np.unique(postings, return_counts=True)
+        scores = 2.0 * shared / (len(grams) + self._gram_counts[candidates].astype(np.float64))
+        strict = len(key) <= SHORT_CJK_NAME and bool(_CJK_RE.search(key))
+        matches = []
+        for i in np.argsort(-scores, kind="stable"):
+            score = float(scores[i])
+            if score < min_score or len(matches) == limit:
+                break
+            if strict and score < MIN_SHORT_CJK_SCORE and not self._same_dish(key, int(candidates[i])):
+                continue
+            matches.append(self._match(int(candidates[i]), score))
+        return matches
+
+    def best_match(self, name: str, min_score: float = MIN_FUZZY_SCORE) -> Optional[FoodMatch]:
+        matches = self.search(name, limit=1, min_score=min_score)
+        return matches[0] if matches else None
+
+    def nutrients_for(self, food_id: int, grams: float) -> Dict[str, Optional[float]]:
+        """
+        kcal and macro grams for ``grams`` of a food, from its per-100 g values.
+        Fields the source data does not list are None, not 0.
+        """
+        row = self.nutrients[food_id]
+        factor = grams / 100.0
+        values = {field: float(row[field]) for field in NUTRIENT_DTYPE.names}
+        return {field: None if np.isnan(value) else value * factor for field, value in values.items()}
+
+
+def analysis_from_portions(db: FoodDatabase, portions: Iterable[dict]) -> Tuple[dict, List[str]]:
+    """
+    Build a NutritionAnalysis-shaped dict from vision portions ({name, name_en,
+    grams, portion_size}) using local nutrient values. Returns the analysis and
+    the names that could not be matched, or whose match lacks a nutrient
+    value; those items are left out so the caller can use the model's numbers.
+    """
+    items, unmatched = [], []
+    for portion in portions:
+        match = db.best_match(portion.get("name", ""))
+        if match is None and portion.get("name_en"):
+            match = db.best_match(portion["name_en"])
+        grams = float(portion.get("grams") or 0)
+        if match is None or grams <= 0:
+            unmatched.append(portion.get("name", ""))
+            continue
+        values = db.nutrients_for(match.food_id, grams)
+        if None in values.values():
+            unmatched.append(portion.get("name", ""))
+            continue
+        items.append(
+            {
+                "name": portion.get("name") or match.name,
+                "portion_size": portion.get("portion_size") or f"{grams:.0f}g",
+                "calories": f"{values['kcal']:.0f} kcal",
+                "macronutrients": {
+                    "carbs": f"{values['carbs']:.0f}g",
+                    "protein": f"{values['protein']:.0f}g",
+                    "fat": f"{values['fat']:.0f}g",
+                },
+            }
+        )
+    return {"food_items": items}, unmatched
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the local SnapBite food-composition database.")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--custom-csv", action="append", default=[], help="custom wide CSV (highest priority)")
+    parser.add_argument("--tfda-csv", action="append", default=[], help="Taiwan FDA nutrient database CSV")
+    parser.add_argument("--usda-dir", action="append", default=[], help="USDA FoodData Central CSV directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    records: List[FoodRecord] = []
+    for path in args.custom_csv:
+        records += load_custom(path)
+    for path in args.tfda_csv:
+        records += load_tfda(path)
+    for path in args.usda_dir:
+        records += load_usda(path)
+    names = build_food_db(records, args.out)
+    print(f"Indexed {len(records)} foods under {names} names in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
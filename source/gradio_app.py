@@ -0,0 +1,123 @@
+"""
+Gradio front end for Analyst, safe for many users at once.
+
+    python -m source.gradio_app --port 7860
+
+Requests go through Gradio's queue. Uploads that arrive together are handed
+to one ``batch=True`` call and analyzed in parallel threads. Each request
+carries its own image and language. Nothing is written to disk and the
+shared Analyst is never mutated, so concurrent sessions cannot see each
+other's uploads or settings.
+"""
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional, Sequence
+
+from source.analysis_cache import AnalysisCache
+from source.food_crop import NoFoodError, get_cropper
+from source.image_analysis import LANGUAGE_NAMES, Analyst
+from source.llm_gateway import CircuitOpenError
+
+# Batched events Gradio runs at the same time, and uploads per batch.
+GRADIO_CONCURRENCY = int(os.getenv("SNAPBITE_GRADIO_CONCURRENCY", "4"))
+GRADIO_MAX_BATCH = int(os.getenv("SNAPBITE_GRADIO_MAX_BATCH", "8"))
+# Requests waiting in the queue before new ones are turned away.
+GRADIO_QUEUE_SIZE = int(os.getenv("SNAPBITE_GRADIO_QUEUE_SIZE", "64"))
+
+LANGUAGES = list(LANGUAGE_NAMES)
+
+
+def _encode(image) -> memoryview:
+    buffer = BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=95)
+    return buffer.getbuffer()
+
+
+def analyze_one(analyst: Analyst, image, language: Optional[str] = None) -> dict:
+    """
+    Analyze one upload; failures come back as ``{"error": ...}`` so one bad
+    image does not fail the rest of its batch.
+    """
+    if image is None:
+        return {"error": "no image"}
+    try:
+        return analyst.with_language(language).analyze_bytes(_encode(image))
+    except NoFoodError as exc:
+        return {"error": f"no food found ({exc.reason})"}
+    except CircuitOpenError:
+        return {"error": "analysis service is busy, try again shortly"}
+    except Exception as exc:
+        logging.exception("Gradio analysis failed")
+        return {"error": str(exc) or type(exc).__name__}
+
+
+def analyze_batch(analyst: Analyst, images: Sequence, languages: Sequence[Optional[str]]) -> List[List[dict]]:
+    """
+    ``batch=True`` handler: one list per input in, one list per output out.
+    """
+    if len(images) <= 1:
+        return [[analyze_one(analyst, image, language) for image, language in zip(images, languages)]]
+    with ThreadPoolExecutor(max_workers=len(images), thread_name_prefix="snapbite-gradio") as pool:
+        results = list(pool.map(lambda args: analyze_one(analyst, *args), zip(images, languages)))
+    return [results]
+
+
+def default_analyst() -> Analyst:
+    return Analyst(cache=AnalysisCache(), cropper=get_cropper())
+
+
+def build_app(
+    analyst: Optional[Analyst] = None,
+    concurrency: int = GRADIO_CONCURRENCY,
+    max_batch_size: int = GRADIO_MAX_BATCH,
+    queue_size: int = GRADIO_QUEUE_SIZE,
+):
+    import gradio as gr
+
+    analyst = analyst or default_analyst()
+
+    def handler(images, languages):
+        return analyze_batch(analyst, images, languages)
+
+    with gr.Blocks(title="Meal Nutrition Analyzer") as demo:
+        gr.Markdown("# Meal Nutrition Analyzer")
+        with gr.Row():
+            image = gr.Image(type="pil", label="Meal photo")
+            with gr.Column():
+                language = gr.Dropdown(LANGUAGES, value=analyst.language, label="Language")
+                submit = gr.Button("Analyze", variant="primary")
+        result = gr.JSON(label="Nutrition analysis")
+        submit.click(
+            handler,
+            inputs=[image, language],
+            outputs=[result],
+            batch=True,
+            max_batch_size=max_batch_size,
+            concurrency_limit=concurrency,
+            api_name="analyze",
+        )
+    return demo.queue(max_size=queue_size, default_concurrency_limit=concurrency)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the Gradio meal analyzer.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--concurrency", type=int, default=GRADIO_CONCURRENCY)
+    parser.add_argument("--max-batch-size", type=int, default=GRADIO_MAX_BATCH)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    build_app(concurrency=args.concurrency, max_batch_size=args.max_batch_size).launch(
+        server_name=args.host, server_port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,20 @@
 import base64
-import requests
-from PIL import Image
+import copy
+from dataclasses import dataclass
 from io import BytesIO
-import json
 import logging
-import gradio as gr
-from openai import OpenAI, OpenAIError
+import time
+from openai import LengthFinishReasonError, OpenAIError
 import os
-from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import List
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
 
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-logging.basicConfig(level=logging.INFO)
+from source.analysis_cache import AnalysisCache, config_fingerprint
+from source.food_crop import NoFoodError
+from source.food_db import FoodDatabase, analysis_from_portions, normalize_name
+from source.llm_gateway import CircuitOpenError, LLMGateway, get_gateway
+from source.metrics import stage
+from source.image_preprocess import try_decode_image, try_preprocess_image
 
 
 # Reference object info (example: standard plate, banana, etc.)
@@ -25,7 +23,12 @@ REFERENCE_OBJECT = {
     "length_cm": 6.06  # example length of reference item in centimeters
 }
 
+# Languages the model is asked to answer in, by language tag; other tags are passed through as-is.
+LANGUAGE_NAMES = {"zh-TW": "Traditional Chinese", "en": "English", "ja": "Japanese"}
+
 MAX_COMPLETION_TOKENS = 600
+# Names and grams only: nutrient values come from the local food database.
+PORTION_MAX_COMPLETION_TOKENS = 250
 
 
 class Macronutrient(BaseModel):
@@ -42,40 +45,165 @@ class FoodItem(BaseModel):
 class NutritionAnalysis(BaseModel):
     food_items: List[FoodItem]
 
+class FoodPortion(BaseModel):
+    name: str
+    name_en: str
+    grams: float
+    portion_size: str
+
+class PortionAnalysis(BaseModel):
+    food_items: List[FoodPortion]
+
 VISION_MODEL = "gpt-4o-mini"  # vision-capable, lighter output
 
+# (base64_image, mime_type, detail) as returned by Analyst.prepare_image
+PreparedImage = Tuple[str, str, Optional[str]]
+
+
+@dataclass(frozen=True)
+class ResponseBudget:
+    """
+    How much one analysis may cost: output length, image detail and the
+    completion-token cap. linebot_app.budget picks one per request by load.
+    """
+    concise: bool = False
+    detail: Optional[str] = None  # None lets preprocessing choose from the image size
+    max_completion_tokens: int = MAX_COMPLETION_TOKENS
+    # Tried once, with the same images, when an answer is cut off at the token cap.
+    fallback: Optional["ResponseBudget"] = None
+
+
+FULL_BUDGET = ResponseBudget()
+
+
+def collect_chunks(chunks: Iterable[bytes], size_hint: Optional[int] = None) -> memoryview:
+    """
+    Join streamed chunks into a single buffer, preallocated when the size is known.
+    """
+    buffer = bytearray(size_hint or 0)
+    written = 0
+    for chunk in chunks:
+        end = written + len(chunk)
+        buffer[written:end] = chunk  # grows the buffer if the hint was short
+        written = end
+    return memoryview(buffer)[:written]
+
+
+def merge_analyses(analyses: Iterable[Optional[dict]]) -> dict:
+    """
+    Combine NutritionAnalysis dicts into one, keeping the first item of each
+    food name (photos of one meal often show the same dish twice).
+    """
+    items = []
+    seen = set()
+    for analysis in analyses:
+        for item in (analysis or {}).get("food_items") or []:
+            key = normalize_name(str(item.get("name", "")))
+            if key in seen:
+                continue
+            seen.add(key)
+            items.append(item)
+    return {"food_items": items}
+
+
 class Analyst:
-    def __init__(self, api_key: str = None, reference_object: dict = REFERENCE_OBJECT, vision_model: str = VISION_MODEL, language: str = "zh-TW"):
-        # Initialize the OpenAI client and analysis settings
-        self.api_key = api_key or OPENAI_API_KEY
-        self.client = OpenAI(api_key=self.api_key)
+    def __init__(self, api_key: str = None, reference_object: dict = REFERENCE_OBJECT, vision_model: str = VISION_MODEL, language: str = "zh-TW", cache: Optional[AnalysisCache] = None, food_db: Optional[FoodDatabase] = None, gateway: Optional[LLMGateway] = None, cropper=None):
+        # Analysis settings; the shared LLM gateway is looked up on first use
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self._gateway = gateway
         self.reference_object = reference_object
         self.vision_model = vision_model
         self.language = language
+        self.cache = cache
+        self.food_db = food_db
+        # Optional source.food_crop cropper. It only crops when the reference
+        # object was found and kept, so cached full-frame results stay valid.
+        self.cropper = cropper
+
+    @property
+    def gateway(self) -> LLMGateway:
+        if self._gateway is None:
+            self._gateway = get_gateway(self.api_key)
+        return self._gateway
+
+    @gateway.setter
+    def gateway(self, gateway: LLMGateway) -> None:
+        self._gateway = gateway
+
+    def cache_config_key(self) -> str:
+        """
+        Fingerprint of the settings that affect analysis output.
+        """
+        mode = "portions" if self.food_db is not None else "full"
+        return config_fingerprint(self.vision_model, self.reference_object, self.language, mode=mode)
 
     def encode_image_to_base64(self, image_path: str) -> str:
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
-
-    def _build_messages(self, base64_image: str, concise: bool = False):
-        user_instruction = (
-            f"Estimate foods in the photo using reference object {self.reference_object['name']} "
-            f"({self.reference_object['length_cm']} cm). Return JSON with food_items: "
-            "[{name, portion_size (e.g. 100g or 1/2 reference), calories (e.g. 230 kcal), "
-            "macronutrients: {carbs, protein, fat} in grams}]. No extra text."
-        )
+            base64_image, _, _ = self.prepare_image(image_file.read())
+        return base64_image
+
+    def prepare_image(self, image_bytes: bytes, detail: Optional[str] = None, decoded=None) -> tuple:
+        """
+        Crop, downscale and re-encode the image, then base64 it for upload.
+        Returns (base64_image, mime_type, detail). Raises NoFoodError when
+        the cropper finds no meal in the photo. ``decoded`` is the image
+        from try_decode_image, when the caller already has it.
+        """
+        options = {"detail": detail} if detail else {}
+        with stage("preprocess"):
+            prepared = try_preprocess_image(image_bytes, cropper=self.cropper, image=decoded, **options)
+        if prepared is None:
+            payload, mime_type = image_bytes, "image/jpeg"
+        else:
+            payload, mime_type, detail = prepared.data, prepared.mime_type, prepared.detail
+
+        start = time.perf_counter()
+        with stage("base64"):
+            base64_image = base64.b64encode(payload).decode("utf-8")
+        logging.info("Base64 encoded %dB in %.1fms", len(payload), (time.perf_counter() - start) * 1000)
+        return base64_image, mime_type, detail
+
+    @staticmethod
+    def _image_part(base64_image: str, mime_type: str, detail: Optional[str]) -> dict:
+        part = {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
+        if detail:
+            part["image_url"]["detail"] = detail
+        return part
+
+    def _build_messages(self, base64_image: str, concise: bool = False, mime_type: str = "image/jpeg", detail: Optional[str] = None, portions_only: bool = False, more_images: Sequence[PreparedImage] = ()):
+        if portions_only:
+            user_instruction = (
+                f"Identify foods in the photo using reference object {self.reference_object['name']} "
+                f"({self.reference_object['length_cm']} cm) for scale. Return JSON with food_items: "
+                "[{name, name_en (English name), grams (estimated edible weight), "
+                "portion_size (e.g. 1碗)}]. Do not estimate calories or macros. No extra text."
+            )
+        else:
+            user_instruction = (
+                f"Estimate foods in the photo using reference object {self.reference_object['name']} "
+                f"({self.reference_object['length_cm']} cm). Return JSON with food_items: "
+                "[{name, portion_size (e.g. 100g or 1/2 reference), calories (e.g. 230 kcal), "
+                "macronutrients: {carbs, protein, fat} in grams}]. No extra text."
+            )
 
         if concise:
             user_instruction += (
                 " Limit to 3 items max, keep portion_size/calories/macros short integers or whole numbers."
             )
 
-        return [
+        if more_images:
+            user_instruction = (
+                f"The {len(more_images) + 1} photos show one meal. List each food once, even if it "
+                "appears in several photos. "
+            ) + user_instruction
+
+        language = f"{LANGUAGE_NAMES[self.language]} ({self.language})" if self.language in LANGUAGE_NAMES else self.language
+        messages = [
             {
                 "role": "system",
                 "content": (
-                    "You are a professional nutrition analyst AI. Analyze meal images and return nutritional information in Traditional Chinese (zh-TW). "
-                    "All text values (food names, units) must be zh-TW. Be precise and concise, and respond in a structured JSON format only."
+                    f"You are a professional nutrition analyst AI. Analyze meal images and return nutritional information in {language}. "
+                    f"All text values (food names, units) must be {self.language}. Be precise and concise, and respond in a structured JSON format only."
                 )
             },
             {
@@ -85,53 +213,220 @@ class Analyst:
                         "type": "text",
                         "text": user_instruction
                     },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    }
+                    self._image_part(base64_image, mime_type, detail),
+                    *(self._image_part(*image) for image in more_images),
                 ]
             }
         ]
+        return messages
 
-    def call_openai_vision_api(self, base64_image: str):
+    def _parse_request(self, messages: list, response_format, max_completion_tokens: int):
         logging.info("Sending request to OpenAI API...")
-        messages = self._build_messages(base64_image)
         try:
-            response = self.client.beta.chat.completions.parse(
+            response = self.gateway.parse(
                 model=self.vision_model,
                 messages=messages,
-                response_format=NutritionAnalysis,
-                max_completion_tokens=MAX_COMPLETION_TOKENS
+                response_format=response_format,
+                max_completion_tokens=max_completion_tokens
             )
             logging.info("Received response from OpenAI API")
             return response
-        except OpenAIError:
+        except (CircuitOpenError, LengthFinishReasonError):
+            # Let callers tell "provider down" or "answer cut off" apart from "no result".
+            raise
+        except (OpenAIError, TimeoutError):
             logging.exception("OpenAI API call failed")
             return None
 
-    def analyze_image(self, image_path: str) -> dict:
-        base64_image = self.encode_image_to_base64(image_path)
-        result = self.call_openai_vision_api(base64_image)
+    def call_openai_vision_api(self, base64_image: str, mime_type: str = "image/jpeg", detail: Optional[str] = None, more_images: Sequence[PreparedImage] = (), concise: bool = False, max_completion_tokens: int = MAX_COMPLETION_TOKENS):
+        messages = self._build_messages(base64_image, concise=concise, mime_type=mime_type, detail=detail, more_images=more_images)
+        return self._parse_request(messages, NutritionAnalysis, max_completion_tokens)
+
+    def call_portion_api(self, base64_image: str, mime_type: str = "image/jpeg", detail: Optional[str] = None, more_images: Sequence[PreparedImage] = ()):
+        """
+        Ask only for food names and gram estimates (see PortionAnalysis).
+        """
+        messages = self._build_messages(base64_image, mime_type=mime_type, detail=detail, portions_only=True, more_images=more_images)
+        try:
+            return self._parse_request(messages, PortionAnalysis, PORTION_MAX_COMPLETION_TOKENS)
+        except LengthFinishReasonError:
+            logging.warning("Portion answer exceeded %d completion tokens", PORTION_MAX_COMPLETION_TOKENS)
+            return None
+
+    @staticmethod
+    def _call_kwargs(images: Sequence[PreparedImage]) -> dict:
+        base64_image, mime_type, detail = images[0]
+        kwargs = {"base64_image": base64_image, "mime_type": mime_type, "detail": detail}
+        if len(images) > 1:
+            kwargs["more_images"] = list(images[1:])
+        return kwargs
+
+    @staticmethod
+    def _parsed_dict(result) -> Optional[dict]:
         if not result:
-            return {}
+            return None
         try:
             structured_output = result.choices[0].message.parsed
             if hasattr(structured_output, "model_dump"):
                 return structured_output.model_dump()
             return structured_output
-        except Exception as e:
+        except Exception:
             logging.error("Failed to parse structured output", exc_info=True)
+            return None
+
+    def _analyze_with_food_db(self, images: Sequence[PreparedImage]) -> Optional[dict]:
+        """
+        Portions from the vision model, nutrients from the local database.
+        Returns None when any item has no database match, so the caller can
+        fall back to a full model estimate rather than drop foods.
+        """
+        start = time.perf_counter()
+        with stage("portion_call"):
+            result = self.call_portion_api(**self._call_kwargs(images))
+        logging.info("Portion call took %.1fms", (time.perf_counter() - start) * 1000)
+        with stage("parse"):
+            portions = self._parsed_dict(result)
+        if portions is None:
+            return None
+        with stage("food_db_lookup"):
+            analysis, unmatched = analysis_from_portions(self.food_db, portions.get("food_items", []))
+        if unmatched:
+            logging.info("No food DB match for %s; falling back to full analysis", unmatched)
+            return None
+        return analysis
+
+    def analyze_image(self, image_path: str) -> dict:
+        with open(image_path, "rb") as image_file:
+            return self.analyze_bytes(image_file.read())
+
+    def analyze_stream(self, chunks: Iterable[bytes], size_hint: Optional[int] = None) -> dict:
+        """
+        Analyze an image delivered as an iterator of byte chunks.
+        """
+        return self.analyze_bytes(collect_chunks(chunks, size_hint))
+
+    def _cache_keys(self, image_bytes, config_key: str, scope: str) -> tuple:
+        """
+        Cache keys and, for near-duplicate lookups within ``scope``, the
+        decoded image they were hashed from, to be reused for the upload.
+        """
+        decoded = try_decode_image(image_bytes) if scope else None
+        return self.cache.keys_for(image_bytes, config_key, scope, image=decoded), decoded
+
+    def analyze_bytes(self, image_bytes: Union[bytes, bytearray, memoryview], budget: Optional[ResponseBudget] = None, scope: str = "") -> dict:
+        """
+        Analyze an in-memory image without touching the filesystem.
+        Raises NoFoodError, before any API call, for photos without food.
+        Results made under a reduced ``budget`` are not cached. Re-encoded
+        copies of earlier photos only hit the cache within the same
+        ``scope`` (e.g. the sender's user id); otherwise only exact copies do.
+        """
+        budget = budget or FULL_BUDGET
+        if isinstance(image_bytes, memoryview) and image_bytes.format != "B":
+            image_bytes = image_bytes.cast("B")
+
+        cache_keys = decoded = None
+        if self.cache is not None:
+            with stage("cache_lookup"):
+                cache_keys, decoded = self._cache_keys(image_bytes, self.cache_config_key(), scope)
+                cached = self.cache.get(cache_keys)
+            if cached:
+                logging.info("Analysis cache hit")
+                return cached
+
+        analysis = self._analyze_prepared([self.prepare_image(image_bytes, budget.detail, decoded)], budget)
+        if analysis is None:
             return {}
+        if cache_keys is not None and budget == FULL_BUDGET:
+            self.cache.set(cache_keys, analysis)
+        return analysis
+
+    def _call_vision(self, kwargs: dict, budget: ResponseBudget):
+        """
+        Vision call under ``budget``. An answer cut off at the token cap is
+        retried under ``budget.fallback``, or given up on when there is none.
+        """
+        try:
+            return self.call_openai_vision_api(**kwargs)
+        except LengthFinishReasonError:
+            if budget.fallback is None:
+                logging.warning("Vision answer exceeded %d completion tokens", budget.max_completion_tokens)
+                return None
+        fallback = budget.fallback
+        logging.warning(
+            "Vision answer cut off at %d tokens; retrying with %d",
+            budget.max_completion_tokens,
+            fallback.max_completion_tokens,
+        )
+        kwargs = dict(kwargs, concise=fallback.concise, max_completion_tokens=fallback.max_completion_tokens)
+        return self._call_vision(kwargs, fallback)
+
+    def _analyze_prepared(self, images: Sequence[PreparedImage], budget: ResponseBudget = FULL_BUDGET) -> Optional[dict]:
+        analysis = None
+        if self.food_db is not None:
+            analysis = self._analyze_with_food_db(images)
+        if analysis is None:
+            kwargs = self._call_kwargs(images)
+            if budget != FULL_BUDGET:
+                kwargs.update(concise=budget.concise, max_completion_tokens=budget.max_completion_tokens)
+            start = time.perf_counter()
+            with stage("vision_call"):
+                result = self._call_vision(kwargs, budget)
+            logging.info("Vision call with %d image(s) took %.1fms", len(images), (time.perf_counter() - start) * 1000)
+            with stage("parse"):
+                analysis = self._parsed_dict(result)
+        return analysis
+
+    def analyze_images(self, images: Sequence[Union[bytes, bytearray, memoryview]], budget: Optional[ResponseBudget] = None, scope: str = "") -> dict:
+        """
+        Analyze several photos of one meal in a single vision request and
+        return one de-duplicated analysis. When every photo is already in the
+        cache the cached results are merged and no request is made. Photos
+        the cropper rejects are left out; NoFoodError if that is all of them.
+        """
+        budget = budget or FULL_BUDGET
+        if len(images) == 1:
+            return self.analyze_bytes(images[0], budget, scope)
+        images = [image.cast("B") if isinstance(image, memoryview) and image.format != "B" else image for image in images]
+
+        decoded = [None] * len(images)
+        if self.cache is not None:
+            with stage("cache_lookup"):
+                config_key = self.cache_config_key()
+                keys, decoded = zip(*(self._cache_keys(image, config_key, scope) for image in images))
+                cached = [self.cache.get(key) for key in keys]
+            if all(cached):
+                logging.info("Analysis cache hit for all %d images", len(images))
+                return merge_analyses(cached)
+
+        prepared = []
+        for image, image_decoded in zip(images, decoded):
+            try:
+                prepared.append(self.prepare_image(image, budget.detail, image_decoded))
+            except NoFoodError as exc:
+                logging.info("Leaving a photo out of the meal: %s", exc)
+        if not prepared:
+            raise NoFoodError("none of the photos show food")
+        analysis = self._analyze_prepared(prepared, budget)
+        # Combined results are not cached: they belong to the set, not to any one photo.
+        return merge_analyses([analysis]) if analysis else {}
+
+    def with_language(self, language: Optional[str]) -> "Analyst":
+        """
+        Analyst answering in ``language`` that shares this one's gateway,
+        cache and food database; ``self`` is left unchanged.
+        """
+        if not language or language == self.language:
+            return self
+        analyst = copy.copy(self)
+        analyst.language = language
+        return analyst
 
     def gradio_interface(self, image, language: str = None):
-        if language:
-            self.language = language
-        image_path = "temp_uploaded_image.jpg"
-        image.save(image_path)
-        return self.analyze_image(image_path)
-    
+        buffer = BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=95)
+        return self.with_language(language).analyze_bytes(buffer.getbuffer())
+
     def get_reference_object(self) -> dict:
         """
         Return the reference object information used for analysis.
@@ -139,6 +434,11 @@ class Analyst:
         return self.reference_object
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
     # Example usage
     analyst = Analyst()
     image_path = "example_meal.jpg"  # replace with your image file path
@@ -146,11 +446,4 @@ if __name__ == "__main__":
     print("Nutrition Analysis Result:")
     print(result)
 
-    # Uncomment the lines below to launch a Gradio UI for interactive use
-    # import gradio as gr
-    # gr.Interface(
-    #     fn=Analyst().gradio_interface,
-    #     inputs=gr.Image(type="pil"),
-    #     outputs="json",
-    #     title="Meal Nutrition Analyzer"
-    # ).launch()
+    # For an interactive, multi-user UI run: python -m source.gradio_app
@@ -0,0 +1,195 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from source.food_crop import NoFoodError
+from source.metrics import CROP_OUTCOMES
+
+# OpenAI "high" detail fits the image into 2048x2048, then scales the short
+# side down to 768px and bills per 512px tile. Anything larger is wasted upload.
+MAX_LONG_SIDE = int(os.getenv("SNAPBITE_IMAGE_MAX_LONG_SIDE", "2048"))
+MAX_SHORT_SIDE = int(os.getenv("SNAPBITE_IMAGE_MAX_SHORT_SIDE", "768"))
+LOW_DETAIL_MAX_SIDE = 512
+IMAGE_FORMAT = os.getenv("SNAPBITE_IMAGE_FORMAT", "jpeg").lower()
+IMAGE_QUALITY = int(os.getenv("SNAPBITE_IMAGE_QUALITY", "85"))
+IMAGE_DETAIL = os.getenv("SNAPBITE_IMAGE_DETAIL", "auto").lower()
+
+_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+@dataclass
+class PreparedImage:
+    """
+    Re-encoded image ready for upload, plus per-stage measurements.
+    """
+    data: bytes
+    mime_type: str
+    detail: str
+    width: int
+    height: int
+    original_size: int
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - len(self.data)
+
+
+def target_size(width: int, height: int, max_long: int = MAX_LONG_SIDE, max_short: int = MAX_SHORT_SIDE) -> tuple:
+    """
+    Scale (width, height) down so the long and short sides fit the limits.
+    """
+    scale = min(1.0, max_long / max(width, height), max_short / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def choose_detail(width: int, height: int, requested: str = IMAGE_DETAIL) -> str:
+    """
+    Pick the ``image_url`` detail level. "auto" sends small images as "low",
+    since a single 512px tile already covers them.
+    """
+    if requested in ("low", "high"):
+        return requested
+    return "low" if max(width, height) <= LOW_DETAIL_MAX_SIDE else "high"
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def _decode(data: bytes) -> Image.Image:
+    image = Image.open(BytesIO(data))
+    image.draft("RGB", target_size(*image.size))  # lets JPEG decode at reduced scale
+    image.load()
+    return image
+
+
+def decode_image(data: bytes) -> Image.Image:
+    """
+    Decode at no more than the upload size, upright and in RGB. The result
+    can be passed to preprocess_image so the bytes are only decoded once.
+    """
+    return _flatten(ImageOps.exif_transpose(_decode(data)))
+
+
+def try_decode_image(data: bytes) -> Optional[Image.Image]:
+    """
+    Like decode_image, but returns None for bytes Pillow cannot decode.
+    """
+    try:
+        return decode_image(data)
+    except Exception:
+        return None
+
+
+def preprocess_image(
+    data: bytes,
+    image_format: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+    detail: str = IMAGE_DETAIL,
+    cropper=None,
+    image: Optional[Image.Image] = None,
+) -> PreparedImage:
+    """
+    Orient, crop, downscale and re-encode an image for the vision API.
+
+    EXIF orientation is applied to the pixels and all metadata is dropped.
+    With a ``cropper`` (see source.food_crop) only the meal region is kept,
+    and NoFoodError is raised for images that clearly show no food.
+    ``image`` is ``data`` already run through decode_image, if available.
+    """
+    if image_format not in _MIME_TYPES:
+        raise ValueError(f"unsupported image format: {image_format}")
+
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+
+    if image is None:
+        image = _decode(data)
+        mark = time.perf_counter()
+        timings["decode"] = (mark - start) * 1000
+
+        image = ImageOps.exif_transpose(image)
+        image = _flatten(image)
+        now = time.perf_counter()
+        timings["orient"] = (now - mark) * 1000
+    else:
+        now = start
+    mark = now
+
+    if cropper is not None:
+        result = cropper.locate(image)
+        if not result.food:
+            CROP_OUTCOMES.inc(1, "rejected")
+            raise NoFoodError(result.reason)
+        CROP_OUTCOMES.inc(1, "cropped" if result.box else "full")
+        if result.box:
+            image = image.crop(result.box)
+        now = time.perf_counter()
+        timings["crop"] = (now - mark) * 1000
+        mark = now
+
+    if detail == "low":
+        # The model sees low-detail images at 512px; sending more is wasted upload.
+        size = target_size(*image.size, max_long=LOW_DETAIL_MAX_SIDE, max_short=LOW_DETAIL_MAX_SIDE)
+    else:
+        size = target_size(*image.size)
+    if size != image.size:
+        image = image.resize(size, Image.LANCZOS)
+    now = time.perf_counter()
+    timings["resize"] = (now - mark) * 1000
+    mark = now
+
+    out = BytesIO()
+    if image_format == "jpeg":
+        image.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(out, format="WEBP", quality=quality, method=4)
+    encoded = out.getvalue()
+    timings["encode"] = (time.perf_counter() - mark) * 1000
+
+    prepared = PreparedImage(
+        data=encoded,
+        mime_type=_MIME_TYPES[image_format],
+        detail=choose_detail(*image.size, requested=detail),
+        width=image.size[0],
+        height=image.size[1],
+        original_size=len(data),
+        timings_ms=timings,
+    )
+    logging.info(
+        "Preprocessed image %dB -> %dB (%dx%d, detail=%s) %s",
+        prepared.original_size,
+        len(prepared.data),
+        prepared.width,
+        prepared.height,
+        prepared.detail,
+        " ".join(f"{name}={ms:.1f}ms" for name, ms in timings.items()),
+    )
+    return prepared
+
+
+def try_preprocess_image(data: bytes, **kwargs) -> Optional[PreparedImage]:
+    """
+    Like preprocess_image, but returns None for bytes Pillow cannot decode.
+    NoFoodError still propagates.
+    """
+    try:
+        return preprocess_image(data, **kwargs)
+    except NoFoodError:
+        raise
+    except Exception:
+        logging.warning("Image preprocessing failed, sending original bytes", exc_info=True)
+        return None
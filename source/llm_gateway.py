@@ -0,0 +1,273 @@
+"""
+Shared AsyncOpenAI gateway for the vision and suggestion calls.
+
+All requests go through one event loop running on a background thread, so
+synchronous callers (LINE worker threads, Gradio handlers) share a single
+connection pool and a global concurrency limit. Each call has an overall
+deadline covering every retry. 429, 5xx, connection and timeout errors
+are retried with jittered exponential backoff, and ``Retry-After`` is
+honoured when the server sends it. A circuit breaker opens after
+repeated failures and makes callers fail fast with CircuitOpenError until
+a trial call succeeds.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI
+
+from .metrics import LLM_REQUESTS, record_usage
+
+LLM_CONCURRENCY = int(os.getenv("SNAPBITE_LLM_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("SNAPBITE_LLM_TIMEOUT", "30"))  # seconds per call, including retries
+LLM_MAX_RETRIES = int(os.getenv("SNAPBITE_LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("SNAPBITE_LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("SNAPBITE_LLM_BACKOFF_MAX", "8"))
+BREAKER_FAILURES = int(os.getenv("SNAPBITE_LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("SNAPBITE_LLM_BREAKER_RESET", "30"))
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised without calling the provider while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures. After
+    ``reset_timeout`` seconds one trial call is let through (half-open); its
+    outcome closes the breaker or re-opens it. A trial that ends without
+    telling either way (a client error, cancellation) is released so the
+    next call can try again.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def acquire(self) -> Optional[str]:
+        """
+        "closed" for a normal call, "trial" for the half-open trial, or None
+        when the call must fail fast. A trial must end in record_success,
+        record_failure or release.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at < self.reset_timeout or self._trial_running:
+                return None
+            self._trial_running = True
+            return "trial"
+
+    def allow(self) -> bool:
+        return self.acquire() is not None
+
+    def release(self) -> None:
+        """
+        End a trial with no verdict: the breaker stays open for another trial.
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, (APIConnectionError, APITimeoutError, asyncio.TimeoutError)):
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500)
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMGateway:
+    """
+    Synchronous facade over AsyncOpenAI with bounded concurrency, deadlines,
+    retries and a circuit breaker. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        concurrency: int = LLM_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def _get_client(self) -> AsyncOpenAI:
+        # Built on first use (inside the loop) so importing callers needs no API key.
+        if self._client is None:
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0, timeout=self.timeout)
+        return self._client
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _call(self, client: AsyncOpenAI, kwargs: Dict[str, Any]) -> Any:
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await client.beta.chat.completions.parse(**kwargs)
+            finally:
+                self.in_flight -= 1
+
+    async def aparse(self, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        ``client.beta.chat.completions.parse(**kwargs)`` under the gateway's policies.
+        """
+        model = str(kwargs.get("model", ""))
+        slot = self.breaker.acquire()
+        if slot is None:
+            LLM_REQUESTS.inc(1, model, "circuit_open")
+            raise CircuitOpenError("LLM provider circuit is open")
+        try:
+            return await self._attempts(model, timeout, kwargs)
+        finally:
+            if slot == "trial":
+                # No-op after a verdict; frees the trial if it was cancelled or hit a client error.
+                self.breaker.release()
+
+    async def _attempts(self, model: str, timeout: Optional[float], kwargs: Dict[str, Any]) -> Any:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        client = self._get_client()
+
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                # Time spent waiting for a semaphore slot counts against the deadline too.
+                result = await asyncio.wait_for(self._call(client, kwargs), remaining)
+            except Exception as exc:
+                if not _retryable(exc):
+                    # Bad requests are our fault and say nothing about the provider's health.
+                    LLM_REQUESTS.inc(1, model, "client_error")
+                    raise
+                delay = self._backoff(attempt, exc)
+                if attempt >= self.max_retries or loop.time() + delay >= deadline:
+                    self.breaker.record_failure()
+                    LLM_REQUESTS.inc(1, model, "timeout" if isinstance(exc, asyncio.TimeoutError) else "error")
+                    if isinstance(exc, asyncio.TimeoutError):
+                        raise TimeoutError(f"LLM call exceeded its {timeout or self.timeout:.1f}s deadline") from exc
+                    raise
+                logging.warning("LLM call failed (%s), retry %d in %.2fs", type(exc).__name__, attempt + 1, delay)
+                LLM_REQUESTS.inc(1, model, "retry")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            LLM_REQUESTS.inc(1, model, "ok")
+            record_usage(model, getattr(result, "usage", None))
+            return result
+
+    def parse(self, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Blocking wrapper around aparse for worker threads.
+        """
+        future = asyncio.run_coroutine_threadsafe(self.aparse(timeout=timeout, **kwargs), self._ensure_loop())
+        return future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"breaker": self.breaker.state, "in_flight": self.in_flight, "concurrency": self.concurrency}
+
+    def close(self) -> None:
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self._client
+            self._loop = self._thread = self._client = None
+            self._semaphore = None
+        if loop is None:
+            return
+        if client is not None:
+            asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
+_gateways: Dict[Tuple[Optional[str], Optional[str]], LLMGateway] = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(api_key: Optional[str] = None, base_url: Optional[str] = None) -> LLMGateway:
+    """
+    Process-wide gateway per (api_key, base_url). Defaults come from
+    OPENAI_API_KEY and OPENAI_BASE_URL.
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    base_url = base_url or os.getenv("OPENAI_BASE_URL")
+    with _gateways_lock:
+        gateway = _gateways.get((api_key, base_url))
+        if gateway is None:
+            gateway = _gateways[(api_key, base_url)] = LLMGateway(api_key=api_key, base_url=base_url)
+        return gateway
@@ -0,0 +1,175 @@
+"""
+Deterministic meal evaluation against the user's daily calorie budget.
+
+``evaluate_meal`` compares a meal's calories with its share of the daily
+target and its macro energy split with the goal's recommended ranges, then
+fills the next-meal menu from MENU_TEMPLATES. It also reports a confidence
+score; MealSuggester only calls the LLM when confidence is below
+RULE_CONFIDENCE_THRESHOLD or a creative suggestion is requested.
+"""
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .nutrient_table import MACRO_KCAL_PER_GRAM
+
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("SNAPBITE_RULE_CONFIDENCE_THRESHOLD", "0.6"))
+
+# Share of the daily calorie target each meal should cover.
+MEAL_SHARES = {"breakfast": 0.25, "lunch": 0.35, "dinner": 0.30, "snack": 0.10}
+MEAL_ALIASES = {"早餐": "breakfast", "午餐": "lunch", "晚餐": "dinner", "點心": "snack", "宵夜": "snack"}
+NEXT_MEAL = {"breakfast": "lunch", "lunch": "dinner", "dinner": "breakfast", "snack": "dinner"}
+MEAL_NAMES_ZH = {"breakfast": "早餐", "lunch": "午餐", "dinner": "晚餐", "snack": "點心"}
+
+# Recommended share of energy from (carbs, protein, fat) per goal, as (low, high).
+MACRO_RANGES: Dict[str, Tuple[Tuple[float, float], ...]] = {
+    "減脂": ((0.40, 0.50), (0.25, 0.35), (0.20, 0.30)),
+    "維持": ((0.45, 0.60), (0.15, 0.25), (0.20, 0.30)),
+    "增肌": ((0.45, 0.55), (0.20, 0.30), (0.20, 0.30)),
+}
+MACRO_NAMES_ZH = ("碳水化合物", "蛋白質", "脂肪")
+
+# A meal within this fraction of its calorie share counts as on target.
+CALORIE_TOLERANCE = 0.15
+# Stated calories and 4/4/9 macro energy disagreeing by more than this
+# suggests a bad estimate, so the rules should not be trusted alone.
+ENERGY_MISMATCH_TOLERANCE = 0.25
+
+# Next-meal menus by nutritional focus: (name, portion_size, kcal) per item.
+MENU_TEMPLATES: Dict[str, List[List[Tuple[str, str, int]]]] = {
+    "protein": [
+        [("烤雞胸肉", "120g", 200), ("燙青菜", "1盤", 60), ("糙米飯", "半碗", 140)],
+        [("清蒸鮭魚", "150g", 310), ("炒時蔬", "1盤", 100), ("糙米飯", "1碗", 280)],
+    ],
+    "low_carb": [
+        [("滷豆腐", "2塊", 160), ("涼拌小黃瓜", "1份", 50), ("茶葉蛋", "1顆", 75), ("燙青菜", "1盤", 60)],
+        [("鹽烤鯖魚", "1片", 350), ("蒜炒高麗菜", "1盤", 110), ("味噌豆腐湯", "1碗", 80), ("地瓜", "半條", 100)],
+    ],
+    "low_fat": [
+        [("蔬菜雞肉湯麵", "1碗", 380), ("燙青菜", "1盤", 60)],
+        [("白切雞", "150g", 260), ("五穀飯", "1碗", 280), ("燙地瓜葉", "1盤", 60), ("木瓜", "1碗", 60)],
+    ],
+    "balanced": [
+        [("雞肉蔬菜沙拉", "1盒", 280), ("全麥吐司", "1片", 120), ("無糖豆漿", "1杯", 90)],
+        [("滷雞腿", "1支", 260), ("五穀飯", "1碗", 280), ("炒時蔬", "1盤", 100), ("蛋花湯", "1碗", 60)],
+    ],
+    "light": [
+        [("無糖優格", "1杯", 120), ("綜合水果", "1碗", 80), ("燙青菜", "1盤", 60)],
+        [("蔬菜豆腐湯", "1碗", 150), ("燙青菜", "1盤", 60), ("茶葉蛋", "1顆", 75)],
+    ],
+}
+
+
+@dataclass
+class RuleEvaluation:
+    evaluation: str
+    issues: List[str]
+    next_meal: str
+    suggested_menu: List[Dict[str, str]]
+    confidence: float
+    target_calories: float
+    notes: List[str] = field(default_factory=list)
+
+    def as_suggestion(self) -> Dict[str, object]:
+        """
+        Fields matching source.suggest.MealSuggestion.
+        """
+        return {
+            "evaluation": self.evaluation,
+            "issues": self.issues,
+            "next_meal": self.next_meal,
+            "suggested_menu": self.suggested_menu,
+        }
+
+
+def normalize_meal(meal: str) -> Optional[str]:
+    meal = (meal or "").strip().lower()
+    meal = MEAL_ALIASES.get(meal, meal)
+    return meal if meal in MEAL_SHARES else None
+
+
+def choose_menu(focus: str, target_calories: float) -> List[Dict[str, str]]:
+    """
+    Template for ``focus`` whose total calories are closest to the target.
+    """
+    templates = MENU_TEMPLATES.get(focus) or MENU_TEMPLATES["balanced"]
+    best = min(templates, key=lambda items: abs(sum(kcal for _, _, kcal in items) - target_calories))
+    return [{"name": name, "portion_size": portion, "calories": f"{kcal} kcal"} for name, portion, kcal in best]
+
+
+def evaluate_meal(totals: Dict[str, float], daily_calories: float, goal: str, current_meal: str) -> RuleEvaluation:
+    """
+    Judge one meal's ``totals`` (calories, carbs, protein, fat) against the daily target.
+    """
+    confidence = 1.0
+    notes: List[str] = []
+    goal = goal.strip()
+    meal = normalize_meal(current_meal)
+    if meal is None:
+        confidence -= 0.3
+        notes.append(f"unknown meal type {current_meal!r}")
+        meal = "lunch"
+    ranges = MACRO_RANGES.get(goal)
+    if ranges is None:
+        confidence -= 0.3
+        notes.append(f"unknown goal {goal!r}")
+        ranges = MACRO_RANGES["維持"]
+
+    values = [totals.get(key, 0.0) for key in ("calories", "carbs", "protein", "fat")]
+    calories, carbs, protein, fat = values
+    if any(math.isnan(v) for v in values) or calories <= 0:
+        notes.append("meal totals missing or unparseable")
+        return RuleEvaluation("無法判斷本餐營養。", [], NEXT_MEAL[meal], [], 0.0, 0.0, notes)
+
+    macro_energy = [g * k for g, k in zip((carbs, protein, fat), MACRO_KCAL_PER_GRAM)]
+    energy = sum(macro_energy)
+    if energy <= 0 or abs(energy - calories) / calories > ENERGY_MISMATCH_TOLERANCE:
+        confidence -= 0.5
+        notes.append(f"macro energy {energy:.0f} kcal vs stated {calories:.0f} kcal")
+
+    issues: List[str] = []
+    target = daily_calories * MEAL_SHARES[meal]
+    deviation = (calories - target) / target if target > 0 else 0.0
+    if deviation > CALORIE_TOLERANCE:
+        issues.append(f"熱量偏高：{calories:.0f} kcal，建議約 {target:.0f} kcal")
+    elif deviation < -CALORIE_TOLERANCE:
+        issues.append(f"熱量偏低：{calories:.0f} kcal，建議約 {target:.0f} kcal")
+
+    high, low = [], []
+    if energy > 0:
+        for name, share, (lo, hi) in zip(MACRO_NAMES_ZH, (e / energy for e in macro_energy), ranges):
+            if share > hi:
+                high.append(name)
+                issues.append(f"{name}比例偏高（{share:.0%}，建議 {lo:.0%}–{hi:.0%}）")
+            elif share < lo:
+                low.append(name)
+                issues.append(f"{name}比例偏低（{share:.0%}，建議 {lo:.0%}–{hi:.0%}）")
+
+    next_meal = NEXT_MEAL[meal]
+    # Spread half of this meal's surplus or deficit onto the next one.
+    next_target = max(daily_calories * MEAL_SHARES[next_meal] - (calories - target) / 2, 0.0)
+    if "蛋白質" in low:
+        focus = "protein"
+    elif "碳水化合物" in high:
+        focus = "low_carb"
+    elif "脂肪" in high:
+        focus = "low_fat"
+    elif deviation > CALORIE_TOLERANCE:
+        focus = "light"
+    else:
+        focus = "balanced"
+
+    if issues:
+        evaluation = f"這份{MEAL_NAMES_ZH[meal]}約 {calories:.0f} kcal，有 {len(issues)} 項需要調整。"
+    else:
+        evaluation = f"這份{MEAL_NAMES_ZH[meal]}約 {calories:.0f} kcal，熱量與營養比例均衡。"
+    return RuleEvaluation(
+        evaluation=evaluation,
+        issues=issues,
+        next_meal=next_meal,
+        suggested_menu=choose_menu(focus, next_target),
+        confidence=max(confidence, 0.0),
+        target_calories=next_target,
+        notes=notes,
+    )
@@ -0,0 +1,252 @@
+"""
+Low-overhead in-process metrics with Prometheus text export.
+
+Counters and histograms keep one shard per thread, so recording a value is
+a few dict and list operations on data no other thread writes — no locks on
+the hot path. Shards are summed only when the registry is rendered (e.g. by
+the webhook's /metrics route). Histograms use fixed bucket bounds chosen up
+front, as Prometheus expects.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans a cached reply (~1 ms) to a slow vision call (~30 s).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Sharded:
+    """
+    Per-thread storage for one metric; shards are registered once per thread.
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[LabelValues, list]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[LabelValues, list]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _merged(self, width: int) -> Dict[LabelValues, List[float]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[LabelValues, List[float]] = {}
+        for shard in shards:
+            for key, values in list(shard.items()):
+                total = merged.setdefault(key, [0.0] * width)
+                for i, value in enumerate(values):
+                    total[i] += value
+        return merged
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = [0.0]
+        cell[0] += amount
+
+    def value(self, *labels: str) -> float:
+        return self._merged(1).get(labels, [0.0])[0]
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v[0])}" for k, v in sorted(self._merged(1).items())]
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Layout per label set: one slot per bucket, +Inf, then sum.
+        self._width = len(self.buckets) + 2
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = [0.0] * self._width
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self, *labels: str) -> Dict[str, float]:
+        cell = self._merged(self._width).get(labels)
+        if cell is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": sum(cell[:-1]), "sum": cell[-1]}
+
+    def counts(self, *labels: str) -> List[float]:
+        """
+        Cumulative count per bucket, +Inf last; diff two calls for a window.
+        """
+        cell = self._merged(self._width).get(labels)
+        return cell[:-1] if cell is not None else [0.0] * (len(self.buckets) + 1)
+
+    def quantile(self, q: float, *labels: str, counts: Optional[Sequence[float]] = None) -> Optional[float]:
+        """
+        Upper bucket bound containing the ``q`` quantile (None without
+        observations). Pass ``counts`` to use a window instead of all time.
+        """
+        if counts is None:
+            cell = self._merged(self._width).get(labels)
+            if cell is None:
+                return None
+            counts = cell[:-1]
+        target = q * sum(counts)
+        running = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            if count and running >= target:
+                return bound
+        return None
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, cell in sorted(self._merged(self._width).items()):
+            running = 0.0
+            for bound, count in zip(self.buckets, cell):
+                running += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(running)}")
+            running += cell[len(self.buckets)]
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, inf)} {_number(running)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(cell[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(running)}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read from a callback at render time (queue depth, cache size, ...).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            return [f"{self.name} {_number(self.read())}"]
+        except Exception:
+            return []
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"metric {metric.name} already registered as {existing.kind}")
+                if isinstance(metric, Gauge):
+                    existing.read = metric.read
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, help_text, read))
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "snapbite_stage_seconds", "Time spent in each processing stage.", labelnames=("stage",)
+)
+LLM_REQUESTS = REGISTRY.counter(
+    "snapbite_llm_requests_total", "LLM calls by model and outcome.", labelnames=("model", "outcome")
+)
+CROP_OUTCOMES = REGISTRY.counter(
+    "snapbite_crop_outcomes_total", "Pre-analysis crop results: cropped, full frame or rejected.", labelnames=("outcome",)
+)
+LLM_TOKENS = REGISTRY.counter(
+    "snapbite_llm_tokens_total", "LLM tokens used, from response.usage.", labelnames=("model", "kind")
+)
+
+
+def stage(name: str):
+    """
+    Context manager timing one stage into snapbite_stage_seconds.
+    """
+    return STAGE_SECONDS.time(name)
+
+
+def record_usage(model: str, usage) -> None:
+    """
+    Add prompt, completion and cached-prompt token counts from ``response.usage``.
+    """
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model, "prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model, "completion")
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+    if cached:
+        LLM_TOKENS.inc(cached, model, "cached_prompt")
@@ -0,0 +1,260 @@
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# kcal per gram of each macronutrient, in (carbs, protein, fat) order.
+MACRO_KCAL_PER_GRAM = np.array([4.0, 4.0, 9.0])
+
+_RANGE_SEPARATORS = r"(?:-|~|–|—|至|到)"
+_NUMBER = r"\d+(?:\.\d+)?(?:\s+\d+/\d+|/\d+)?"
+_QUANTITY_RE = re.compile(
+    rf"(?P<low>{_NUMBER})(?:\s*{_RANGE_SEPARATORS}\s*(?P<high>{_NUMBER}))?\s*(?P<unit>[a-zA-Z]+|[^\d\s]+)?"
+)
+
+# Unit -> multiplier into the canonical unit (kcal for energy, grams for mass).
+_ENERGY_UNITS = {
+    "kcal": 1.0, "cal": 1.0, "calories": 1.0, "大卡": 1.0, "卡": 1.0, "千卡": 1.0,
+    "kj": 1 / 4.184, "千焦": 1 / 4.184,
+}
+_MASS_UNITS = {
+    "g": 1.0, "gram": 1.0, "grams": 1.0, "克": 1.0, "公克": 1.0,
+    "mg": 0.001, "毫克": 0.001, "kg": 1000.0, "公斤": 1000.0,
+}
+_UNITS = {"energy": _ENERGY_UNITS, "mass": _MASS_UNITS}
+
+
+def _normalize(text: str) -> str:
+    # NFKC folds full-width digits/letters; ½ becomes 1⁄2 with a fraction slash.
+    text = unicodedata.normalize("NFKC", text).replace("⁄", "/").replace(",", "")
+    return text.strip().lower()
+
+
+def _to_float(number: str) -> float:
+    whole, _, frac = number.partition(" ")
+    if frac:
+        return float(whole) + _to_float(frac.strip())
+    if "/" in number:
+        num, den = number.split("/")
+        return float(num) / float(den) if float(den) else float("nan")
+    return float(number)
+
+
+def parse_quantity(value: Any, kind: Optional[str] = None) -> float:
+    """
+    Parse one free-form amount such as "230 kcal", "45g", "1/2 碗", "200-250 大卡"
+    or "３０ｇ". Ranges resolve to their midpoint; "半" alone means 0.5.
+
+    With ``kind`` ("energy" or "mass") the number is converted into kcal or
+    grams, and strings whose unit belongs to a different kind return NaN.
+    Returns NaN when no number is present.
+    """
+    if value is None:
+        return float("nan")
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return float(value)
+
+    text = _normalize(str(value))
+    match = _QUANTITY_RE.search(text)
+    if match is None:
+        return 0.5 if text.startswith("半") else float("nan")
+
+    amount = _to_float(match.group("low"))
+    if match.group("high"):
+        amount = (amount + _to_float(match.group("high"))) / 2
+
+    if kind is None:
+        return amount
+    unit = (match.group("unit") or "").strip()
+    if not unit:
+        return amount
+    table = _UNITS[kind]
+    for name, factor in table.items():
+        if unit.startswith(name):
+            return amount * factor
+    other = _UNITS["mass" if kind == "energy" else "energy"]
+    if any(unit.startswith(name) for name in other):
+        return float("nan")
+    return amount
+
+
+def parse_quantities(values: Iterable[Any], kind: Optional[str] = None) -> np.ndarray:
+    """
+    Parse many amounts into a float64 array (NaN where unparseable).
+
+    LLM output repeats the same strings heavily ("0g", "1碗"), so each
+    distinct value is parsed once and scattered back with the inverse index.
+    """
+    values = list(values)
+    if not values:
+        return np.empty(0, dtype=np.float64)
+    keys = np.array([str(v) if v is not None else "" for v in values], dtype=object)
+    numeric = np.array(
+        [isinstance(v, (int, float)) and not isinstance(v, bool) for v in values], dtype=bool
+    )
+    result = np.full(len(values), np.nan, dtype=np.float64)
+    if numeric.any():
+        result[numeric] = [float(v) for v, is_num in zip(values, numeric) if is_num]
+    text_mask = ~numeric
+    if text_mask.any():
+        uniques, inverse = np.unique(keys[text_mask], return_inverse=True)
+        parsed = np.array([parse_quantity(u, kind) for u in uniques], dtype=np.float64)
+        result[text_mask] = parsed[inverse]
+    return result
+
+
+@dataclass
+class MealTable:
+    """
+    Column-oriented item table: one row per food item.
+
+    ``meal`` indexes the meal each item belongs to, ``day`` is the
+    datetime64[D] of that meal.
+    """
+    calories: np.ndarray
+    carbs: np.ndarray
+    protein: np.ndarray
+    fat: np.ndarray
+    meal: np.ndarray
+    day: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.calories)
+
+    def values(self) -> np.ndarray:
+        """
+        (n, 4) matrix of calories, carbs, protein, fat with NaN treated as 0.
+        """
+        return np.nan_to_num(np.column_stack([self.calories, self.carbs, self.protein, self.fat]))
+
+
+def _field(obj: Any, name: str, default: Any = None) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def table_from_analyses(analyses: Sequence[Any], days: Optional[Sequence[Any]] = None) -> MealTable:
+    """
+    Flatten NutritionAnalysis objects or dicts (one per meal) into a MealTable.
+    """
+    calories: List[Any] = []
+    carbs: List[Any] = []
+    protein: List[Any] = []
+    fat: List[Any] = []
+    meal_index: List[int] = []
+    for index, analysis in enumerate(analyses):
+        for item in _field(analysis, "food_items", None) or []:
+            macros = _field(item, "macronutrients", None) or {}
+            calories.append(_field(item, "calories"))
+            carbs.append(_field(macros, "carbs"))
+            protein.append(_field(macros, "protein"))
+            fat.append(_field(macros, "fat"))
+            meal_index.append(index)
+
+    meal = np.array(meal_index, dtype=np.int64)
+    if days is None:
+        day = np.full(len(meal), np.datetime64("NaT"), dtype="datetime64[D]")
+    else:
+        day = np.array(days, dtype="datetime64[D]")[meal] if len(meal) else np.empty(0, dtype="datetime64[D]")
+    return MealTable(
+        calories=parse_quantities(calories, "energy"),
+        carbs=parse_quantities(carbs, "mass"),
+        protein=parse_quantities(protein, "mass"),
+        fat=parse_quantities(fat, "mass"),
+        meal=meal,
+        day=day,
+    )
+
+
+def table_from_daily_logs(daily_logs: Sequence[Dict[str, Any]]) -> Tuple[MealTable, List[str]]:
+    """
+    Build a MealTable from the Visualizer log layout, one row per meal.
+    Returns the table and the meal_type of each row.
+    """
+    calories: List[Any] = []
+    carbs: List[Any] = []
+    protein: List[Any] = []
+    fat: List[Any] = []
+    days: List[str] = []
+    meal_types: List[str] = []
+    for log in daily_logs:
+        for meal in log.get("meals", []):
+            macros = meal.get("macros", {})
+            calories.append(meal.get("calories"))
+            carbs.append(macros.get("carbs"))
+            protein.append(macros.get("protein"))
+            fat.append(macros.get("fat"))
+            days.append(log["date"])
+            meal_types.append(meal.get("meal_type", ""))
+
+    table = MealTable(
+        calories=parse_quantities(calories, "energy"),
+        carbs=parse_quantities(carbs, "mass"),
+        protein=parse_quantities(protein, "mass"),
+        fat=parse_quantities(fat, "mass"),
+        meal=np.arange(len(days), dtype=np.int64),
+        day=np.array(days, dtype="datetime64[D]"),
+    )
+    return table, meal_types
+
+
+def group_sum(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sum the rows of ``values`` (n, k) per distinct key. Returns (sorted keys, sums).
+    """
+    if len(keys) == 0:
+        return keys[:0], np.zeros((0,) + values.shape[1:])
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    if values.ndim == 1:
+        return uniques, np.bincount(inverse, weights=values, minlength=len(uniques))
+    sums = np.column_stack(
+        [np.bincount(inverse, weights=values[:, j], minlength=len(uniques)) for j in range(values.shape[1])]
+    )
+    return uniques, sums
+
+
+def week_start(days: np.ndarray) -> np.ndarray:
+    """
+    Monday of the ISO week for each datetime64[D] value.
+    """
+    days = days.astype("datetime64[D]")
+    # 1970-01-01 was a Thursday, i.e. weekday 3 with Monday == 0.
+    weekday = (days.astype(np.int64) + 3) % 7
+    return days - weekday.astype("timedelta64[D]")
+
+
+def totals_by_meal(table: MealTable) -> Tuple[np.ndarray, np.ndarray]:
+    return group_sum(table.meal, table.values())
+
+
+def totals_by_day(table: MealTable) -> Tuple[np.ndarray, np.ndarray]:
+    return group_sum(table.day, table.values())
+
+
+def totals_by_week(table: MealTable) -> Tuple[np.ndarray, np.ndarray]:
+    return group_sum(week_start(table.day), table.values())
+
+
+def macro_ratios(totals: np.ndarray) -> np.ndarray:
+    """
+    Share of energy from carbs, protein and fat for each row of a totals
+    matrix (calories, carbs, protein, fat). Rows without macros give zeros.
+    """
+    totals = np.atleast_2d(totals)
+    energy = totals[:, 1:4] * MACRO_KCAL_PER_GRAM
+    total = energy.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratios = np.where(total > 0, energy / total, 0.0)
+    return ratios
+
+
+def meal_totals(analysis: Any) -> Dict[str, float]:
+    """
+    Calories and macro grams summed over one analysis.
+    """
+    table = table_from_analyses([analysis])
+    calories, carbs, protein, fat = table.values().sum(axis=0) if len(table) else (0.0, 0.0, 0.0, 0.0)
+    return {"calories": float(calories), "carbs": float(carbs), "protein": float(protein), "fat": float(fat)}
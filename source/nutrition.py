@@ -1,5 +1,3 @@
-import gradio as gr
-
 class NutritionAnalyzer:
     def get_user_info(self) -> tuple:
         """
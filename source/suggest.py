@@ -1,15 +1,18 @@
 import os
 import json
-import openai
 import logging
+from typing import List, Optional
 
-# use the OpenAI client for structured parsing
-client = openai
-
-from image_analysis import NutritionAnalysis
-from nutrition import calculate_bmi, suggest_calories
+from openai import OpenAIError
 from pydantic import BaseModel
-from typing import List
+
+from source.image_analysis import NutritionAnalysis
+from source.llm_gateway import CircuitOpenError, LLMGateway, get_gateway
+from source.meal_rules import RULE_CONFIDENCE_THRESHOLD, evaluate_meal
+from source.metrics import stage
+from source.nutrient_table import macro_ratios, meal_totals
+from source.nutrition import NutritionAnalyzer
+from source.suggestion_cache import SuggestionCache, suggestion_fingerprint
 
 class MenuItem(BaseModel):
     name: str
@@ -22,9 +25,6 @@ class MealSuggestion(BaseModel):
     next_meal: str
     suggested_menu: List[MenuItem]
 
-# Make sure your OpenAI API key is set as an environment variable: OPENAI_API_KEY
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 MODEL = "gpt-5-mini"
 # Define the expected JSON response format
 RESPONSE_FORMAT = {
@@ -40,17 +40,29 @@ RESPONSE_FORMAT = {
     ]
 }
 
+# Static instructions and schema go first and never vary between calls, so the
+# request prefix stays byte-identical and provider-side prompt caching applies.
+# Everything user-specific belongs in the user message after it.
+SYSTEM_PROMPT = (
+    "You are a nutrition assistant. Based on the user's height, weight, nutrition goal, "
+    "current meal and nutrition analysis, evaluate if the current meal's "
+    "macronutrients (protein, carbs, fat) and calories are balanced, "
+    "and suggest a menu and portions for the next meal (lunch or dinner).\n"
+    "Please format your response as JSON matching the following schema:\n"
+    + json.dumps(RESPONSE_FORMAT, indent=2)
+)
+MAX_COMPLETION_TOKENS = 500
+
 # Encapsulate suggestion logic into a class
 class MealSuggester:
-    def __init__(self, api_key: str = None, model: str = MODEL):
+    def __init__(self, api_key: str = None, model: str = MODEL, cache: Optional[SuggestionCache] = None, gateway: Optional[LLMGateway] = None):
         """
-        Initialize the MealSuggester with an OpenAI client and model.
+        Initialize the MealSuggester with the shared LLM gateway and model.
         """
-        if api_key:
-            openai.api_key = api_key
-        self.client = client
+        self.gateway = gateway or get_gateway(api_key)
         self.model = model
         self.response_format = MealSuggestion
+        self.cache = cache
 
     def load_nutrition_analysis(self, json_str: str) -> NutritionAnalysis:
         """
@@ -62,8 +74,9 @@ class MealSuggester:
         """
         Calculate user BMI and recommended daily calories.
         """
-        bmi = calculate_bmi(weight, height)
-        daily_calories = suggest_calories(weight, goal)
+        analyzer = NutritionAnalyzer()
+        bmi = analyzer.calculate_bmi(weight, height)
+        daily_calories = analyzer.suggest_calories(weight, goal)
         return bmi, daily_calories
 
     def generate_suggestion(
@@ -72,52 +85,98 @@ class MealSuggester:
         current_meal: str,
         height: float,
         weight: float,
-        goal: str
+        goal: str,
+        creative: bool = False
     ) -> MealSuggestion:
         """
-        Generate a meal suggestion for the next meal using OpenAI API.
+        Generate a meal suggestion for the next meal. The local rule engine
+        answers unless its confidence is low or ``creative`` is requested;
+        only then is the OpenAI API called (through the suggestion cache).
         """
         bmi, daily_calories = self.get_user_profile(height, weight, goal)
+        totals = meal_totals(analysis)
+
+        with stage("suggest_rules"):
+            rules = evaluate_meal(totals, daily_calories, goal, current_meal)
+        if not creative:
+            if rules.confidence >= RULE_CONFIDENCE_THRESHOLD:
+                logging.info("Suggestion from local rules (confidence %.2f)", rules.confidence)
+                return MealSuggestion.model_validate(rules.as_suggestion())
+            logging.info("Low rule confidence %.2f (%s); asking the model", rules.confidence, "; ".join(rules.notes))
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = suggestion_fingerprint(self.model, goal, bmi, daily_calories, current_meal, totals)
+            with stage("suggest_cache_lookup"):
+                cached = self.cache.get(cache_key)
+            if cached:
+                logging.info("Suggestion cache hit")
+                return MealSuggestion.model_validate(cached)
 
-        system_prompt = (
-            "You are a nutrition assistant. Based on the user's height, weight, nutrition goal, "
-            "current meal and nutrition analysis, evaluate if the current meal's "
-            "macronutrients (protein, carbs, fat) and calories are balanced, "
-            "and suggest a menu and portions for the next meal (lunch or dinner)."
-        )
+        logging.info("Sending request to OpenAI API for structured response...")
+        try:
+            with stage("suggest_call"):
+                response = self.gateway.parse(
+                    model=self.model,
+                    messages=self.build_messages(analysis, current_meal, height, weight, goal, bmi, daily_calories, totals),
+                    response_format=self.response_format,
+                    max_completion_tokens=MAX_COMPLETION_TOKENS
+                )
+        except (CircuitOpenError, OpenAIError, TimeoutError):
+            if not rules.suggested_menu:
+                raise
+            # Provider unavailable: a rule-based answer beats no answer.
+            logging.warning("Suggestion model unavailable; serving the rule-based suggestion", exc_info=True)
+            return MealSuggestion.model_validate(rules.as_suggestion())
+        logging.info("Received structured response from OpenAI API")
+        suggestion = response.choices[0].message.parsed
+
+        if cache_key is not None and suggestion is not None:
+            self.cache.set(cache_key, suggestion.model_dump())
+        return suggestion
 
+    def build_messages(
+        self,
+        analysis: NutritionAnalysis,
+        current_meal: str,
+        height: float,
+        weight: float,
+        goal: str,
+        bmi: float,
+        daily_calories: float,
+        totals: dict,
+    ) -> list:
+        """
+        Chat messages: the static SYSTEM_PROMPT followed by the per-request user prompt.
+        """
         food_list = "\n".join([
             f"- {item.name}, portion size: {item.portion_size}, calories: {item.calories}, "
             f"protein: {item.macronutrients.protein}, carbs: {item.macronutrients.carbs}, "
             f"fat: {item.macronutrients.fat}"
             for item in analysis.food_items
         ])
+        carb_ratio, protein_ratio, fat_ratio = macro_ratios(
+            [totals["calories"], totals["carbs"], totals["protein"], totals["fat"]]
+        )[0]
 
         user_prompt = (
             f"User profile: height {height} cm, weight {weight} kg, goal {goal}, "
             f"BMI {bmi:.2f}, recommended daily calories {daily_calories:.0f} kcal.\n"
             f"Current meal: {current_meal}\n"
             f"Current meal analysis:\n{food_list}\n"
+            f"Meal totals: {totals['calories']:.0f} kcal, carbs {totals['carbs']:.0f} g, "
+            f"protein {totals['protein']:.0f} g, fat {totals['fat']:.0f} g "
+            f"(energy split carbs {carb_ratio:.0%} / protein {protein_ratio:.0%} / fat {fat_ratio:.0%}).\n"
             "Please provide a nutrition evaluation and suggestion for the next meal."
         )
-        user_prompt += "\nPlease format your response as JSON matching the following schema:\n" + json.dumps(RESPONSE_FORMAT, indent=2)
-
-        logging.info("Sending request to OpenAI API for structured response...")
-        response = self.client.beta.chat.completions.parse(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            response_format=self.response_format,
-            max_completion_tokens=500
-        )
-        logging.info("Received structured response from OpenAI API")
-        return response
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ]
 
 if __name__ == "__main__":
     # Demo usage without CLI or Gradio
-    suggester = MealSuggester()
+    suggester = MealSuggester(cache=SuggestionCache(db_path=os.getenv("SNAPBITE_DB_PATH", "data/snapbite.db")))
 
     # 1. Load NutritionAnalysis JSON from a file
     try:
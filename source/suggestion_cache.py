@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from .cache import LRUCache, SQLiteCache, TieredCache
+
+SUGGESTION_CACHE_SIZE = int(os.getenv("SNAPBITE_SUGGESTION_CACHE_SIZE", "1024"))
+SUGGESTION_CACHE_TTL = float(os.getenv("SNAPBITE_SUGGESTION_CACHE_TTL", str(3 * 24 * 3600)))
+
+# Bucket widths used to quantize the fingerprint inputs.
+BMI_BUCKET = 1.0
+DAILY_CALORIE_BUCKET = 100.0
+MEAL_CALORIE_BUCKET = 50.0
+MACRO_GRAM_BUCKET = 5.0
+
+# Bump when the suggestion prompt or output schema changes so old entries stop matching.
+SUGGESTION_CACHE_VERSION = 1
+
+
+def _bucket(value: float, width: float) -> int:
+    return int(round(float(value) / width))
+
+
+def suggestion_fingerprint(
+    model: str,
+    goal: str,
+    bmi: float,
+    daily_calories: float,
+    current_meal: str,
+    totals: Dict[str, float],
+) -> str:
+    """
+    Hash of the quantized profile, meal and macro vector. Inputs that fall
+    into the same buckets share one cached suggestion.
+    """
+    payload = json.dumps(
+        {
+            "v": SUGGESTION_CACHE_VERSION,
+            "model": model,
+            "goal": goal.strip(),
+            "bmi": _bucket(bmi, BMI_BUCKET),
+            "daily": _bucket(daily_calories, DAILY_CALORIE_BUCKET),
+            "meal": current_meal.strip().lower(),
+            "kcal": _bucket(totals.get("calories", 0.0), MEAL_CALORIE_BUCKET),
+            "macros": [_bucket(totals.get(k, 0.0), MACRO_GRAM_BUCKET) for k in ("carbs", "protein", "fat")],
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class SuggestionCache:
+    """
+    Two-tier (LRU + SQLite) cache of MealSuggestion dicts keyed by suggestion_fingerprint.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Union[str, Path]] = None,
+        max_entries: int = SUGGESTION_CACHE_SIZE,
+        ttl: Optional[float] = SUGGESTION_CACHE_TTL,
+        table: str = "suggestion_cache",
+    ):
+        persistent = SQLiteCache(db_path, table, ttl=ttl) if db_path else None
+        self._cache = TieredCache(LRUCache(max_entries=max_entries, ttl=ttl), persistent)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._cache.get(key)
+        except Exception:
+            logging.exception("Suggestion cache lookup failed")
+            return None
+
+    def set(self, key: str, suggestion: Dict[str, Any]) -> None:
+        if not suggestion:
+            return
+        try:
+            self._cache.set(key, suggestion)
+        except Exception:
+            logging.exception("Suggestion cache store failed")
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.snapshot()
@@ -1,13 +1,21 @@
-import json
-import matplotlib.pyplot as plt
+from source.chart_render import get_renderer
+from source.daily_log import iter_daily_log
+from source.nutrient_table import table_from_daily_logs, totals_by_day
 
 class Visualizer:
     """
     Encapsulates methods for loading nutrition logs and generating visualizations.
     """
-    def load_daily_log(self, filename="data/daily_log.json"):
+    def iter_daily_log(self, filename="data/daily_log.json", start=None, end=None):
         """
-        Load the daily nutrition log from JSON.
+        Stream day records from the JSON log, optionally limited to
+        start <= date <= end (YYYY-MM-DD), without loading the whole file.
+        """
+        return iter_daily_log(filename, start=start, end=end)
+
+    def load_daily_log(self, filename="data/daily_log.json", start=None, end=None):
+        """
+        Load the daily nutrition log from JSON, optionally limited to a date range.
         Expected format: 
         [
           {
@@ -24,17 +32,31 @@ class Visualizer:
           ...
         ]
         """
-        with open(filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # Ensure we return a list of logs
-        return data if isinstance(data, list) else [data]
+        return list(iter_daily_log(filename, start=start, end=end))
+
+    def daily_calorie_totals(self, daily_logs):
+        """
+        Dates (YYYY-MM-DD strings) and summed calories per day, oldest first.
+        """
+        table, _ = table_from_daily_logs(daily_logs)
+        days, totals = totals_by_day(table)
+        return [str(d) for d in days], totals[:, 0] if len(days) else totals
+
+    def macro_totals(self, meals):
+        """
+        Total protein, carbs and fat in grams across ``meals``.
+        """
+        table, _ = table_from_daily_logs([{"date": "1970-01-01", "meals": meals}])
+        _, carbs, protein, fat = table.values().sum(axis=0)
+        return [float(protein), float(carbs), float(fat)]
 
     def visualize_daily_total_calories(self, daily_logs):
         """
         Line chart of total daily calories across multiple days.
         """
-        dates = [d["date"] for d in daily_logs]
-        totals = [sum(m["calories"] for m in d["meals"]) for d in daily_logs]
+        dates, totals = self.daily_calorie_totals(daily_logs)
+
+        import matplotlib.pyplot as plt
 
         plt.figure()
         plt.plot(dates, totals, marker="o")
@@ -48,8 +70,10 @@ class Visualizer:
         """
         Bar chart of calories per meal.
         """
-        meal_types = [m["meal_type"] for m in meals]
-        calories = [m["calories"] for m in meals]
+        table, meal_types = table_from_daily_logs([{"date": "1970-01-01", "meals": meals}])
+        calories = table.values()[:, 0]
+
+        import matplotlib.pyplot as plt
 
         plt.figure()
         plt.bar(meal_types, calories)
@@ -63,12 +87,10 @@ class Visualizer:
         """
         Pie chart of total macronutrient distribution.
         """
-        total_protein = sum(m["macros"]["protein"] for m in meals)
-        total_carbs = sum(m["macros"]["carbs"] for m in meals)
-        total_fat = sum(m["macros"]["fat"] for m in meals)
-
         labels = ["Protein", "Carbs", "Fat"]
-        sizes = [total_protein, total_carbs, total_fat]
+        sizes = self.macro_totals(meals)
+
+        import matplotlib.pyplot as plt
 
         plt.figure()
         plt.pie(sizes, labels=labels, autopct="%1.1f%%")
@@ -76,6 +98,31 @@ class Visualizer:
         plt.tight_layout()
         plt.show()
 
+    def render_daily_total_calories(self, daily_logs, fmt="png"):
+        """
+        Headless version of visualize_daily_total_calories; returns image bytes.
+        """
+        dates, totals = self.daily_calorie_totals(daily_logs)
+        _, blob = get_renderer().render_cached("trend", {"dates": dates, "totals": [float(t) for t in totals]}, fmt=fmt)
+        return blob
+
+    def render_calories(self, meals, fmt="png"):
+        """
+        Headless version of visualize_calories; returns image bytes.
+        """
+        table, meal_types = table_from_daily_logs([{"date": "1970-01-01", "meals": meals}])
+        data = {"labels": meal_types, "calories": [float(c) for c in table.values()[:, 0]]}
+        _, blob = get_renderer().render_cached("calories", data, fmt=fmt)
+        return blob
+
+    def render_macros(self, meals, fmt="png"):
+        """
+        Headless version of visualize_macros; returns image bytes.
+        """
+        protein, carbs, fat = self.macro_totals(meals)
+        _, blob = get_renderer().render_cached("macros", {"protein": protein, "carbs": carbs, "fat": fat}, fmt=fmt)
+        return blob
+
 if __name__ == "__main__":
     # Example usage
     viz = Visualizer()
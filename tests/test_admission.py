@@ -0,0 +1,68 @@
+from linebot_app.admission import PRIORITY_HIGH, PRIORITY_LOW, AdmissionController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _controller(clock, **kwargs):
+    defaults = dict(user_rate_per_min=60, user_burst=2, global_rate_per_min=600, global_burst=100, notice_interval=30)
+    defaults.update(kwargs)
+    return AdmissionController(clock=clock, **defaults)
+
+
+def test_user_bucket_limits_bursts_and_refills():
+    clock = FakeClock()
+    admission = _controller(clock)
+
+    assert admission.admit("u1").admitted
+    assert admission.admit("u1").admitted
+    limited = admission.admit("u1")
+    assert (limited.admitted, limited.reason, limited.notify) == (False, "user_limited", True)
+    assert limited.retry_after == 1.0
+    assert admission.admit("u1").notify is False  # one notice per interval
+    assert admission.admit("u2").admitted  # other users are unaffected
+
+    clock.now = 1.0
+    assert admission.admit("u1").admitted
+
+
+def test_global_bucket_refunds_user_tokens():
+    clock = FakeClock()
+    admission = _controller(clock, user_rate_per_min=0.001, global_rate_per_min=60, global_burst=1)
+
+    assert admission.admit("u1").admitted
+    assert admission.admit("u2").reason == "global_limited"
+    clock.now = 1.0
+    assert admission.admit("u2").admitted
+    clock.now = 2.0
+    assert admission.admit("u2").admitted  # both of u2's burst tokens survived the global rejection
+    clock.now = 3.0
+    assert admission.admit("u2").reason == "user_limited"
+
+
+def test_low_priority_is_shed_under_load_before_images():
+    admission = _controller(FakeClock(), shed_low_at=0.5)
+
+    assert admission.admit("u1", PRIORITY_LOW, cost=0, load=0.2).admitted
+    assert admission.admit("u1", PRIORITY_LOW, cost=0, load=0.6).reason == "shed"
+    assert admission.admit("u1", PRIORITY_HIGH, load=0.9).admitted
+
+
+def test_user_state_is_bounded_and_idle_entries_expire():
+    clock = FakeClock()
+    admission = _controller(clock, max_users=3, idle_ttl=60)
+
+    for i in range(10):
+        admission.admit(f"u{i}")
+    assert len(admission) == 3
+
+    clock.now = 120.0
+    admission.admit("fresh")
+    admission.admit("fresh")
+    assert len(admission) == 1
+    assert admission.stats()["tracked_users"] == 1
@@ -0,0 +1,131 @@
+import sqlite3
+from io import BytesIO
+
+from PIL import Image
+
+from source.analysis_cache import AnalysisCache, config_fingerprint, hamming_distance, perceptual_hash
+from source.cache import LRUCache, SQLiteCache
+
+SAMPLE = {"food_items": [{"name": "滷肉飯"}]}
+
+
+def _jpeg(image: Image.Image, quality: int) -> bytes:
+    buf = BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def _meal_image() -> Image.Image:
+    image = Image.new("RGB", (320, 240), "white")
+    for i, color in enumerate(["#c0392b", "#f1c40f", "#27ae60", "#8e44ad"]):
+        image.paste(color, (i * 70 + 10, 40 + i * 30, i * 70 + 70, 120 + i * 30))
+    return image
+
+
+def test_lru_cache_evicts_oldest_and_expires(monkeypatch):
+    cache = LRUCache(max_entries=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+    import source.cache as cache_module
+
+    now = cache_module.time.monotonic()
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+
+
+def test_analysis_cache_hits_persistent_tier_after_restart(tmp_path):
+    db_path = tmp_path / "cache.db"
+    data = _jpeg(_meal_image(), 90)
+    config = config_fingerprint("gpt-4o-mini", {"name": "coin"}, "zh-TW")
+
+    first = AnalysisCache(db_path=db_path)
+    first.set(first.keys_for(data, config), SAMPLE)
+
+    second = AnalysisCache(db_path=db_path)
+    assert second.get(second.keys_for(data, config)) == SAMPLE
+    assert second.stats()["persistent_hits"] == 1
+
+
+def test_analysis_cache_matches_reencoded_copy_but_not_other_config():
+    image = _meal_image()
+    original = _jpeg(image, 95)
+    forwarded = _jpeg(image.resize((160, 120)), 60)
+    assert original != forwarded
+    assert hamming_distance(perceptual_hash(original), perceptual_hash(forwarded)) <= 3
+
+    cache = AnalysisCache()
+    config = config_fingerprint("gpt-4o-mini", {"name": "coin"}, "zh-TW")
+    cache.set(cache.keys_for(original, config, scope="u1"), SAMPLE)
+
+    assert cache.get(cache.keys_for(forwarded, config, scope="u1")) == SAMPLE
+    other = config_fingerprint("gpt-4o-mini", {"name": "coin"}, "en")
+    assert cache.get(cache.keys_for(original, other, scope="u1")) is None
+
+    stats = cache.stats()
+    assert stats["alias_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_analysis_cache_near_duplicates_stay_within_one_sender():
+    image = _meal_image()
+    original = _jpeg(image, 95)
+    forwarded = _jpeg(image.resize((160, 120)), 60)
+    cache = AnalysisCache()
+    config = config_fingerprint("gpt-4o-mini", {"name": "coin"}, "zh-TW")
+    cache.set(cache.keys_for(original, config, scope="u1"), SAMPLE)
+
+    # Someone else's similar-looking plate, or an unscoped lookup, must not
+    # reuse u1's meal; an exact copy of the bytes still may.
+    assert cache.get(cache.keys_for(forwarded, config, scope="u2")) is None
+    assert cache.get(cache.keys_for(forwarded, config)) is None
+    assert cache.get(cache.keys_for(original, config, scope="u2")) == SAMPLE
+
+
+def test_perceptual_hash_of_decoded_image_matches_bytes():
+    from source.image_preprocess import decode_image
+
+    data = _jpeg(_meal_image(), 95)
+    assert hamming_distance(perceptual_hash(decode_image(data)), perceptual_hash(data)) <= 3
+
+
+def test_analysis_cache_rejects_different_photo():
+    cache = AnalysisCache()
+    config = config_fingerprint("gpt-4o-mini", {"name": "coin"}, "zh-TW")
+    cache.set(cache.keys_for(_jpeg(_meal_image(), 90), config, scope="u1"), SAMPLE)
+
+    other = Image.new("RGB", (320, 240), "black")
+    other.paste("#ffffff", (0, 0, 160, 240))
+    assert cache.get(cache.keys_for(_jpeg(other, 90), config, scope="u1")) is None
+
+
+def test_sqlite_cache_purges_expired_entries_and_aliases(tmp_path, monkeypatch):
+    import source.cache as cache_module
+
+    db_path = tmp_path / "cache.db"
+    cache = SQLiteCache(db_path, "analysis_cache", ttl=10)
+    cache.set("old", {"v": 1}, aliases=("band-a", "band-b"))
+    cache.close()
+
+    def rows(table):
+        with sqlite3.connect(db_path) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    now = cache_module.time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: now + 11)
+    reopened = SQLiteCache(db_path, "analysis_cache", ttl=10, purge_interval=0)
+    reopened.set("new", {"v": 2}, aliases=("band-a",))  # opening sweeps "old"
+    assert (rows("analysis_cache"), rows("analysis_cache_alias")) == (1, 1)
+
+    # Later writes sweep again once purge_interval has passed.
+    monkeypatch.setattr(cache_module.time, "time", lambda: now + 22)
+    reopened.set("newer", {"v": 3})
+    assert rows("analysis_cache") == 1
+    assert rows("analysis_cache_alias") == 0
+    reopened.close()
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+
+import httpx
+from linebot import WebhookParser
+from linebot.models import ImageMessage, MessageEvent
+
+from benchmarks.fakes import FakeLineAPI, FakeOpenAI, LatencyModel, make_image_pool
+from benchmarks.loadgen import image_event, run_load, sign, webhook_body
+from benchmarks.run import compare
+
+
+def test_signed_batch_parses_as_image_events():
+    body = webhook_body([image_event("Uabc", "m1", "rt1")]).decode("utf-8")
+    events = WebhookParser("secret").parse(body, sign("secret", body.encode("utf-8")))
+    assert len(events) == 1
+    assert isinstance(events[0], MessageEvent)
+    assert isinstance(events[0].message, ImageMessage)
+    assert events[0].reply_token == "rt1"
+
+
+def test_fakes_serve_images_completions_and_record_replies():
+    line = FakeLineAPI(make_image_pool(2, size=(64, 48))).start()
+    openai = FakeOpenAI().start()
+    try:
+        content = httpx.get(f"{line.url}/v2/bot/message/m1/content")
+        assert content.headers["content-type"] == "image/jpeg"
+        assert content.content[:2] == b"\xff\xd8"
+
+        httpx.post(f"{line.url}/v2/bot/message/reply", json={"replyToken": "rt1", "messages": []})
+        assert "rt1" in line.delivered
+
+        completion = httpx.post(f"{openai.url}/v1/chat/completions", json={"model": "m", "messages": []}).json()
+        assert json.loads(completion["choices"][0]["message"]["content"])["food_items"]
+        assert completion["usage"]["total_tokens"] > 0
+    finally:
+        line.close()
+        openai.close()
+
+
+def test_latency_model_injects_errors_reproducibly():
+    draws = [LatencyModel(median_ms=10, error_rate=0.5, seed=3).draw() for _ in range(2)]
+    assert draws[0] == draws[1]
+    statuses = {LatencyModel(error_rate=1.0).draw()[1], LatencyModel(error_rate=0.0).draw()[1]}
+    assert statuses == {500, None}
+
+
+def test_load_generator_paces_batches():
+    line = FakeLineAPI(make_image_pool(1, size=(32, 32))).start()
+    try:
+        started = time.perf_counter()
+        result = asyncio.run(run_load(f"{line.url}/v2/bot/message/reply", "s", rate=40, duration=0.25, batch_size=2))
+        assert time.perf_counter() - started >= 0.2
+        assert result.sent_events == 10
+        assert len(result.sent_at) == 10
+    finally:
+        line.close()
+
+
+def test_compare_flags_regressions_only_past_tolerance():
+    baseline = {"events_per_sec": 10.0, "e2e_p95_ms": 1000.0, "peak_rss_mb": 200.0}
+    assert compare({"events_per_sec": 9.0, "e2e_p95_ms": 1200.0, "peak_rss_mb": 240.0}, baseline, 0.25) == []
+    regressions = compare({"events_per_sec": 7.0, "e2e_p95_ms": 1300.0, "peak_rss_mb": 200.0}, baseline, 0.25)
+    assert [r.split(":")[0] for r in regressions] == ["events_per_sec", "e2e_p95_ms"]
+    assert compare({"e2e_p95_ms": 1300.0}, baseline, 0.25, slack_ms=100) == []
@@ -0,0 +1,123 @@
+import os
+from io import BytesIO
+from types import SimpleNamespace
+
+from openai import LengthFinishReasonError
+from PIL import Image
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from linebot_app.budget import LEVELS, BudgetPolicy  # noqa: E402
+from source.image_analysis import FULL_BUDGET, Analyst, NutritionAnalysis  # noqa: E402
+from source.metrics import Histogram  # noqa: E402
+
+PARSED = NutritionAnalysis.model_validate({"food_items": []})
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _policy(load, **kwargs):
+    clock = _Clock()
+    histogram = Histogram("test_stage_seconds", "test", labelnames=("stage",))
+    policy = BudgetPolicy(lambda: load[0], slo=10.0, window=30.0, hold=15.0, histogram=histogram, clock=clock, **kwargs)
+    return policy, clock, histogram
+
+
+def test_queue_depth_degrades_and_recovers_with_hysteresis():
+    load = [0.0]
+    policy, clock, _ = _policy(load)
+    assert policy.for_user("u1") is FULL_BUDGET
+
+    load[0] = 0.9
+    clock.now = 1.0
+    assert policy.for_user("u1") == LEVELS[2][1]
+    assert policy.for_user("u1").detail == "low"
+
+    # Load eases below the entry threshold but not the recovery one: hold.
+    load[0] = 0.6
+    clock.now = 30.0
+    assert policy.update() == 2
+
+    load[0] = 0.1
+    clock.now = 31.0
+    assert policy.update() == 1  # one step at a time...
+    clock.now = 40.0
+    assert policy.update() == 1  # ...and only after the hold period
+    clock.now = 47.0
+    assert policy.update() == 0
+
+
+def test_recent_p95_over_slo_degrades():
+    policy, clock, histogram = _policy([0.0])
+    for _ in range(100):
+        histogram.observe(1.0, "image_event")
+    clock.now = 1.0
+    assert policy.update() == 0
+
+    for _ in range(100):
+        histogram.observe(20.0, "image_event")
+    clock.now = 2.0
+    assert policy.update() == 2  # p95 30s is past 1.5x the 10s SLO
+    assert policy.stats()["level"] == "minimal"
+
+    # Once the slow calls age out of the window, fast ones bring it back.
+    for step in range(1, 5):
+        histogram.observe(1.0, "image_event")
+        clock.now = 2.0 + 31.0 * step
+        policy.update()
+    assert policy.level == 0
+
+
+def test_premium_users_keep_a_better_budget():
+    policy, clock, _ = _policy([0.6], premium_users={"vip"})
+
+    assert policy.for_user("someone") == LEVELS[1][1]
+    assert policy.for_user("vip") is FULL_BUDGET
+
+
+def test_reduced_budget_shapes_the_request_and_skips_the_cache(monkeypatch):
+    calls = []
+
+    def fake_call(self, base64_image, mime_type="image/jpeg", detail=None, concise=False, max_completion_tokens=600):
+        calls.append((detail, concise, max_completion_tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=PARSED))])
+
+    monkeypatch.setattr(Analyst, "call_openai_vision_api", fake_call)
+    stored = []
+    cache = SimpleNamespace(keys_for=lambda data, key, scope="", image=None: key, get=lambda keys: None, set=lambda keys, value: stored.append(value))
+    analyst = Analyst(api_key="test-key", cache=cache)
+    buf = BytesIO()
+    Image.new("RGB", (1600, 1200), "#f39c12").save(buf, format="JPEG")
+
+    analyst.analyze_bytes(buf.getvalue(), budget=LEVELS[2][1])
+    assert calls == [("low", True, 250)]
+    assert stored == []
+
+    analyst.analyze_bytes(buf.getvalue())
+    assert calls[-1] == ("high", False, 600)
+    assert len(stored) == 1
+
+
+def test_truncated_minimal_answer_is_retried_once_at_reduced(monkeypatch):
+    calls = []
+
+    def fake_call(self, base64_image, mime_type="image/jpeg", detail=None, concise=False, max_completion_tokens=600):
+        calls.append((detail, concise, max_completion_tokens))
+        if max_completion_tokens < 1000:
+            raise LengthFinishReasonError(completion=SimpleNamespace(usage=None))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=PARSED))])
+
+    monkeypatch.setattr(Analyst, "call_openai_vision_api", fake_call)
+    analyst = Analyst(api_key="test-key")
+    buf = BytesIO()
+    Image.new("RGB", (1600, 1200), "#f39c12").save(buf, format="JPEG")
+
+    # Cut off at "minimal", then again at "reduced": one retry, then no result.
+    assert analyst.analyze_bytes(buf.getvalue(), budget=LEVELS[2][1]) == {}
+    assert calls == [("low", True, 250), ("low", True, 400)]
@@ -0,0 +1,56 @@
+import matplotlib.pyplot as plt
+
+import linebot_app.storage as storage
+from linebot_app.report import build_daily_report
+from source.chart_render import ChartRenderer
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+
+def test_render_cached_reuses_bytes_until_data_changes():
+    renderer = ChartRenderer()
+    data = {"dates": ["2024-05-01", "2024-05-02"], "totals": [1800.0, 2100.0]}
+
+    digest, blob = renderer.render_cached("trend", data, user_id="u1", date_range=("2024-05-01", "2024-05-02"))
+    again, cached = renderer.render_cached("trend", dict(data), user_id="u1", date_range=("2024-05-01", "2024-05-02"))
+    changed, _ = renderer.render_cached(
+        "trend", {"dates": data["dates"], "totals": [1800.0, 2200.0]}, user_id="u1", date_range=("2024-05-01", "2024-05-02")
+    )
+
+    assert blob.startswith(PNG_MAGIC)
+    assert again == digest and cached is blob
+    assert changed != digest
+    assert renderer.get_blob(digest) == blob
+    assert renderer.stats.snapshot() == {"misses": 2, "hits": 1}
+    assert plt.get_fignums() == []
+
+
+def test_render_webp_and_empty_macros():
+    blob = ChartRenderer().render_macros(0, 0, 0, fmt="webp")
+    assert blob[:4] == b"RIFF" and blob[8:12] == b"WEBP"
+
+
+def test_build_daily_report_reads_rollups(tmp_path, monkeypatch):
+    db_path = tmp_path / "report.db"
+    monkeypatch.setattr(storage, "DB_PATH", db_path)
+    engine = storage.StorageEngine(db_path, flush_interval=0.01).start()
+    meal = {
+        "food_items": [
+            {
+                "name": "鮭魚飯",
+                "portion_size": "1碗",
+                "calories": "520 kcal",
+                "macronutrients": {"carbs": "60g", "protein": "28g", "fat": "16g"},
+            }
+        ]
+    }
+    engine.save_analysis(user_id="u1", message_id="m1", analysis=meal)
+    engine.close()
+
+    day = storage.local_day(storage._utc_timestamp())
+    report = build_daily_report("u1", day=day, renderer=ChartRenderer())
+
+    assert report.meal_count == 1
+    assert report.calories == 520.0
+    assert set(report.charts) == {"calories", "macros", "trend"}
+    assert "520 kcal" in report.summary_text()
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sqlite3
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import linebot_app.handler as handler  # noqa: E402
+import linebot_app.storage as storage  # noqa: E402
+from linebot_app.coalesce import Coalescer, ImageBatch, group_key  # noqa: E402
+from source.image_analysis import Analyst, NutritionAnalysis, merge_analyses  # noqa: E402
+
+RICE = {"name": "白飯", "portion_size": "1碗", "calories": "280 kcal", "macronutrients": {"carbs": "62g", "protein": "5g", "fat": "0g"}}
+SOUP = {"name": "味噌湯", "portion_size": "1碗", "calories": "60 kcal", "macronutrients": {"carbs": "5g", "protein": "4g", "fat": "2g"}}
+
+
+def _event(message_id, user="u1", image_set=None, group=None):
+    return SimpleNamespace(
+        message=SimpleNamespace(id=message_id, image_set=image_set),
+        source=SimpleNamespace(user_id=user, group_id=group),
+        reply_token=f"rt-{message_id}",
+        timestamp=None,
+    )
+
+
+def _collect(window, max_images=4, steps=()):
+    flushed = []
+
+    async def run():
+        coalescer = Coalescer(lambda events: flushed.append([e.message.id for e in events]), window, max_images)
+        for step in steps:
+            if isinstance(step, float):
+                await asyncio.sleep(step)
+            else:
+                coalescer.add(step)
+        await asyncio.sleep(min(window * 3, 0.3))
+        return len(coalescer)
+
+    assert asyncio.run(run()) == 0
+    return flushed
+
+
+def test_photos_within_the_window_are_grouped_per_chat():
+    flushed = _collect(0.05, steps=[_event("a"), _event("b"), _event("x", user="u2"), 0.15, _event("c")])
+    assert sorted(flushed) == [["a", "b"], ["c"], ["x"]]
+
+
+def test_group_chat_photos_are_grouped_per_sender():
+    steps = [_event("a", group="g1"), _event("x", user="u2", group="g1"), _event("b", group="g1")]
+    flushed = _collect(0.05, steps=steps)
+    assert sorted(flushed) == [["a", "b"], ["x"]]
+    assert group_key(_event("a", group="g1")) == "g1/u1"
+
+
+def test_full_groups_and_complete_image_sets_flush_immediately():
+    image_set = SimpleNamespace(id="set1", total=2)
+    flushed = _collect(10.0, max_images=3, steps=[_event("a"), _event("b"), _event("c")])
+    assert flushed == [["a", "b", "c"]]
+    flushed = _collect(10.0, steps=[_event("s1", image_set=image_set), _event("s2", image_set=image_set)])
+    assert flushed == [["s1", "s2"]]
+    assert group_key(_event("s1", image_set=image_set)) == "u1/set1"
+
+
+def test_zero_window_disables_coalescing():
+    assert _collect(0.0, steps=[_event("a"), _event("b")]) == [["a"], ["b"]]
+
+
+def test_merge_analyses_drops_repeated_foods():
+    merged = merge_analyses([{"food_items": [RICE]}, {"food_items": [dict(RICE, portion_size="半碗"), SOUP]}, None])
+    assert merged == {"food_items": [RICE, SOUP]}
+
+
+def test_analyze_images_sends_one_request_with_every_photo():
+    calls = []
+
+    def vision(base64_image, mime_type="image/jpeg", detail=None, more_images=()):
+        calls.append(1 + len(more_images))
+        parsed = NutritionAnalysis.model_validate({"food_items": [RICE, SOUP, RICE]})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed))])
+
+    analyst = Analyst(api_key="test-key")
+    analyst.call_openai_vision_api = vision
+    assert analyst.analyze_images([b"one", b"two", b"three"]) == {"food_items": [RICE, SOUP]}
+    assert calls == [3]
+
+    messages = analyst._build_messages("b64", more_images=[("b64-2", "image/webp", "low")])
+    parts = messages[1]["content"]
+    assert [p["type"] for p in parts] == ["text", "image_url", "image_url"]
+    assert parts[2]["image_url"] == {"url": "data:image/webp;base64,b64-2", "detail": "low"}
+    assert parts[0]["text"].startswith("The 2 photos show one meal.")
+
+
+def test_batch_gets_one_analysis_one_meal_and_receipts_for_every_photo(tmp_path, monkeypatch):
+    db_path = tmp_path / "batch.db"
+    monkeypatch.setattr(storage, "DB_PATH", db_path)
+    engine = storage.StorageEngine(db_path, flush_interval=0.01).start()
+    monkeypatch.setattr(storage, "_engine", engine)
+    calls = []
+
+    def analyze(images, budget=None, scope=""):
+        calls.append([bytes(image) for image in images])
+        return {"food_items": [RICE, SOUP]}
+
+    monkeypatch.setattr(handler, "download_message_content", lambda api, message_id: memoryview(message_id.encode()))
+    monkeypatch.setattr(handler.analyst, "analyze_images", analyze)
+    batch = ImageBatch([_event("p1"), _event("p2"), _event("p3")])
+
+    replies = handler.handle_image_batch(batch, line_bot_api=None)
+    engine.flush()
+    again = handler.handle_image_batch(ImageBatch([_event("p2"), _event("p3")]), line_bot_api=None)
+    engine.close()
+
+    assert calls == [[b"p1", b"p2", b"p3"]]
+    assert len(replies) == 1 and "味噌湯" in replies[0].text
+    assert again[0].text == replies[0].text
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM meal_analysis").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(DISTINCT meal_id) FROM processed_message").fetchone()[0] == 1
+        assert conn.execute("SELECT meal_count FROM daily_totals").fetchone()[0] == 1
@@ -0,0 +1,61 @@
+import json
+from datetime import date, timedelta
+
+import numpy as np
+
+from source.daily_log import (
+    MEAL_RECORD,
+    convert_json_to_binary,
+    daily_calorie_totals,
+    iter_daily_log,
+    open_meal_log,
+    slice_days,
+)
+
+
+def _write_log(path, days=40):
+    start = date(2024, 1, 1)
+    logs = [
+        {
+            "date": (start + timedelta(days=i)).isoformat(),
+            "meals": [
+                {"meal_type": "breakfast", "calories": 400 + i, "macros": {"protein": 20, "carbs": 50, "fat": 10}},
+                {"meal_type": "宵夜", "calories": "200 kcal", "macros": {"protein": "5g", "carbs": "30g", "fat": "6g"}},
+            ],
+        }
+        for i in range(days)
+    ]
+    path.write_text(json.dumps(logs, ensure_ascii=False, indent=2), encoding="utf-8")
+    return logs
+
+
+def test_iter_daily_log_streams_with_small_buffer_and_range(tmp_path):
+    path = tmp_path / "daily_log.json"
+    logs = _write_log(path)
+
+    assert list(iter_daily_log(path, read_size=17)) == logs
+    window = list(iter_daily_log(path, start="2024-01-10", end="2024-01-12", read_size=17))
+    assert [d["date"] for d in window] == ["2024-01-10", "2024-01-11", "2024-01-12"]
+
+
+def test_iter_daily_log_accepts_single_object(tmp_path):
+    path = tmp_path / "single.json"
+    path.write_text(json.dumps({"date": "2024-02-01", "meals": []}), encoding="utf-8")
+    assert list(iter_daily_log(path)) == [{"date": "2024-02-01", "meals": []}]
+
+
+def test_binary_log_roundtrip_and_range_totals(tmp_path):
+    source = tmp_path / "daily_log.json"
+    target = tmp_path / "meals.bin"
+    _write_log(source)
+
+    assert convert_json_to_binary(source, target, batch_size=7) == 80
+    records = open_meal_log(target)
+
+    assert isinstance(records, np.memmap)
+    assert records.dtype == MEAL_RECORD
+    assert records["meal_type"][0] == 0 and records["meal_type"][1] == 255
+
+    days, totals = daily_calorie_totals(slice_days(records, "2024-01-31", "2024-02-02"))
+    assert [str(d) for d in days] == ["2024-01-31", "2024-02-01", "2024-02-02"]
+    np.testing.assert_allclose(totals, [630, 631, 632])
@@ -0,0 +1,155 @@
+import os
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from source.food_crop import NoFoodError, OnnxCropper, SaliencyCropper, decode_yolo, get_cropper  # noqa: E402
+from source.image_analysis import Analyst  # noqa: E402
+from source.image_preprocess import preprocess_image  # noqa: E402
+
+
+def _meal_photo(cx: int = 500, cy: int = 400, radius: int = 250, size=(1600, 1200)) -> Image.Image:
+    """Plate with food on a textured table, off-centre."""
+    rng = np.random.default_rng(0)
+    table = np.full((size[1], size[0], 3), (150, 120, 90), np.float32) + rng.normal(0, 6, (size[1], size[0], 3))
+    image = Image.fromarray(np.clip(table, 0, 255).astype(np.uint8))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((cx - radius, cy - radius, cx + radius, cy + radius), fill=(245, 245, 240))
+    draw.ellipse((cx - radius * 0.6, cy - radius * 0.6, cx + radius * 0.6, cy + radius * 0.6), fill=(200, 60, 30))
+    draw.rectangle((cx + radius * 0.1, cy - radius * 0.3, cx + radius * 0.4, cy + radius * 0.1), fill=(60, 160, 50))
+    return image
+
+
+def _screenshot() -> Image.Image:
+    image = Image.new("RGB", (1080, 1920), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 1080, 90), fill=(6, 199, 85))
+    for y in range(120, 1800, 60):
+        draw.rectangle((60, y, 900, y + 20), fill=(30, 30, 30))
+    return image
+
+
+def _jpeg(image: Image.Image) -> bytes:
+    buf = BytesIO()
+    image.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _reference_at(box):
+    return lambda image: box
+
+
+def test_saliency_crops_to_the_plate_and_reference():
+    result = SaliencyCropper(reference_locator=_reference_at((760, 500, 840, 580))).locate(_meal_photo())
+
+    assert result.food
+    left, top, right, bottom = result.box
+    # Plate spans 250..750 x 150..650; the crop keeps it and the reference with a little margin.
+    assert left <= 250 and top <= 150 and right >= 840 and bottom >= 650
+    assert (right - left) * (bottom - top) < 0.4 * 1600 * 1200
+
+
+def test_saliency_never_crops_out_an_off_centre_reference():
+    photo = _meal_photo()
+    reference = (1000, 700, 1080, 780)  # well away from the plate at 250..750 x 150..650
+    ImageDraw.Draw(photo).rounded_rectangle(reference, radius=20, fill=(250, 250, 250))
+
+    # Without a located reference the full frame is sent.
+    assert SaliencyCropper().locate(photo).box is None
+    assert SaliencyCropper(reference_locator=_reference_at(None)).locate(photo).box is None
+
+    left, top, right, bottom = SaliencyCropper(reference_locator=_reference_at(reference)).locate(photo).box
+    assert left <= 250 and top <= 150 and right >= 1080 and bottom >= 780
+
+
+def test_saliency_keeps_full_frame_without_a_clear_subject():
+    rng = np.random.default_rng(1)
+    texture = Image.fromarray(rng.integers(0, 256, (30, 40, 3), dtype=np.uint8)).resize((640, 480), Image.BILINEAR)
+
+    result = SaliencyCropper(reference_locator=_reference_at((300, 200, 340, 240))).locate(texture)
+
+    assert result.food and result.box is None
+
+
+@pytest.mark.parametrize(
+    "image, reason",
+    [(_screenshot(), "screenshot or graphic"), (Image.new("RGB", (800, 600), (5, 5, 5)), "blank")],
+)
+def test_saliency_rejects_images_without_food(image, reason):
+    result = SaliencyCropper().locate(image)
+
+    assert not result.food
+    assert result.reason == reason
+
+
+def test_preprocess_crops_before_resizing():
+    cropper = SaliencyCropper(reference_locator=_reference_at((760, 500, 840, 580)))
+    prepared = preprocess_image(_jpeg(_meal_photo()), cropper=cropper)
+
+    assert max(prepared.width, prepared.height) < 768
+    assert "crop" in prepared.timings_ms
+    with pytest.raises(NoFoodError):
+        preprocess_image(_jpeg(_screenshot()), cropper=SaliencyCropper())
+
+
+def test_analyst_skips_vision_call_for_rejected_photos():
+    calls = []
+    analyst = Analyst(cropper=SaliencyCropper())
+    analyst.call_openai_vision_api = lambda **kwargs: calls.append(kwargs)
+
+    with pytest.raises(NoFoodError):
+        analyst.analyze_bytes(_jpeg(_screenshot()))
+    with pytest.raises(NoFoodError):
+        analyst.analyze_images([_jpeg(_screenshot()), _jpeg(Image.new("RGB", (800, 600), (5, 5, 5)))])
+    assert calls == []
+
+
+def test_decode_yolo_scales_boxes_and_filters_scores():
+    # Two anchors, classes (bowl, person): a confident bowl and a weak person.
+    output = np.array([[[320.0, 100.0], [320.0, 100.0], [200.0, 40.0], [100.0, 40.0], [0.9, 0.1], [0.05, 0.2]]])
+
+    detections = decode_yolo(output, ["Bowl", "person"], score_threshold=0.35, scale=(2.0, 1.5))
+
+    assert detections == [("bowl", pytest.approx(0.9), (440, 405, 840, 555))]
+
+
+def _onnx_cropper(output: np.ndarray) -> OnnxCropper:
+    # Skips __init__, which needs onnxruntime and real weights.
+    cropper = OnnxCropper.__new__(OnnxCropper)
+    cropper.session = type("Session", (), {"run": lambda self, names, feeds: [output]})()
+    cropper.input_name, cropper.input_size = "images", 640
+    cropper.labels = ["bowl", "person", "airpods"]
+    cropper.food_labels, cropper.reference_labels = {"bowl"}, {"airpods"}
+    cropper.score_threshold = 0.35
+    return cropper
+
+
+def test_onnx_cropper_sends_full_frame_unless_food_and_reference_are_detected():
+    # Anchors (cx, cy, w, h, bowl, person, airpods): the reference sits off to the side.
+    person = [320.0, 320.0, 200.0, 200.0, 0.05, 0.9, 0.0]
+    bowl = [200.0, 200.0, 200.0, 200.0, 0.9, 0.05, 0.0]
+    airpods = [560.0, 560.0, 40.0, 40.0, 0.0, 0.05, 0.9]
+
+    def output(*anchors):
+        return np.array(anchors, dtype=np.float32).T[None]
+
+    result = _onnx_cropper(output(person)).locate(_meal_photo())
+    assert result.food
+    assert result.box is None
+    assert _onnx_cropper(output(bowl)).locate(_meal_photo()).box is None
+
+    result = _onnx_cropper(output(bowl, airpods)).locate(_meal_photo())
+    left, top, right, bottom = result.box
+    reference = result.regions["reference"][0]
+    assert left <= reference[0] and top <= reference[1] and right >= reference[2] and bottom >= reference[3]
+
+
+def test_get_cropper_falls_back_to_saliency(tmp_path):
+    assert get_cropper("off") is None
+    assert isinstance(get_cropper("onnx", model_path=str(tmp_path / "missing.onnx")), SaliencyCropper)
+    with pytest.raises(ValueError):
+        get_cropper("yolo")
@@ -0,0 +1,118 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from source.food_db import FoodDatabase, analysis_from_portions, build_food_db, load_custom, load_tfda, load_usda  # noqa: E402
+from source.image_analysis import Analyst, PortionAnalysis  # noqa: E402
+
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8-sig")
+    return path
+
+
+@pytest.fixture
+def food_db(tmp_path):
+    custom = _write(
+        tmp_path / "custom.csv",
+        "name_zh,name_en,aliases,kcal,carbs,protein,fat\n"
+        "白飯,cooked white rice,米飯|飯,183,41,3.1,0.3\n",
+    )
+    tfda = _write(
+        tmp_path / "tfda.csv",
+        "整合編號,樣品名稱,俗名,英文名稱,分析項,每100克含量\n"
+        "A1,雞胸肉,雞胸、清雞胸,chicken breast,熱量,104\n"
+        "A1,雞胸肉,雞胸、清雞胸,chicken breast,修正熱量,102\n"
+        "A1,雞胸肉,雞胸、清雞胸,chicken breast,粗蛋白,22.4\n"
+        "A1,雞胸肉,雞胸、清雞胸,chicken breast,粗脂肪,0.9\n"
+        "A1,雞胸肉,雞胸、清雞胸,chicken breast,總碳水化合物,0\n"
+        "A2,雞肉,,chicken,修正熱量,215\n"
+        "A3,牛肉湯,,beef soup,修正熱量,40\n",
+    )
+    usda = tmp_path / "usda"
+    usda.mkdir()
+    _write(usda / "food.csv", "fdc_id,data_type,description\n1,sr_legacy_food,\"Broccoli, raw\"\n")
+    _write(
+        usda / "food_nutrient.csv",
+        "id,fdc_id,nutrient_id,amount\n1,1,1008,34\n2,1,1005,6.64\n3,1,1003,2.82\n4,1,1004,0.37\n",
+    )
+    records = load_custom(custom) + load_tfda(tfda) + load_usda(usda)
+    build_food_db(records, tmp_path / "db")
+    return FoodDatabase(tmp_path / "db")
+
+
+def test_exact_prefix_and_fuzzy_lookup(food_db):
+    assert len(food_db) == 5
+    assert food_db.exact("米飯").name == "米飯"
+    assert food_db.exact("Chicken Breast").name == "chicken breast"
+    assert [m.name for m in food_db.prefix("雞胸")][:2] == ["雞胸", "雞胸肉"]
+    assert food_db.best_match("烤雞胸肉").name == "雞胸肉"
+    assert food_db.best_match("broccoli raw florets").name == "Broccoli, raw"
+    assert food_db.best_match("巧克力蛋糕") is None
+
+
+def test_short_cjk_names_do_not_match_a_different_dish(food_db):
+    assert food_db.best_match("雞肉飯") is None
+    assert food_db.best_match("牛肉麵") is None
+    assert food_db.best_match("清燉牛肉湯").name == "牛肉湯"
+
+
+def test_nutrients_scale_by_grams_and_prefer_corrected_energy(food_db):
+    chicken = food_db.exact("雞胸肉")
+    values = food_db.nutrients_for(chicken.food_id, 150)
+    assert values["kcal"] == pytest.approx(153.0)
+    assert values["protein"] == pytest.approx(33.6, rel=1e-3)
+
+    # The source lists only energy for 雞肉: the rest is unknown, not zero.
+    partial = food_db.nutrients_for(food_db.exact("雞肉").food_id, 100)
+    assert partial["kcal"] == pytest.approx(215.0)
+    assert partial["protein"] is None
+    _, unmatched = analysis_from_portions(food_db, [{"name": "雞肉", "grams": 100}])
+    assert unmatched == ["雞肉"]
+
+
+def test_analysis_from_portions_reports_unmatched(food_db):
+    analysis, unmatched = analysis_from_portions(
+        food_db,
+        [
+            {"name": "白飯", "name_en": "rice", "grams": 200, "portion_size": "1碗"},
+            {"name": "燙青菜", "name_en": "broccoli raw", "grams": 100, "portion_size": "1份"},
+            {"name": "神秘醬汁", "name_en": "mystery sauce", "grams": 20, "portion_size": "1匙"},
+        ],
+    )
+    assert unmatched == ["神秘醬汁"]
+    assert analysis["food_items"][0] == {
+        "name": "白飯",
+        "portion_size": "1碗",
+        "calories": "366 kcal",
+        "macronutrients": {"carbs": "82g", "protein": "6g", "fat": "1g"},
+    }
+    assert analysis["food_items"][1]["calories"] == "34 kcal"
+
+
+def test_analyst_uses_food_db_and_falls_back_when_unmatched(food_db):
+    analyst = Analyst(api_key="test-key", food_db=food_db)
+    portions = {"food_items": [{"name": "飯", "name_en": "rice", "grams": 100, "portion_size": "半碗"}]}
+    full_calls = []
+
+    def portion_call(base64_image, mime_type="image/jpeg", detail=None):
+        parsed = PortionAnalysis.model_validate(portions)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed))])
+
+    def full_call(base64_image, mime_type="image/jpeg", detail=None):
+        full_calls.append(1)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed={"food_items": []}))])
+
+    analyst.call_portion_api = portion_call
+    analyst.call_openai_vision_api = full_call
+
+    assert analyst.analyze_bytes(b"not an image")["food_items"][0]["calories"] == "183 kcal"
+    assert full_calls == []
+
+    portions["food_items"][0].update(name="外星料理", name_en="alien dish")
+    assert analyst.analyze_bytes(b"not an image") == {"food_items": []}
+    assert full_calls == [1]
+    assert analyst.cache_config_key() != Analyst(api_key="test-key").cache_config_key()
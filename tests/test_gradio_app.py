@@ -0,0 +1,65 @@
+import os
+import threading
+from types import SimpleNamespace
+
+from PIL import Image
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from source import gradio_app  # noqa: E402
+from source.image_analysis import Analyst, NutritionAnalysis  # noqa: E402
+
+PARSED = NutritionAnalysis.model_validate(
+    {
+        "food_items": [
+            {
+                "name": "白飯",
+                "portion_size": "1碗",
+                "calories": "280 kcal",
+                "macronutrients": {"carbs": "62g", "protein": "5g", "fat": "0g"},
+            }
+        ]
+    }
+)
+
+
+def test_batch_runs_in_parallel_with_per_request_language(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    barrier = threading.Barrier(3, timeout=5)
+    languages = []
+
+    def fake_call(self, base64_image, mime_type="image/jpeg", detail=None):
+        languages.append(self.language)
+        barrier.wait()  # all three calls must be in flight together
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=PARSED))])
+
+    monkeypatch.setattr(Analyst, "call_openai_vision_api", fake_call)
+    analyst = Analyst(api_key="test-key", language="zh-TW")
+    images = [Image.new("RGB", (64, 64), color) for color in ("red", "green", "blue")]
+
+    (results,) = gradio_app.analyze_batch(analyst, images, ["en", "ja", None])
+
+    assert [r["food_items"][0]["name"] for r in results] == ["白飯"] * 3
+    assert sorted(languages) == ["en", "ja", "zh-TW"]
+    assert analyst.language == "zh-TW"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failures_stay_with_their_request(monkeypatch):
+    def fake_call(self, base64_image, mime_type="image/jpeg", detail=None):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(Analyst, "call_openai_vision_api", fake_call)
+
+    (results,) = gradio_app.analyze_batch(Analyst(api_key="test-key"), [None, Image.new("RGB", (8, 8))], ["en", "en"])
+
+    assert results == [{"error": "no image"}, {"error": "boom"}]
+
+
+def test_app_uses_queue_with_batched_handler():
+    demo = gradio_app.build_app(Analyst(api_key="test-key"), concurrency=3, max_batch_size=5)
+
+    (dependency,) = [d for d in demo.fns.values() if d.api_name == "analyze"]
+    assert dependency.batch and dependency.max_batch_size == 5
+    assert dependency.concurrency_limit == 3
+    assert demo._queue.max_size == gradio_app.GRADIO_QUEUE_SIZE
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import linebot_app.handler as handler  # noqa: E402
+import linebot_app.storage as storage  # noqa: E402
+from linebot_app.idempotency import SingleFlight  # noqa: E402
+from linebot_app.migrate import seed_processed_messages  # noqa: E402
+
+MEAL = {
+    "food_items": [
+        {
+            "name": "滷肉飯",
+            "portion_size": "1碗",
+            "calories": "450 kcal",
+            "macronutrients": {"carbs": "60g", "protein": "15g", "fat": "16g"},
+        }
+    ]
+}
+
+
+def test_single_flight_shares_one_call():
+    calls = []
+    release = threading.Event()
+    results = []
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return "done"
+
+    flight = SingleFlight()
+    threads = [threading.Thread(target=lambda: results.append(flight.run("m1", slow))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while len(flight) == 0:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert sorted(results, key=lambda r: r[1]) == [("done", False)] * 3 + [("done", True)]
+    assert len(flight) == 0
+
+
+def test_duplicate_message_is_written_once(tmp_path, monkeypatch):
+    db_path = tmp_path / "idem.db"
+    monkeypatch.setattr(storage, "DB_PATH", db_path)
+    engine = storage.StorageEngine(db_path, flush_interval=5).start()
+    monkeypatch.setattr(storage, "_engine", engine)
+
+    engine.save_analysis(user_id="u1", message_id="m1", analysis=MEAL)
+    engine.save_analysis(user_id="u1", message_id="m1", analysis=MEAL)
+    assert storage.fetch_analysis_by_message("m1") == MEAL  # served from the pending write
+    engine.flush()
+    engine.save_analysis(user_id="u1", message_id="m1", analysis={"food_items": []})
+    engine.close()
+
+    assert storage.fetch_analysis_by_message("m1") == MEAL
+    assert storage.fetch_analysis_by_message("m2") is None
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM meal_analysis").fetchone()[0] == 1
+        assert conn.execute("SELECT meal_count FROM daily_totals").fetchone()[0] == 1
+
+
+def test_seed_processed_messages_covers_legacy_rows(tmp_path):
+    conn = storage.open_connection(tmp_path / "legacy.db")
+    storage.create_schema(conn)
+    with conn:
+        conn.executemany(
+            "INSERT INTO meal_analysis (user_id, message_id, analysis_json) VALUES (?, ?, ?)",
+            [("u", "old1", "{}"), ("u", "old1", "{}"), ("u", "old2", "{}"), ("u", "", "{}")],
+        )
+    assert seed_processed_messages(conn) == 2
+    assert conn.execute("SELECT meal_id FROM processed_message WHERE message_id = 'old1'").fetchone() == (1,)
+    conn.close()
+
+
+def test_redelivered_image_replies_without_reanalysis(tmp_path, monkeypatch):
+    db_path = tmp_path / "handler.db"
+    monkeypatch.setattr(storage, "DB_PATH", db_path)
+    engine = storage.StorageEngine(db_path, flush_interval=0.01).start()
+    monkeypatch.setattr(storage, "_engine", engine)
+    calls = []
+
+    def analyze(image_bytes, budget=None, scope=""):
+        calls.append(bytes(image_bytes))
+        return MEAL
+
+    monkeypatch.setattr(handler, "download_message_content", lambda api, message_id: memoryview(b"jpeg"))
+    monkeypatch.setattr(handler.analyst, "analyze_bytes", analyze)
+    event = SimpleNamespace(message=SimpleNamespace(id="m9"), source=SimpleNamespace(user_id="u1"))
+
+    first = handler.handle_image_message(event, line_bot_api=None)
+    engine.flush()
+    again = handler.handle_image_message(event, line_bot_api=None)
+    engine.close()
+
+    assert calls == [b"jpeg"]
+    assert first[0].text == again[0].text
+    assert "滷肉飯" in again[0].text
+
+
+def test_message_claimed_by_another_worker_is_not_reanalyzed(tmp_path, monkeypatch):
+    db_path = tmp_path / "claims.db"
+    monkeypatch.setattr(storage, "DB_PATH", db_path)
+    engine = storage.StorageEngine(db_path, flush_interval=0.01).start()
+    monkeypatch.setattr(storage, "_engine", engine)
+    calls = []
+
+    def analyze(image_bytes, budget=None, scope=""):
+        calls.append(bytes(image_bytes))
+        return MEAL
+
+    monkeypatch.setattr(handler, "download_message_content", lambda api, message_id: memoryview(b"jpeg"))
+    monkeypatch.setattr(handler.analyst, "analyze_bytes", analyze)
+    event = SimpleNamespace(message=SimpleNamespace(id="m7"), source=SimpleNamespace(user_id="u1"))
+
+    # Another worker process claimed the message and is still analyzing it.
+    assert storage.claim_message("m7")
+    assert not storage.claim_message("m7")
+    assert handler.handle_image_message(event, line_bot_api=None) == []
+    assert calls == []
+
+    # A claim that outlived the timeout was abandoned (e.g. the worker died).
+    assert storage.claim_message("m7", timeout=-1)
+    storage.release_messages(["m7"])
+    assert "滷肉飯" in handler.handle_image_message(event, line_bot_api=None)[0].text
+    engine.flush()
+    assert not storage.claim_message("m7", timeout=-1)  # the claim became the meal's receipt
+    engine.close()
+
+    assert calls == [b"jpeg"]
+    assert storage.fetch_analysis_by_message("m7") == MEAL
@@ -0,0 +1,80 @@
+import os
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from source.image_analysis import Analyst, NutritionAnalysis, collect_chunks  # noqa: E402
+
+PARSED = NutritionAnalysis.model_validate(
+    {
+        "food_items": [
+            {
+                "name": "白飯",
+                "portion_size": "1碗",
+                "calories": "280 kcal",
+                "macronutrients": {"carbs": "62g", "protein": "5g", "fat": "0g"},
+            }
+        ]
+    }
+)
+
+
+def _fake_vision_call(calls):
+    def call(base64_image, mime_type="image/jpeg", detail=None):
+        calls.append((mime_type, detail))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=PARSED))])
+
+    return call
+
+
+def _jpeg_bytes() -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", (640, 480), "#f39c12").save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_collect_chunks_with_exact_short_and_missing_size_hint():
+    chunks = [b"abc", b"defg", b"h"]
+    assert bytes(collect_chunks(iter(chunks), size_hint=8)) == b"abcdefgh"
+    assert bytes(collect_chunks(iter(chunks), size_hint=2)) == b"abcdefgh"
+    assert bytes(collect_chunks(iter(chunks))) == b"abcdefgh"
+
+
+def test_analyze_stream_and_bytes_stay_in_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    analyst = Analyst(api_key="test-key")
+    analyst.call_openai_vision_api = _fake_vision_call(calls)
+    data = _jpeg_bytes()
+
+    from_stream = analyst.analyze_stream((data[i:i + 1000] for i in range(0, len(data), 1000)), len(data))
+    from_view = analyst.analyze_bytes(memoryview(data))
+
+    assert from_stream == from_view == PARSED.model_dump()
+    assert calls == [("image/jpeg", "high"), ("image/jpeg", "high")]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_gradio_interface_does_not_write_temp_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analyst = Analyst(api_key="test-key")
+    analyst.call_openai_vision_api = _fake_vision_call([])
+
+    result = analyst.gradio_interface(Image.new("RGBA", (64, 64), "green"), language="en")
+
+    assert result["food_items"][0]["name"] == "白飯"
+    assert analyst.language == "zh-TW"  # per-request language leaves the shared analyst alone
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_prompt_asks_for_the_analyst_language():
+    analyst = Analyst(api_key="test-key")
+
+    assert "Traditional Chinese (zh-TW)" in analyst._build_messages("b64")[0]["content"]
+    for language, name in [("en", "English (en)"), ("ja", "Japanese (ja)")]:
+        system = analyst.with_language(language)._build_messages("b64", portions_only=True)[0]["content"]
+        assert name in system and f"must be {language}." in system
+        assert "zh-TW" not in system
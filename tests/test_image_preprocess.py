@@ -0,0 +1,57 @@
+from io import BytesIO
+
+from PIL import Image
+
+from source.image_preprocess import choose_detail, preprocess_image, target_size
+
+
+def _photo_with_orientation(width: int, height: int, orientation: int) -> bytes:
+    image = Image.new("RGB", (width, height), "#d35400")
+    exif = Image.Exif()
+    exif[0x0112] = orientation  # Orientation
+    exif[0x010F] = "PhoneMaker"  # Make
+    buf = BytesIO()
+    image.save(buf, format="JPEG", quality=98, exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def test_target_size_fits_tile_limits():
+    assert target_size(4032, 3024) == (1024, 768)
+    assert target_size(3000, 600) == (2048, 410)
+    assert target_size(400, 300) == (400, 300)
+
+
+def test_choose_detail():
+    assert choose_detail(400, 300) == "low"
+    assert choose_detail(1024, 768) == "high"
+    assert choose_detail(400, 300, requested="high") == "high"
+
+
+def test_preprocess_applies_orientation_and_strips_metadata():
+    original = _photo_with_orientation(4000, 3000, orientation=6)
+
+    prepared = preprocess_image(original)
+
+    # Orientation 6 rotates the landscape sensor image to portrait.
+    assert (prepared.width, prepared.height) == (768, 1024)
+    assert prepared.detail == "high"
+    assert prepared.mime_type == "image/jpeg"
+    assert prepared.bytes_saved > 0
+    assert set(prepared.timings_ms) == {"decode", "orient", "resize", "encode"}
+
+    with Image.open(BytesIO(prepared.data)) as out:
+        assert out.size == (768, 1024)
+        assert not out.getexif()
+
+
+def test_preprocess_webp_flattens_alpha():
+    image = Image.new("RGBA", (300, 200), (0, 128, 0, 0))
+    buf = BytesIO()
+    image.save(buf, format="PNG")
+
+    prepared = preprocess_image(buf.getvalue(), image_format="webp")
+
+    assert prepared.mime_type == "image/webp"
+    assert prepared.detail == "low"
+    with Image.open(BytesIO(prepared.data)) as out:
+        assert out.mode == "RGB"
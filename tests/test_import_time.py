@@ -0,0 +1,61 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Cumulative import time allowed for the webhook app, in ms. Generous enough
+# for slow CI runners, but well under the ~6 s it took with gradio and
+# matplotlib loaded eagerly.
+IMPORT_BUDGET_MS = float(os.getenv("SNAPBITE_IMPORT_BUDGET_MS", "3000"))
+DEFERRED_MODULES = ("gradio", "matplotlib")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _import_times(module: str, tmp_path: Path) -> dict:
+    env = dict(os.environ)
+    env.update(
+        {
+            "LINE_CHANNEL_ACCESS_TOKEN": "test-token",
+            "LINE_CHANNEL_SECRET": "test-secret",
+            "SNAPBITE_DB_PATH": str(tmp_path / "data" / "snapbite.db"),
+            "SNAPBITE_CACHE_DB_PATH": str(tmp_path / "data" / "analysis_cache.db"),
+        }
+    )
+    env.pop("OPENAI_API_KEY", None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    times = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2)) / 1000  # cumulative, ms
+    return times
+
+
+def test_webhook_cold_import_within_budget(tmp_path):
+    times = _import_times("linebot_app.webhook", tmp_path)
+
+    eager = sorted(name for name in times if name.split(".")[0] in DEFERRED_MODULES)
+    assert not eager, f"imported at startup: {eager[:5]}"
+    assert times["linebot_app.webhook"] <= IMPORT_BUDGET_MS, (
+        f"linebot_app.webhook took {times['linebot_app.webhook']:.0f} ms to import "
+        f"(budget {IMPORT_BUDGET_MS:.0f} ms)"
+    )
+    # Importing creates no files; the database directory appears on first connect.
+    assert not (tmp_path / "data").exists()
+
+
+def test_analyst_defers_gateway_until_first_call():
+    from source.image_analysis import Analyst
+    from source.llm_gateway import get_gateway
+
+    analyst = Analyst(api_key="lazy-key")
+    assert analyst._gateway is None
+    assert analyst.gateway is get_gateway("lazy-key")
+    assert analyst.gateway._client is None
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from linebot_app.jobs import JobQueue, QueueFullError
+from linebot_app.line_client import LineClient
+
+
+def test_job_queue_processes_jobs_off_the_event_loop():
+    seen = []
+    loop_thread = threading.get_ident()
+
+    def handler(job):
+        time.sleep(0.01)
+        seen.append((job, threading.get_ident() != loop_thread))
+
+    async def run():
+        queue = JobQueue(handler, concurrency=2, maxsize=10)
+        await queue.start()
+        for i in range(5):
+            queue.submit(i)
+        await queue.stop(drain=True)
+
+    asyncio.run(run())
+
+    assert sorted(job for job, _ in seen) == [0, 1, 2, 3, 4]
+    assert all(off_loop for _, off_loop in seen)
+
+
+def test_job_queue_rejects_when_full():
+    release = threading.Event()
+
+    async def run():
+        queue = JobQueue(lambda job: release.wait(1), concurrency=1, maxsize=1)
+        await queue.start()
+        queue.submit("a")
+        await asyncio.sleep(0.05)  # worker picks up "a" and blocks
+        queue.submit("b")
+        with pytest.raises(QueueFullError):
+            queue.submit("c")
+        release.set()
+        await queue.stop(drain=True)
+
+    asyncio.run(run())
+
+
+def test_job_queue_survives_handler_errors():
+    done = []
+
+    def handler(job):
+        if job == "bad":
+            raise ValueError("boom")
+        done.append(job)
+
+    async def run():
+        queue = JobQueue(handler, concurrency=1, maxsize=5)
+        await queue.start()
+        queue.submit("bad")
+        queue.submit("good")
+        await queue.stop(drain=True)
+
+    asyncio.run(run())
+
+    assert done == ["good"]
+
+
+class SlowLineAPI:
+    content_timeout = 1.0
+
+    async def get_message_content(self, message_id, chunk_size=None):
+        await asyncio.sleep(0.2)
+        return memoryview(message_id.encode())
+
+
+def test_stop_does_not_block_jobs_waiting_on_the_loop():
+    line_client = LineClient(SlowLineAPI())
+    received = []
+
+    async def run():
+        line_client.bind(asyncio.get_running_loop())
+        queue = JobQueue(lambda job: received.append(bytes(line_client.get_message_content(job))), concurrency=1)
+        await queue.start()
+        queue.submit("m1")
+        await asyncio.sleep(0.05)  # the worker thread is now waiting on the loop
+        started = time.monotonic()
+        await queue.stop(drain=False)
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+
+    assert received == [b"m1"]
+    assert elapsed < 1.0
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from linebot.exceptions import LineBotApiError
+from linebot.models import TextSendMessage
+
+from linebot_app import handler
+from linebot_app.line_client import AsyncLineClient, LineClient, chunk_messages
+
+IMAGE = bytes(range(256)) * 40
+
+
+def _client(requests, status=200):
+    def respond(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if status >= 400:
+            return httpx.Response(status, json={"message": "Invalid reply token"}, headers={"x-line-request-id": "r1"})
+        if request.url.path.endswith("/content"):
+            return httpx.Response(200, content=IMAGE, headers={"Content-Length": str(len(IMAGE))})
+        return httpx.Response(200, json={})
+
+    return AsyncLineClient("token", endpoint="http://api.test", data_endpoint="http://data.test", transport=httpx.MockTransport(respond))
+
+
+def test_chunk_messages_respects_line_limit():
+    assert chunk_messages(range(12)) == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [10, 11]]
+    assert chunk_messages([]) == []
+
+
+def test_download_streams_content_with_auth():
+    requests = []
+
+    async def run():
+        client = _client(requests)
+        try:
+            return await client.get_message_content("m1", chunk_size=1000)
+        finally:
+            await client.aclose()
+
+    content = asyncio.run(run())
+    assert bytes(content) == IMAGE
+    assert str(requests[0].url) == "http://data.test/v2/bot/message/m1/content"
+    assert requests[0].headers["Authorization"] == "Bearer token"
+
+
+def test_error_status_raises_line_bot_api_error():
+    async def run():
+        client = _client([], status=400)
+        try:
+            await client.reply_message("t1", [TextSendMessage(text="hi")])
+        finally:
+            await client.aclose()
+
+    with pytest.raises(LineBotApiError) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.request_id == "r1"
+
+
+def test_facade_runs_calls_on_the_bound_loop():
+    requests = []
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    client = _client(requests)
+    facade = LineClient(client, loop=loop)
+    try:
+        facade.push_message("u1", [TextSendMessage(text=str(i)) for i in range(7)])
+        assert bytes(facade.get_message_content("m2")) == IMAGE
+    finally:
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+    pushes = [json.loads(r.content) for r in requests if r.url.path == "/v2/bot/message/push"]
+    assert [len(p["messages"]) for p in pushes] == [5, 2]
+    with pytest.raises(RuntimeError):
+        facade.reply_message("t1", [TextSendMessage(text="late")])
+
+
+def test_send_replies_pushes_messages_beyond_the_reply_limit():
+    calls = []
+    api = SimpleNamespace(
+        reply_message=lambda token, messages: calls.append(("reply", len(messages))),
+        push_message=lambda to, messages: calls.append(("push", len(messages))),
+    )
+    event = SimpleNamespace(reply_token="t1", timestamp=None, source=SimpleNamespace(user_id="u1"), message=SimpleNamespace(id="m1"))
+
+    handler.send_replies(event, [TextSendMessage(text=str(i)) for i in range(7)], api)
+    assert calls == [("reply", 5), ("push", 2)]
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import BadRequestError
+from pydantic import BaseModel
+
+from source.llm_gateway import CircuitBreaker, CircuitOpenError, LLMGateway
+from source.metrics import LLM_REQUESTS, LLM_TOKENS
+
+
+class Answer(BaseModel):
+    value: int
+
+
+def _completion(content: str) -> dict:
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "fake",
+        "choices": [
+            {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+        ],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+class FakeOpenAI:
+    """
+    Local chat-completions server that replays a script of (status, delay) steps.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.requests = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with fake._lock:
+                    fake.requests += 1
+                    fake.concurrent += 1
+                    fake.max_concurrent = max(fake.max_concurrent, fake.concurrent)
+                    status, delay = fake.script.pop(0) if len(fake.script) > 1 else fake.script[0]
+                time.sleep(delay)
+                with fake._lock:
+                    fake.concurrent -= 1
+                body = _completion('{"value": 42}') if status == 200 else {"error": {"message": "fail", "type": "x"}}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                if status == 429:
+                    self.send_header("Retry-After", "0.05")
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(script):
+        server = FakeOpenAI(script)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def _gateway(server, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return LLMGateway(api_key="test-key", base_url=server.base_url, **kwargs)
+
+
+def _ask(gateway, **kwargs):
+    return gateway.parse(model="fake", messages=[{"role": "user", "content": "hi"}], response_format=Answer, **kwargs)
+
+
+def test_retries_429_and_5xx_then_parses(fake_server):
+    server = fake_server([(429, 0), (503, 0), (200, 0)])
+    gateway = _gateway(server)
+    try:
+        assert _ask(gateway).choices[0].message.parsed == Answer(value=42)
+        assert server.requests == 3
+        assert gateway.stats()["breaker"] == "closed"
+        assert LLM_REQUESTS.value("fake", "retry") >= 2
+        assert LLM_TOKENS.value("fake", "completion") >= 1
+    finally:
+        gateway.close()
+
+
+def test_client_errors_are_not_retried(fake_server):
+    server = fake_server([(400, 0)])
+    gateway = _gateway(server)
+    try:
+        with pytest.raises(BadRequestError):
+            _ask(gateway)
+        assert server.requests == 1
+    finally:
+        gateway.close()
+
+
+def test_deadline_covers_slow_responses(fake_server):
+    server = fake_server([(200, 0.5)])
+    gateway = _gateway(server, max_retries=0)
+    try:
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            _ask(gateway, timeout=0.1)
+        assert time.monotonic() - started < 0.4
+    finally:
+        gateway.close()
+
+
+def test_concurrency_is_bounded(fake_server):
+    server = fake_server([(200, 0.05)])
+    gateway = _gateway(server, concurrency=2)
+    try:
+        threads = [threading.Thread(target=_ask, args=(gateway,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert server.requests == 6
+        assert server.max_concurrent <= 2
+    finally:
+        gateway.close()
+
+
+def test_breaker_fails_fast_then_recovers(fake_server):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    server = fake_server([(500, 0), (500, 0), (200, 0)])
+    gateway = _gateway(server, max_retries=0, breaker=breaker)
+    try:
+        for _ in range(2):
+            with pytest.raises(Exception):
+                _ask(gateway)
+        with pytest.raises(CircuitOpenError):
+            _ask(gateway)
+        assert server.requests == 2
+
+        now[0] = 11.0
+        assert breaker.state == "half_open"
+        assert _ask(gateway).choices[0].message.parsed.value == 42
+        assert breaker.state == "closed"
+    finally:
+        gateway.close()
+
+
+def test_client_error_during_trial_keeps_breaker_open(fake_server):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    server = fake_server([(500, 0), (400, 0), (200, 0)])
+    gateway = _gateway(server, max_retries=0, breaker=breaker)
+    try:
+        with pytest.raises(Exception):
+            _ask(gateway)
+        now[0] = 11.0
+        with pytest.raises(BadRequestError):
+            _ask(gateway)
+        assert breaker.state == "half_open"
+        assert _ask(gateway).choices[0].message.parsed.value == 42
+        assert breaker.state == "closed"
+    finally:
+        gateway.close()
+
+
+def test_cancelled_trial_is_released(fake_server):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    server = fake_server([(500, 0), (200, 2.0), (200, 0)])
+    gateway = _gateway(server, max_retries=0, breaker=breaker)
+    try:
+        with pytest.raises(Exception):
+            _ask(gateway)
+        now[0] = 11.0
+        trial = asyncio.run_coroutine_threadsafe(
+            gateway.aparse(model="fake", messages=[{"role": "user", "content": "hi"}], response_format=Answer),
+            gateway._ensure_loop(),
+        )
+        deadline = time.monotonic() + 2
+        while server.requests < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with pytest.raises(CircuitOpenError):
+            _ask(gateway)
+        trial.cancel()
+        deadline = time.monotonic() + 2
+        while breaker._trial_running and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert breaker.state == "half_open"
+        assert _ask(gateway).choices[0].message.parsed.value == 42
+        assert breaker.state == "closed"
+    finally:
+        gateway.close()
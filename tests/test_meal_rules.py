@@ -0,0 +1,27 @@
+from source.meal_rules import RULE_CONFIDENCE_THRESHOLD, evaluate_meal
+
+
+def test_balanced_meal_has_no_issues():
+    result = evaluate_meal({"calories": 450, "carbs": 60, "protein": 20, "fat": 13}, 1800, "維持", "早餐")
+    assert result.issues == []
+    assert result.next_meal == "lunch"
+    assert result.confidence == 1.0
+    assert "均衡" in result.evaluation
+
+
+def test_heavy_low_protein_meal_gets_protein_menu():
+    result = evaluate_meal({"calories": 900, "carbs": 150, "protein": 15, "fat": 27}, 1500, "減脂", "lunch")
+    assert any(issue.startswith("熱量偏高") for issue in result.issues)
+    assert any(issue.startswith("蛋白質比例偏低") for issue in result.issues)
+    assert result.suggested_menu[0]["name"] == "烤雞胸肉"
+    # Half of the 375 kcal surplus comes off the 450 kcal dinner share.
+    assert result.target_calories == 450 - 187.5
+
+
+def test_unparseable_or_inconsistent_totals_have_low_confidence():
+    missing = evaluate_meal({"calories": float("nan"), "carbs": 10, "protein": 5, "fat": 1}, 1800, "維持", "dinner")
+    mismatch = evaluate_meal({"calories": 1200, "carbs": 30, "protein": 10, "fat": 5}, 1800, "維持", "dinner")
+    unknown = evaluate_meal({"calories": 450, "carbs": 60, "protein": 20, "fat": 13}, 1800, "維持", "brunch")
+    assert missing.confidence == 0.0 and missing.suggested_menu == []
+    assert mismatch.confidence < RULE_CONFIDENCE_THRESHOLD
+    assert unknown.confidence >= RULE_CONFIDENCE_THRESHOLD and unknown.notes
@@ -0,0 +1,54 @@
+import threading
+from types import SimpleNamespace
+
+from source.metrics import LLM_TOKENS, Registry, record_usage
+
+
+def test_sharded_counter_sums_across_threads():
+    registry = Registry()
+    events = registry.counter("test_events_total", "Events.", labelnames=("kind",))
+
+    def work():
+        for _ in range(1000):
+            events.inc(1, "image")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    events.inc(2, "text")
+
+    assert events.value("image") == 4000
+    assert registry.counter("test_events_total", "Events.", labelnames=("kind",)) is events
+    text = registry.render()
+    assert '# TYPE test_events_total counter' in text
+    assert 'test_events_total{kind="image"} 4000' in text
+    assert 'test_events_total{kind="text"} 2' in text
+
+
+def test_histogram_buckets_and_prometheus_text():
+    registry = Registry()
+    latency = registry.histogram("test_stage_seconds", "Stage time.", labelnames=("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, "vision_call")
+    registry.gauge("test_depth", "Depth.", lambda: 7)
+
+    assert latency.snapshot("vision_call") == {"count": 4, "sum": 3.65}
+    assert latency.quantile(0.5, "vision_call") == 0.1
+    assert latency.quantile(0.99, "vision_call") == float("inf")
+    lines = registry.render().splitlines()
+    assert 'test_stage_seconds_bucket{stage="vision_call",le="0.1"} 2' in lines
+    assert 'test_stage_seconds_bucket{stage="vision_call",le="1"} 3' in lines
+    assert 'test_stage_seconds_bucket{stage="vision_call",le="+Inf"} 4' in lines
+    assert 'test_stage_seconds_count{stage="vision_call"} 4' in lines
+    assert "test_depth 7" in lines
+
+
+def test_record_usage_counts_prompt_completion_and_cached_tokens():
+    before = LLM_TOKENS.value("m-test", "prompt")
+    usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30, prompt_tokens_details=SimpleNamespace(cached_tokens=100))
+    record_usage("m-test", usage)
+    assert LLM_TOKENS.value("m-test", "prompt") - before == 120
+    assert LLM_TOKENS.value("m-test", "completion") >= 30
+    assert LLM_TOKENS.value("m-test", "cached_prompt") >= 100
@@ -0,0 +1,56 @@
+import json
+import sqlite3
+
+from linebot_app.migrate import backfill
+
+
+def _legacy_db(path):
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            """
+            CREATE TABLE meal_analysis (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                message_id TEXT,
+                analysis_json TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        analysis = {
+            "food_items": [
+                {
+                    "name": "牛肉麵",
+                    "portion_size": "1碗",
+                    "calories": "600 kcal",
+                    "macronutrients": {"carbs": "70g", "protein": "30g", "fat": "20g"},
+                }
+            ]
+        }
+        rows = [
+            ("u1", "m1", json.dumps(analysis, ensure_ascii=False), "2024-05-01 04:00:00"),
+            ("u1", "m2", json.dumps(analysis, ensure_ascii=False), "2024-05-01 10:00:00"),
+            ("u2", "m3", "", "2024-05-01 10:00:00"),
+            ("u2", "m4", "not json", "2024-05-01 11:00:00"),
+        ]
+        conn.executemany(
+            "INSERT INTO meal_analysis (user_id, message_id, analysis_json, created_at) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+
+def test_backfill_converts_legacy_rows_once(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    _legacy_db(db_path)
+
+    assert backfill(db_path, batch_size=3) == 4
+    assert backfill(db_path, batch_size=3) == 0
+
+    with sqlite3.connect(db_path) as conn:
+        items = conn.execute("SELECT meal_id, name, calories FROM meal_item ORDER BY id").fetchall()
+        totals = conn.execute("SELECT user_id, day, calories, meal_count FROM daily_totals").fetchall()
+        pending = conn.execute("SELECT COUNT(*) FROM meal_analysis WHERE item_count IS NULL").fetchone()[0]
+
+    assert items == [(1, "牛肉麵", 600.0), (2, "牛肉麵", 600.0)]
+    assert totals == [("u1", "2024-05-01", 1200.0, 2)]
+    assert pending == 0
@@ -0,0 +1,102 @@
+import pytest
+from linebot.exceptions import LineBotApiError
+from linebot.models.error import Error
+
+import linebot_app.storage as storage
+from linebot_app.nightly import Pacer, run_batch
+
+MEAL = {
+    "food_items": [
+        {
+            "name": "水餃",
+            "portion_size": "10顆",
+            "calories": "450 kcal",
+            "macronutrients": {"carbs": "50g", "protein": "20g", "fat": "18g"},
+        }
+    ]
+}
+
+
+class FakeLinePusher:
+    """Local stand-in for LineBotApi.push_message."""
+
+    def __init__(self, fail_for=(), rate_limit_once=()):
+        self.pushed = []
+        self.fail_for = set(fail_for)
+        self.rate_limited = set(rate_limit_once)
+
+    def push_message(self, to, messages):
+        if to in self.rate_limited:
+            self.rate_limited.discard(to)
+            raise LineBotApiError(429, {"Retry-After": "0"}, error=Error(message="rate limited"))
+        if to in self.fail_for:
+            raise LineBotApiError(500, {}, error=Error(message="server error"))
+        self.pushed.append((to, messages))
+
+
+def _seed(tmp_path, monkeypatch, users):
+    db_path = tmp_path / "nightly.db"
+    monkeypatch.setattr(storage, "DB_PATH", db_path)
+    engine = storage.StorageEngine(db_path, flush_interval=0.01).start()
+    for i, user in enumerate(users):
+        engine.save_analysis(user_id=user, message_id=f"m{i}", analysis=MEAL)
+    engine.close()
+    return storage.local_day(storage._utc_timestamp())
+
+
+def test_run_batch_pushes_all_users_and_resumes(tmp_path, monkeypatch):
+    day = _seed(tmp_path, monkeypatch, ["u1", "u2", "u3"])
+    chart_dir = tmp_path / "charts"
+    checkpoint = tmp_path / "checkpoint.done"
+
+    first = FakeLinePusher(fail_for={"u2"}, rate_limit_once={"u3"})
+    stats = run_batch(first, day=day, workers=2, checkpoint_path=checkpoint, chart_dir=chart_dir, pacer=Pacer(0))
+
+    assert stats.sent == 2 and stats.failed == 1
+    assert sorted(to for to, _ in first.pushed) == ["u1", "u3"]
+    assert sorted(checkpoint.read_text().split()) == ["u1", "u3"]
+    assert len(list(chart_dir.glob("*.png"))) >= 3
+
+    second = FakeLinePusher()
+    stats = run_batch(second, day=day, workers=2, checkpoint_path=checkpoint, chart_dir=chart_dir, pacer=Pacer(0))
+
+    assert stats.skipped == 2 and stats.sent == 1
+    assert [to for to, _ in second.pushed] == ["u2"]
+    assert "450 kcal" in second.pushed[0][1][0].text
+
+
+def test_pacer_spaces_calls():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    pacer = Pacer(rate=4, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        pacer.wait()
+    pacer.pause(2.0)
+    pacer.wait()
+
+    assert sleeps == [0.25, 0.25, 2.0]
+
+
+class CrashingPusher(FakeLinePusher):
+    """Delivers one report, then dies like a killed process would."""
+
+    def push_message(self, to, messages):
+        if self.pushed:
+            raise RuntimeError("crash")
+        super().push_message(to, messages)
+
+
+def test_checkpoint_records_each_user_before_a_crash(tmp_path, monkeypatch):
+    day = _seed(tmp_path, monkeypatch, ["u1", "u2", "u3"])
+    checkpoint = tmp_path / "checkpoint.done"
+    pusher = CrashingPusher()
+
+    with pytest.raises(RuntimeError):
+        run_batch(pusher, day=day, workers=1, checkpoint_path=checkpoint, chart_dir=tmp_path / "charts", pacer=Pacer(0))
+
+    assert checkpoint.read_text().split() == [pusher.pushed[0][0]]
@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+import pytest
+
+from source.nutrient_table import (
+    group_sum,
+    macro_ratios,
+    parse_quantities,
+    parse_quantity,
+    table_from_analyses,
+    totals_by_day,
+    totals_by_meal,
+    totals_by_week,
+    week_start,
+)
+
+
+@pytest.mark.parametrize(
+    "text, kind, expected",
+    [
+        ("230 kcal", "energy", 230.0),
+        ("２３０ｋｃａｌ", "energy", 230.0),
+        ("200-250 大卡", "energy", 225.0),
+        ("1046 kJ", "energy", 250.0),
+        ("45g", "mass", 45.0),
+        ("約 30 克", "mass", 30.0),
+        ("500 mg", "mass", 0.5),
+        ("1/2 碗", None, 0.5),
+        ("½ 碗", None, 0.5),
+        ("1 1/2 碗", None, 1.5),
+        ("半碗", None, 0.5),
+        (12, "mass", 12.0),
+    ],
+)
+def test_parse_quantity(text, kind, expected):
+    assert parse_quantity(text, kind) == pytest.approx(expected)
+
+
+def test_parse_quantity_rejects_missing_or_mismatched_units():
+    assert math.isnan(parse_quantity("少許"))
+    assert math.isnan(parse_quantity(None))
+    assert math.isnan(parse_quantity("45g", "energy"))
+
+
+def test_parse_quantities_returns_array_in_input_order():
+    result = parse_quantities(["10g", "0g", 3, "10g", None, "0g"], "mass")
+    assert result.dtype == np.float64
+    np.testing.assert_array_equal(result[[0, 1, 2, 3, 5]], [10.0, 0.0, 3.0, 10.0, 0.0])
+    assert np.isnan(result[4])
+
+
+def _analysis(*items):
+    return {
+        "food_items": [
+            {
+                "name": name,
+                "portion_size": "1份",
+                "calories": calories,
+                "macronutrients": {"carbs": carbs, "protein": protein, "fat": fat},
+            }
+            for name, calories, carbs, protein, fat in items
+        ]
+    }
+
+
+def test_totals_by_meal_day_and_week():
+    analyses = [
+        _analysis(("飯", "280 kcal", "62g", "5g", "0g"), ("雞", "200 kcal", "0g", "30g", "8g")),
+        _analysis(("麵", "450 kcal", "70g", "15g", "12g")),
+        _analysis(("蛋", "70 kcal", "0g", "6g", "5g")),
+    ]
+    # 2024-05-05 is a Sunday, 2024-05-06 the following Monday.
+    table = table_from_analyses(analyses, days=["2024-05-05", "2024-05-05", "2024-05-06"])
+
+    meals, meal_sums = totals_by_meal(table)
+    np.testing.assert_array_equal(meals, [0, 1, 2])
+    np.testing.assert_allclose(meal_sums[:, 0], [480, 450, 70])
+
+    days, day_sums = totals_by_day(table)
+    assert [str(d) for d in days] == ["2024-05-05", "2024-05-06"]
+    np.testing.assert_allclose(day_sums, [[930, 132, 50, 20], [70, 0, 6, 5]])
+
+    weeks, week_sums = totals_by_week(table)
+    assert [str(w) for w in weeks] == ["2024-04-29", "2024-05-06"]
+    np.testing.assert_allclose(week_sums[:, 0], [930, 70])
+
+
+def test_week_start_is_monday():
+    days = np.array(["2024-05-06", "2024-05-08", "2024-05-12"], dtype="datetime64[D]")
+    assert [str(d) for d in week_start(days)] == ["2024-05-06"] * 3
+
+
+def test_macro_ratios_and_empty_groups():
+    ratios = macro_ratios(np.array([[0, 50, 25, 0], [0, 0, 0, 0]]))
+    np.testing.assert_allclose(ratios, [[200 / 300, 100 / 300, 0], [0, 0, 0]])
+
+    keys, sums = group_sum(np.array([], dtype=np.int64), np.zeros((0, 4)))
+    assert len(keys) == 0 and sums.shape == (0, 4)
@@ -1,6 +1,8 @@
 import importlib
 import sqlite3
 
+import pytest
+
 import linebot_app.storage as storage_module
 
 
@@ -16,6 +18,7 @@ def test_save_analysis_log_writes_row(tmp_path, monkeypatch):
         message_id="msg123",
         analysis={"food_items": [{"name": "test"}]},
     )
+    storage.flush()
 
     assert db_path.exists()
 
@@ -29,3 +32,88 @@ def test_save_analysis_log_writes_row(tmp_path, monkeypatch):
     assert user_id == "user123"
     assert message_id == "msg123"
     assert "food_items" in analysis_json
+
+
+def test_storage_engine_batches_and_flushes_on_close(tmp_path):
+    db_path = tmp_path / "engine.db"
+    engine = storage_module.StorageEngine(db_path, batch_size=10, flush_interval=5).start()
+
+    for i in range(25):
+        engine.save_analysis(user_id="u", message_id=f"m{i}", analysis={"food_items": []})
+    engine.close()
+
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM meal_analysis").fetchone()[0]
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert count == 25
+    assert journal_mode == "wal"
+
+
+def test_storage_engine_applies_backpressure(tmp_path):
+    engine = storage_module.StorageEngine(tmp_path / "full.db", max_queue=1, enqueue_timeout=0.01)
+    # Writer not started, so the queue never drains.
+    engine.save_analysis(user_id="u", message_id="m1", analysis=None)
+
+    with pytest.raises(storage_module.StorageFullError):
+        engine.save_analysis(user_id="u", message_id="m2", analysis=None)
+
+
+def test_storage_engine_writes_items_and_daily_totals(tmp_path):
+    db_path = tmp_path / "items.db"
+    engine = storage_module.StorageEngine(db_path, batch_size=10, flush_interval=0.01).start()
+    meal = {
+        "food_items": [
+            {
+                "name": "雞腿便當",
+                "portion_size": "1盒",
+                "calories": "750 kcal",
+                "macronutrients": {"carbs": "90g", "protein": "35g", "fat": "25.5g"},
+            },
+            {
+                "name": "無糖綠茶",
+                "portion_size": "500ml",
+                "calories": "0 kcal",
+                "macronutrients": {"carbs": "0g", "protein": "0g", "fat": "0g"},
+            },
+        ]
+    }
+    engine.save_analysis(user_id="u1", message_id="m1", analysis=meal)
+    engine.save_analysis(user_id="u1", message_id="m2", analysis=meal)
+    engine.save_analysis(user_id="u1", message_id="m3", analysis={})
+    engine.close()
+
+    with sqlite3.connect(db_path) as conn:
+        items = conn.execute("SELECT name, calories, fat FROM meal_item ORDER BY id").fetchall()
+        totals = conn.execute(
+            "SELECT user_id, calories, carbs, protein, fat, meal_count FROM daily_totals"
+        ).fetchall()
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM meal_item WHERE user_id = ? AND created_at >= ?",
+            ("u1", "2024-01-01"),
+        ).fetchall()
+
+    assert items[:2] == [("雞腿便當", 750.0, 25.5), ("無糖綠茶", 0.0, 0.0)]
+    assert len(items) == 4
+    assert totals == [("u1", 1500.0, 180.0, 70.0, 51.0, 2)]
+    assert "idx_meal_item_user_created" in str(plan)
+
+
+def test_meal_items_use_the_bulk_parser():
+    analysis = {
+        "food_items": [
+            {"name": "白飯", "portion_size": "1碗", "calories": "200-250 大卡", "macronutrients": {"carbs": "60g", "fat": 0}},
+            "not an item",
+            {"name": "湯", "calories": "unknown", "macronutrients": {"carbs": "5g", "protein": "2g", "fat": "1g"}},
+        ]
+    }
+
+    assert storage_module.meal_items_from_analysis(analysis) == [
+        ("白飯", "1碗", 225.0, 60.0, None, 0.0),
+        ("湯", "", None, 5.0, 2.0, 1.0),
+    ]
+    assert storage_module.meal_items_from_analysis({"food_items": []}) == []
+
+
+def test_local_day_uses_configured_timezone():
+    # 2024-05-01 17:30 UTC is already 2024-05-02 in Taipei.
+    assert storage_module.local_day("2024-05-01 17:30:00") == "2024-05-02"
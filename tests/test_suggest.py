@@ -0,0 +1,106 @@
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from source.image_analysis import NutritionAnalysis  # noqa: E402
+from source.suggest import SYSTEM_PROMPT, MealSuggester, MealSuggestion  # noqa: E402
+from source.suggestion_cache import SuggestionCache, suggestion_fingerprint  # noqa: E402
+
+SUGGESTION = MealSuggestion(
+    evaluation="蛋白質偏低",
+    issues=["蛋白質不足"],
+    next_meal="lunch",
+    suggested_menu=[{"name": "雞胸肉沙拉", "portion_size": "1盤", "calories": "450 kcal"}],
+)
+
+
+def _analysis(calories: str, carbs: str) -> NutritionAnalysis:
+    return NutritionAnalysis.model_validate(
+        {
+            "food_items": [
+                {
+                    "name": "白飯",
+                    "portion_size": "1碗",
+                    "calories": calories,
+                    "macronutrients": {"carbs": carbs, "protein": "5g", "fat": "1g"},
+                }
+            ]
+        }
+    )
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def parse(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=SUGGESTION))])
+
+
+def _suggester(cache):
+    suggester = MealSuggester(api_key="test-key", cache=cache)
+    completions = FakeCompletions()
+    suggester.gateway = completions
+    return suggester, completions
+
+
+def test_fingerprint_quantizes_nearby_inputs():
+    base = suggestion_fingerprint("m", "維持", 22.1, 1800, "breakfast", {"calories": 510, "carbs": 61, "protein": 5})
+    near = suggestion_fingerprint("m", " 維持", 22.3, 1790, "Breakfast", {"calories": 495, "carbs": 59, "protein": 6})
+    far = suggestion_fingerprint("m", "維持", 22.1, 1800, "breakfast", {"calories": 700, "carbs": 61, "protein": 5})
+    assert base == near
+    assert base != far
+
+
+def test_generate_suggestion_is_memoized_across_restarts(tmp_path):
+    db_path = tmp_path / "suggest.db"
+    suggester, completions = _suggester(SuggestionCache(db_path=db_path))
+
+    first = suggester.generate_suggestion(_analysis("280 kcal", "62g"), "breakfast", 170, 60, "維持", creative=True)
+    second = suggester.generate_suggestion(_analysis("290 kcal", "61g"), "breakfast", 170.5, 60, "維持", creative=True)
+    assert first == second == SUGGESTION
+    assert len(completions.calls) == 1
+
+    restarted, restarted_calls = _suggester(SuggestionCache(db_path=db_path))
+    assert restarted.generate_suggestion(_analysis("280 kcal", "62g"), "breakfast", 170, 60, "維持", creative=True) == SUGGESTION
+    assert restarted_calls.calls == []
+
+    suggester.generate_suggestion(_analysis("280 kcal", "62g"), "lunch", 170, 60, "維持", creative=True)
+    assert len(completions.calls) == 2
+
+
+def test_system_prefix_is_static():
+    suggester, completions = _suggester(None)
+    suggester.generate_suggestion(_analysis("280 kcal", "62g"), "breakfast", 170, 60, "維持", creative=True)
+    suggester.generate_suggestion(_analysis("600 kcal", "90g"), "lunch", 180, 80, "增肌", creative=True)
+
+    first, second = (call["messages"] for call in completions.calls)
+    assert first[0] == second[0] == {"role": "system", "content": SYSTEM_PROMPT}
+    assert "schema" in SYSTEM_PROMPT and "schema" not in first[1]["content"]
+
+
+def test_rules_answer_without_the_model_unless_unsure():
+    suggester, completions = _suggester(None)
+
+    local = suggester.generate_suggestion(_analysis("280 kcal", "62g"), "breakfast", 170, 60, "維持")
+    assert local.next_meal == "lunch" and local.suggested_menu
+    assert completions.calls == []
+
+    # Stated calories far from the 4/4/9 macro energy: rules defer to the model.
+    assert suggester.generate_suggestion(_analysis("900 kcal", "62g"), "breakfast", 170, 60, "維持") == SUGGESTION
+    assert len(completions.calls) == 1
+
+
+def test_open_circuit_serves_rule_based_suggestion():
+    from source.llm_gateway import CircuitOpenError
+
+    suggester, _ = _suggester(None)
+
+    def unavailable(**kwargs):
+        raise CircuitOpenError("open")
+
+    suggester.gateway = SimpleNamespace(parse=unavailable)
+    degraded = suggester.generate_suggestion(_analysis("280 kcal", "62g"), "breakfast", 170, 60, "維持", creative=True)
+    assert degraded.next_meal == "lunch" and degraded.suggested_menu
@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "test-token")
+os.environ.setdefault("LINE_CHANNEL_SECRET", "test-secret")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from linebot.models import MessageEvent  # noqa: E402
+
+import linebot_app.report as report  # noqa: E402
+import linebot_app.storage as storage  # noqa: E402
+import source.chart_render as chart_render  # noqa: E402
+from benchmarks.loadgen import sign, webhook_body  # noqa: E402
+from linebot_app import handler, webhook  # noqa: E402
+from linebot_app.jobs import QueueFullError  # noqa: E402
+
+MEAL = {"food_items": [{"name": "水餃", "calories": "450 kcal", "macronutrients": {"carbs": "50g", "protein": "20g", "fat": "18g"}}]}
+
+
+def _text_event(user_id: str, text: str) -> dict:
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex,
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"type": "text", "id": uuid.uuid4().hex[:12], "text": text},
+    }
+
+
+class _QueueWithRoomFor:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.jobs = []
+        self.load = 0.0
+
+    def submit(self, job) -> None:
+        if len(self.jobs) >= self.capacity:
+            raise QueueFullError("job queue is full")
+        self.jobs.append(job)
+
+
+def _post(events):
+    body = webhook_body(events)
+    headers = {"Content-Type": "application/json", "X-Line-Signature": sign(os.environ["LINE_CHANNEL_SECRET"], body)}
+    return TestClient(webhook.app).post("/callback", content=body, headers=headers)
+
+
+@pytest.mark.parametrize("capacity, status, queued, rejected", [(0, 503, 0, 0), (1, 200, 1, 1)])
+def test_full_queue_only_fails_bodies_with_nothing_queued(monkeypatch, capacity, status, queued, rejected):
+    queue = _QueueWithRoomFor(capacity)
+    notices = []
+    monkeypatch.setattr(webhook, "job_queue", queue)
+    monkeypatch.setattr(webhook, "send_rejection", lambda event, decision, api: notices.append(event.message.id))
+    monkeypatch.setattr(webhook.admission, "admit", lambda *args, **kwargs: webhook.Decision(True))
+
+    response = _post([_text_event("u1", "help"), _text_event("u2", "help")])
+
+    # A 503 makes LINE redeliver the body, so it is only safe when nothing ran.
+    assert response.status_code == status
+    assert len(queue.jobs) == queued
+    assert len(notices) == rejected
+
+
+def test_report_chart_urls_survive_a_cleared_render_cache(tmp_path, monkeypatch):
+    db_path = tmp_path / "report.db"
+    monkeypatch.setattr(storage, "DB_PATH", db_path)
+    engine = storage.StorageEngine(db_path, flush_interval=0.01).start()
+    engine.save_analysis(user_id="u1", message_id="m1", analysis=MEAL)
+    engine.close()
+    monkeypatch.setattr(report, "CHART_DIR", tmp_path / "charts")
+    monkeypatch.setattr(report, "PUBLIC_BASE_URL", "https://bot.example")
+    monkeypatch.setattr(chart_render, "_renderer", chart_render.ChartRenderer())
+
+    messages = handler.handle_report_request(MessageEvent.new_from_json_dict(_text_event("u1", "/report")))
+    urls = [message.original_content_url for message in messages[1:]]
+    assert urls
+
+    # Another worker, or this one after eviction, has nothing in memory.
+    monkeypatch.setattr(chart_render, "_renderer", chart_render.ChartRenderer())
+    client = TestClient(webhook.app)
+    for url in urls:
+        response = client.get(url.removeprefix("https://bot.example"))
+        assert response.status_code == 200
+        assert response.content
+
+
+def test_metrics_do_not_start_the_storage_engine(monkeypatch):
+    monkeypatch.setattr(storage, "_engine", None)
+
+    response = TestClient(webhook.app).get("/metrics")
+
+    assert response.status_code == 200
+    assert "snapbite_storage_pending_writes 0" in response.text
+    assert storage._engine is None
@@ -0,0 +1,117 @@
+import multiprocessing
+import sqlite3
+import threading
+
+import pytest
+
+import linebot_app.storage as storage
+from linebot_app.writer import RemoteStorageEngine, WriterServer, run_writer
+
+MEAL = {
+    "food_items": [
+        {
+            "name": "牛肉麵",
+            "portion_size": "1碗",
+            "calories": "600 kcal",
+            "macronutrients": {"carbs": "70g", "protein": "30g", "fat": "20g"},
+        }
+    ]
+}
+AUTHKEY = b"test-authkey"
+
+
+def _meal_count(db_path) -> int:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM meal_analysis").fetchone()[0]
+
+
+@pytest.fixture
+def writer(tmp_path):
+    engine = storage.StorageEngine(tmp_path / "w.db", flush_interval=0.01).start()
+    server = WriterServer(engine, str(tmp_path / "w.sock"), AUTHKEY).start()
+    yield server
+    server.close()
+
+
+def test_remote_saves_are_visible_before_commit_and_deduplicated(tmp_path):
+    engine = storage.StorageEngine(tmp_path / "slow.db", flush_interval=30).start()
+    server = WriterServer(engine, str(tmp_path / "slow.sock"), AUTHKEY).start()
+    remote = RemoteStorageEngine(server.address, AUTHKEY)
+    remote.save_analysis("u1", "m1", MEAL)
+    remote.save_analysis("u1", "m1", MEAL)
+
+    record = remote.pending_record("m1")
+    assert record.user_id == "u1" and "牛肉麵" in record.analysis_json
+    assert remote.pending_record("m2") is None
+
+    server.close()  # commits the queue without waiting out the flush interval
+    assert _meal_count(engine.db_path) == 1
+
+
+def test_threads_share_the_writer(writer):
+    remote = RemoteStorageEngine(writer.address, AUTHKEY)
+    threads = [
+        threading.Thread(target=remote.save_analysis, args=("u", f"m{i}", MEAL)) for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    remote.close()  # flushes before disconnecting
+    assert _meal_count(writer.engine.db_path) == 8
+
+
+def test_writer_errors_are_raised_in_the_worker(writer):
+    remote = RemoteStorageEngine(writer.address, AUTHKEY)
+    with pytest.raises(ValueError):
+        remote._call("nope")
+    writer.engine.close()
+    with pytest.raises(RuntimeError):
+        remote.save_analysis("u", "m1", MEAL)
+
+
+def test_writer_process_drains_queue_on_sigterm(tmp_path):
+    db_path = tmp_path / "proc.db"
+    address = str(tmp_path / "proc.sock")
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    process = context.Process(target=run_writer, args=(address, AUTHKEY, str(db_path), ready))
+    process.start()
+    try:
+        assert ready.wait(30)
+        remote = RemoteStorageEngine(address, AUTHKEY)
+        for i in range(5):
+            remote.save_analysis("u", f"m{i}", MEAL)
+        process.terminate()
+        process.join(30)
+    finally:
+        if process.is_alive():
+            process.kill()
+    assert process.exitcode == 0
+    assert _meal_count(db_path) == 5
+
+
+def test_get_engine_uses_the_shared_writer_when_configured(writer, monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_WRITER_ADDRESS", writer.address)
+    monkeypatch.setenv("SNAPBITE_STORAGE_WRITER_AUTHKEY", AUTHKEY.hex())
+    monkeypatch.setattr(storage, "_engine", None)
+    engine = storage.get_engine()
+    assert isinstance(engine, RemoteStorageEngine)
+    storage.save_analysis_log("u1", "m7", MEAL)
+    assert storage.fetch_analysis_by_message("m7") == MEAL
+    storage.close()
+
+
+def test_claims_go_through_the_writer(writer):
+    remote = RemoteStorageEngine(writer.address, AUTHKEY)
+    assert remote.claim_message("m1", 300)
+    assert not remote.claim_message("m1", 300)
+    remote.release_messages(["m1"])
+    assert remote.claim_message("m1", 300)
+
+    remote.save_analysis("u1", "m1", MEAL)
+    remote.flush()
+    assert not remote.claim_message("m1", -1)  # the claim became the meal's receipt
+    remote.close()
+    with sqlite3.connect(writer.engine.db_path) as conn:
+        assert conn.execute("SELECT meal_id IS NOT NULL FROM processed_message WHERE message_id = 'm1'").fetchone() == (1,)